@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional
+from .config import get_settings
+from . import metrics
+from .http_pool import get_http_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+class BatchItemError(Exception):
+    """批量转录中单条音频失败（其余条目不受影响）"""
+
+class _Pending:
+    __slots__ = ("audio", "timeout", "future", "enqueued")
+
+    def __init__(self, audio: bytes, timeout: float, future: asyncio.Future):
+        self.audio = audio
+        self.timeout = timeout
+        self.future = future
+        self.enqueued = time.monotonic()
+
+class ASRBatcher:
+    """跨会话的转录微批处理
+
+    各会话提交的音频先进入队列，凑够 asr_batch_max_size 条或等待窗口到期后合并为一次批量请求，
+    结果按顺序分发给各自的等待方。等待窗口随负载自动调整：
+      - 按到达间隔的滑动平均估计下一条音频何时到达，预计窗口内凑不到下一条时立即发送（低负载不增加延迟）；
+      - 否则等待凑满一批所需的时间，最长 asr_batch_max_wait_ms；
+      - 进行中的批次达到 asr_batch_max_inflight 时暂停发送，新到的音频在队列中自然合并。
+    """
+
+    def __init__(self, client_factory, alpha: float = 0.2):
+        self._client_factory = client_factory
+        self._alpha = alpha
+        self._queue: List[_Pending] = []
+        self._wakeup = asyncio.Event()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight = set()
+        self._last_arrival: Optional[float] = None
+        self.interarrival: Optional[float] = None  # 到达间隔的滑动平均(秒)
+
+    async def submit(self, audio: bytes, timeout: float) -> dict:
+        """提交一条音频，返回该条的转录结果（与单条接口的响应格式相同）
+
+        超时抛出 asyncio.TimeoutError，上游失败时抛出原异常。
+        """
+        if self._task is None or self._task.done():
+            self._slots = asyncio.Semaphore(max(config.asr_batch_max_inflight, 1))
+            self._task = asyncio.create_task(self._run())
+        now = time.monotonic()
+        if self._last_arrival is not None:
+            gap = now - self._last_arrival
+            self.interarrival = gap if self.interarrival is None else self._alpha * gap + (1 - self._alpha) * self.interarrival
+        self._last_arrival = now
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append(_Pending(audio, timeout, future))
+        self._wakeup.set()
+        try:
+            # 等待方超时或被取消不影响同批其它条目
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def window(self) -> float:
+        """当前的等待窗口(秒)"""
+        max_wait = config.asr_batch_max_wait_ms / 1000
+        missing = config.asr_batch_max_size - len(self._queue)
+        if missing <= 0 or self.interarrival is None or self.interarrival >= max_wait:
+            return 0.0
+        return min(max_wait, self.interarrival * missing)
+
+    async def _run(self):
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            # 第一条音频到达后开始计时，窗口内凑满一批则提前发送
+            started = self._queue[0].enqueued
+            while len(self._queue) < config.asr_batch_max_size:
+                left = started + self.window() - time.monotonic()
+                if left <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), left)
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            batch = [p for p in self._queue[:config.asr_batch_max_size] if not p.future.done()]
+            del self._queue[:config.asr_batch_max_size]
+            if not batch:
+                self._slots.release()
+                continue
+            metrics.observe("asr_batch_size", len(batch), buckets=(1, 2, 4, 8, 16, 32))
+            metrics.set_gauge("asr_batch_window_ms", round(self.window() * 1000, 2))
+            task = asyncio.create_task(self._send(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send(self, batch: List[_Pending]):
+        try:
+            now = time.monotonic()
+            for p in batch:
+                metrics.observe("asr_batch_wait_ms", (now - p.enqueued) * 1000)
+            files = [("files", (f"{i}.wav", p.audio, "audio/wav")) for i, p in enumerate(batch)]
+            data = {"model": "SenseVoiceSmall"}
+            # 按批内最宽松的超时发送，各等待方在 submit 中按自己的超时放弃
+            timeout = max(p.timeout for p in batch)
+            try:
+                response = await self._client_factory().post(config.transcribe_batch_url, files=files, data=data, timeout=timeout)
+                response.raise_for_status()
+                results = response.json().get("results", [])
+                if len(results) != len(batch):
+                    raise ValueError(f"批量转录返回 {len(results)} 条结果，请求 {len(batch)} 条")
+            except asyncio.CancelledError:
+                for p in batch:
+                    p.future.cancel()
+                raise
+            except Exception as e:
+                metrics.inc("asr_batch_errors_total")
+                for p in batch:
+                    if not p.future.done():
+                        p.future.set_exception(e)
+                return
+            metrics.inc("asr_batches_total")
+            for p, result in zip(batch, results):
+                if p.future.done():
+                    continue
+                if result.get("error"):
+                    p.future.set_exception(BatchItemError(str(result["error"])))
+                else:
+                    p.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        tasks = [t for t in (self._task, *self._inflight) if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for p in self._queue:
+            if not p.future.done():
+                p.future.cancel()
+        self._queue.clear()
+        self._task = None
+
+def batching_enabled() -> bool:
+    return config.asr_batch_enabled and bool(config.transcribe_batch_url)
+
+_batcher: Optional[ASRBatcher] = None
+
+def get_batcher() -> ASRBatcher:
+    """获取进程内共享的批处理器（请求使用共享连接池）"""
+    global _batcher
+    if _batcher is None:
+        _batcher = ASRBatcher(get_http_client)
+    return _batcher
+
+async def close_batcher():
+    global _batcher
+    if _batcher is not None:
+        await _batcher.close()
+        _batcher = None
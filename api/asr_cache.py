@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+def normalize_pcm(audio: bytes) -> Tuple[bytes, memoryview]:
+    """提取WAV的格式信息和PCM数据，使仅文件头不同（如LIST元数据）的同一录音得到相同的key
+
+    返回 (格式描述, PCM数据视图)；非WAV数据原样返回。
+    """
+    view = memoryview(audio)
+    if len(audio) < 12 or audio[:4] != b"RIFF" or audio[8:12] != b"WAVE":
+        return b"", view
+    fmt = b""
+    pos = 12
+    while pos + 8 <= len(audio):
+        chunk_id = audio[pos:pos + 4]
+        (size,) = struct.unpack_from("<I", audio, pos + 4)
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            # 只取 声道数/采样率/采样位宽，忽略扩展字段
+            fmt = bytes(view[body + 2:body + 8]) + bytes(view[body + 14:body + 16])
+        elif chunk_id == b"data":
+            # 流式写出的WAV可能在data长度中填0或0xFFFFFFFF，以实际长度为准
+            end = len(audio) if size in (0, 0xFFFFFFFF) else min(body + size, len(audio))
+            return fmt, view[body:end]
+        pos = body + size + (size & 1)
+    return b"", view
+
+def cache_key(audio: bytes, model: str, language: Optional[str] = None) -> str:
+    """按 归一化PCM + 模型 + 语言 计算缓存key"""
+    fmt, pcm = normalize_pcm(audio)
+    digest = hashlib.blake2b(fmt, digest_size=16)
+    digest.update(pcm)
+    return f"{model}:{language or ''}:{digest.hexdigest()}"
+
+class _PersistentTier:
+    """基于sqlite的持久化缓存层（在线程池中访问，不阻塞事件循环）"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS asr_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM asr_cache WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, result: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO asr_cache (key, result, created) VALUES (?, ?, ?)",
+                (key, json.dumps(result, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+def cacheable(result: Optional[dict]) -> bool:
+    """只缓存有文本的结果：静音或识别失败得到的空文本不应被永久重放"""
+    return isinstance(result, dict) and bool(str(result.get("text") or "").strip())
+
+class TranscriptionCache:
+    """ASR结果缓存：内存LRU + 可选的sqlite持久层
+
+    实时链路和REST接口共用同一份缓存，条目统一保存上游的完整响应（至少包含 text 字段）。
+    """
+
+    def __init__(self, max_entries: int, path: str = ""):
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._persistent: Optional[_PersistentTier] = None
+        if path:
+            try:
+                self._persistent = _PersistentTier(path)
+            except Exception as e:
+                logger.warning("ASR持久化缓存不可用，仅使用内存缓存: %s", e)
+
+    async def get(self, key: str) -> Optional[dict]:
+        """查询缓存，命中时返回结果副本"""
+        result = self._memory.get(key)
+        if result is not None:
+            self._memory.move_to_end(key)
+            metrics.inc("asr_cache_hits_total")
+            return dict(result)
+        if self._persistent is not None:
+            try:
+                result = await asyncio.to_thread(self._persistent.get, key)
+            except Exception as e:
+                logger.warning("读取ASR持久化缓存失败: %s", e)
+                result = None
+            if cacheable(result):
+                self._remember(key, result)
+                metrics.inc("asr_cache_hits_total")
+                metrics.inc("asr_cache_persistent_hits_total")
+                return dict(result)
+        metrics.inc("asr_cache_misses_total")
+        return None
+
+    async def put(self, key: str, result: dict):
+        if not cacheable(result):
+            return
+        self._remember(key, dict(result))
+        if self._persistent is not None:
+            try:
+                await asyncio.to_thread(self._persistent.put, key, result)
+            except Exception as e:
+                logger.warning("写入ASR持久化缓存失败: %s", e)
+
+    def _remember(self, key: str, result: dict):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+        metrics.set_gauge("asr_cache_entries", len(self._memory))
+
+# 全局ASR缓存（未开启时为None）
+asr_cache: Optional[TranscriptionCache] = (
+    TranscriptionCache(config.asr_cache_size, config.asr_cache_path) if config.asr_cache_enabled else None
+)
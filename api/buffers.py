@@ -0,0 +1,170 @@
+import logging
+import threading
+from typing import Dict, List, Union
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+# 最小slab尺寸，更小的请求按该尺寸分配
+MIN_SLAB_SIZE = 4 * 1024
+
+class BufferLimitError(Exception):
+    """超出音频或会话内存上限"""
+
+    def __init__(self, message: str, limit: int):
+        super().__init__(message)
+        self.limit = limit
+
+def max_utterance_bytes() -> int:
+    """单段语音的字节上限：max_audio_buffer_size 个录音分片（16bit单声道）加上WAV文件头余量"""
+    per_chunk = int(config.audio_chunk_duration * config.audio_sample_rate * 2)
+    return config.max_audio_buffer_size * per_chunk + 1024
+
+def message_size(message: Union[str, bytes]) -> int:
+    """下行帧在连接上占用的字节数：文本帧按UTF-8编码后的长度计算（中文一字三字节）"""
+    if isinstance(message, str) and not message.isascii():
+        return len(message.encode("utf-8"))
+    return len(message)
+
+class PooledBuffer:
+    """从池中取得的可复用缓冲区：slab 为底层 bytearray，length 为已写入的字节数"""
+    __slots__ = ("pool", "slab", "length")
+
+    def __init__(self, pool: "BufferPool", slab: bytearray):
+        self.pool = pool
+        self.slab = slab
+        self.length = 0
+
+    @property
+    def capacity(self) -> int:
+        return len(self.slab)
+
+    @property
+    def free(self) -> int:
+        return len(self.slab) - self.length
+
+    def write(self, data) -> int:
+        """写入尽可能多的数据，返回实际写入的字节数（不会扩容）"""
+        n = min(len(data), self.free)
+        self.slab[self.length:self.length + n] = data[:n]
+        self.length += n
+        return n
+
+    def view(self) -> memoryview:
+        return memoryview(self.slab)[:self.length]
+
+    def take(self) -> bytes:
+        """取出已写入的数据并清空（slab保留继续使用）
+
+        返回的是一份拷贝：下行帧发出后仍保留在会话重放缓冲区中等待客户端确认，
+        不能引用会被复用的slab，因此每帧复制一次，池只复用拼帧用的slab。
+        """
+        data = bytes(memoryview(self.slab)[:self.length])
+        self.length = 0
+        return data
+
+    def release(self):
+        if self.slab is not None:
+            self.pool.release(self.slab)
+            self.slab = None
+            self.length = 0
+
+    def __enter__(self) -> "PooledBuffer":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class BufferPool:
+    """按2的幂分级的 bytearray slab 池，减少音频中转时反复分配大块内存"""
+
+    def __init__(self, max_idle: int, max_slab_size: int):
+        self.max_idle = max_idle
+        self.max_slab_size = max_slab_size
+        self._free: Dict[int, List[bytearray]] = {}
+        self._lock = threading.Lock()
+        self._idle_bytes = 0
+        self._in_use_bytes = 0
+
+    @staticmethod
+    def _size_class(size: int) -> int:
+        return max(MIN_SLAB_SIZE, 1 << (max(size, 1) - 1).bit_length())
+
+    def acquire(self, size: int) -> PooledBuffer:
+        """取得至少 size 字节的缓冲区"""
+        if size > self.max_slab_size:
+            raise BufferLimitError(f"缓冲区请求 {size} 字节超过上限 {self.max_slab_size} 字节", self.max_slab_size)
+        cls = self._size_class(size)
+        with self._lock:
+            free = self._free.get(cls)
+            slab = free.pop() if free else None
+            if slab is not None:
+                self._idle_bytes -= cls
+            self._in_use_bytes += cls
+            self._update_metrics()
+        if slab is None:
+            metrics.inc("buffer_pool_misses_total")
+            slab = bytearray(cls)
+        else:
+            metrics.inc("buffer_pool_hits_total")
+        return PooledBuffer(self, slab)
+
+    def release(self, slab: bytearray):
+        cls = len(slab)
+        with self._lock:
+            self._in_use_bytes -= cls
+            free = self._free.setdefault(cls, [])
+            if len(free) < self.max_idle:
+                free.append(slab)
+                self._idle_bytes += cls
+            self._update_metrics()
+
+    def _update_metrics(self):
+        metrics.set_gauge("buffer_pool_idle_bytes", self._idle_bytes)
+        metrics.set_gauge("buffer_pool_in_use_bytes", self._in_use_bytes)
+
+# 所有会话占用的字节总数（用于监控）
+_session_total = 0
+
+class SessionBudget:
+    """单个会话的内存记账（待转录音频 + 重放缓冲区），超过上限时拒绝新的数据"""
+
+    def __init__(self, session_id: str, limit: int):
+        self.session_id = session_id
+        self.limit = limit
+        self.used = 0
+
+    def reserve(self, n: int, what: str = "数据"):
+        if self.used + n > self.limit:
+            metrics.inc("buffer_limit_rejections_total")
+            raise BufferLimitError(
+                f"会话内存超出上限: 已占用 {self.used} 字节，{what} {n} 字节，上限 {self.limit} 字节",
+                self.limit
+            )
+        self._add(n)
+
+    def charge(self, n: int):
+        """记入无法拒绝的数据（如已生成的下行帧），由调用方负责释放"""
+        self._add(n)
+
+    def release(self, n: int):
+        self._add(-min(n, self.used))
+
+    def over_limit(self) -> bool:
+        return self.used > self.limit
+
+    def close(self):
+        self._add(-self.used)
+
+    def _add(self, delta: int):
+        global _session_total
+        self.used += delta
+        _session_total += delta
+        metrics.set_gauge("session_buffer_bytes", _session_total)
+
+# 全局缓冲池（TTS音频中转等）
+pool = BufferPool(config.buffer_pool_max_idle, config.ws_max_size)
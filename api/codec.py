@@ -0,0 +1,101 @@
+import json
+import logging
+from typing import Any, List
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时退回标准库
+    orjson = None
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+def dumps(obj: Any) -> str:
+    """编码为紧凑JSON文本（用于下行WebSocket文本帧）；中文不转义，减少帧大小"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def loads(data: Any) -> Any:
+    """解析 str/bytes 形式的JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# 所有JSON解析错误的公共基类（orjson.JSONDecodeError 是其子类）
+JSONDecodeError = json.JSONDecodeError
+
+_CONTENT_KEY = b'"content"'
+
+def _fast_content(payload: bytes, pos: int):
+    """payload 中只有一个 "content" 键且值为不含转义的字符串时直接返回其值，否则返回None"""
+    start = pos + len(_CONTENT_KEY)
+    if payload.startswith(b':"', start):
+        start += 2
+    elif payload.startswith(b': "', start):
+        start += 3
+    else:
+        return None
+    end = payload.find(b'"', start)
+    if end < 0 or payload.find(_CONTENT_KEY, end) >= 0:
+        return None
+    raw = payload[start:end]
+    if b"\\" in raw:
+        return None
+    try:
+        return raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+class SSEDeltaParser:
+    """增量解析 OpenAI 兼容的 chat/completions SSE 字节流，只提取 choices[0].delta.content
+
+    直接处理 aiter_raw() 的原始字节：按 \\n 切行时不解码，不含 "content" 的数据块
+    （角色块、usage块等）直接跳过；只出现一次 "content":"..." 的常见数据块直接切出字符串，
+    其余情况（多个choice、转义等）再做完整JSON解析。
+    上游每个事件只有一行 data，不处理跨行拼接的事件。
+    """
+
+    __slots__ = ("done", "errors", "_buffer")
+
+    def __init__(self):
+        self.done = False
+        self.errors = 0
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """输入一段原始字节，返回其中完整行携带的增量文本（可能为空列表）"""
+        if self.done:
+            return []
+        data = self._buffer + chunk if self._buffer else chunk
+        end = data.rfind(b"\n")
+        if end < 0:
+            self._buffer = data
+            return []
+        self._buffer = data[end + 1:]
+        deltas = []
+        for line in data[:end].split(b"\n"):
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == b"[DONE]":
+                self.done = True
+                break
+            pos = payload.find(_CONTENT_KEY)
+            if pos < 0:
+                continue
+            content = _fast_content(payload, pos)
+            if content is not None:
+                if content:
+                    deltas.append(content)
+                continue
+            try:
+                choices = loads(payload).get("choices")
+                content = choices[0]["delta"].get("content") if choices else None
+            except (JSONDecodeError, KeyError, TypeError, AttributeError) as e:
+                self.errors += 1
+                logger.warning("解析LLM流式数据出错: %s", e)
+                continue
+            if content:
+                deltas.append(content)
+        return deltas
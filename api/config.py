@@ -31,7 +31,7 @@ class Settings(BaseSettings):
     
     # 音频过滤配置 - 新增
     min_audio_size: int = Field(default=200, env="MIN_AUDIO_SIZE")  # 最小音频数据大小（降低以接受更小的音频片段）
-    max_audio_buffer_size: int = Field(default=20, env="MAX_AUDIO_BUFFER_SIZE")  # 最大音频缓冲区大小
+    max_audio_buffer_size: int = Field(default=20, env="MAX_AUDIO_BUFFER_SIZE")  # 最大音频缓冲区大小（单段语音最多的录音分片数）
     
     # 超时配置 - 优化
     transcribe_timeout: float = Field(default=5.0, env="TRANSCRIBE_TIMEOUT")
@@ -40,16 +40,136 @@ class Settings(BaseSettings):
     
     # 并发控制配置 - 新增
     max_concurrent_tts: int = Field(default=3, env="MAX_CONCURRENT_TTS")
-    http_max_connections: int = Field(default=10, env="HTTP_MAX_CONNECTIONS")
+    http_max_connections: int = Field(default=100, env="HTTP_MAX_CONNECTIONS")  # 共享上游连接池的最大连接数
+    http_max_keepalive_connections: int = Field(default=50, env="HTTP_MAX_KEEPALIVE_CONNECTIONS")
+    singleflight_enabled: bool = Field(default=True, env="SINGLEFLIGHT_ENABLED")  # 合并并发的相同上游请求
+    
+    # 填充音配置 - 新增（掩盖LLM首句生成前的静音）
+    filler_enabled: bool = Field(default=True, env="FILLER_ENABLED")
+    filler_texts: str = Field(default="好的，我想一下。|嗯，让我看看。|稍等，我查一下。", env="FILLER_TEXTS")  # 以|分隔
+    filler_threshold: float = Field(default=1.0, env="FILLER_THRESHOLD")  # 预测首包延迟超过该值(秒)时播放填充音
+    filler_frame_ms: int = Field(default=100, env="FILLER_FRAME_MS")  # 填充音分帧时长，决定裁剪粒度
+    filler_fade_ms: int = Field(default=20, env="FILLER_FADE_MS")  # 裁剪时的淡出时长
     
     # WebSocket配置
-    ws_max_size: int = Field(default=10*1024*1024, env="WS_MAX_SIZE")
+    ws_max_size: int = Field(default=10*1024*1024, env="WS_MAX_SIZE")  # 单帧上限，同时作为每个会话的内存上限
     ws_timeout: int = Field(default=60, env="WS_TIMEOUT")
     
+    # 下行发送队列配置 - 新增
+    ws_send_high_watermark: int = Field(default=512*1024, env="WS_SEND_HIGH_WATERMARK")  # 待发送字节超过该值时暂停读取上游
+    ws_send_low_watermark: int = Field(default=128*1024, env="WS_SEND_LOW_WATERMARK")  # 待发送字节降到该值以下时恢复
+    ws_send_timeout: float = Field(default=5.0, env="WS_SEND_TIMEOUT")  # 单帧发送超时(秒)
+    ws_slow_client_timeout: float = Field(default=10.0, env="WS_SLOW_CLIENT_TIMEOUT")  # 持续高于高水位超过该时长(秒)视为慢客户端并断开
+    ws_frame_ms: int = Field(default=200, env="WS_FRAME_MS")  # TTS音频合并为固定时长的帧(ms)，0为不合并
+    text_input_max_chars: int = Field(default=2000, env="TEXT_INPUT_MAX_CHARS")  # 实时会话中单条文本输入的最大字数
+    buffer_pool_max_idle: int = Field(default=64, env="BUFFER_POOL_MAX_IDLE")  # 缓冲池每个尺寸保留的空闲slab数
+    
     # LLM优化配置 - 新增
     llm_max_tokens: int = Field(default=1000, env="LLM_MAX_TOKENS")  # 限制输出长度
     llm_temperature: float = Field(default=0.7, env="LLM_TEMPERATURE")
+
+    # 链路追踪配置 - 新增
+    trace_enabled: bool = Field(default=True, env="TRACE_ENABLED")
+    trace_file: str = Field(default="logs/traces.jsonl", env="TRACE_FILE")  # span日志文件(OTLP JSON，每行一批)
+    trace_max_bytes: int = Field(default=20*1024*1024, env="TRACE_MAX_BYTES")  # 单个文件最大字节数，超过后滚动
+    trace_backup_count: int = Field(default=5, env="TRACE_BACKUP_COUNT")  # 保留的历史文件数
+    trace_summary_frame: bool = Field(default=False, env="TRACE_SUMMARY_FRAME")  # 每轮结束后向客户端发送耗时摘要
+    
+    # 调试诊断配置 - 新增
+    debug_endpoints_enabled: bool = Field(default=False, env="DEBUG_ENDPOINTS_ENABLED")  # 是否开放 /debug 接口
+    debug_token: str = Field(default="", env="DEBUG_TOKEN")  # 访问 /debug 接口需携带的 X-Debug-Token（开启调试接口时必须配置，否则拒绝启动）
+    loop_lag_monitor: bool = Field(default=True, env="LOOP_LAG_MONITOR")  # 事件循环延迟监控
+    loop_lag_interval_ms: float = Field(default=100.0, env="LOOP_LAG_INTERVAL_MS")  # 探测间隔(ms)
+    loop_lag_threshold_ms: float = Field(default=100.0, env="LOOP_LAG_THRESHOLD_MS")  # 超过该延迟记录阻塞调用栈(ms)
+    loop_lag_top_n: int = Field(default=20, env="LOOP_LAG_TOP_N")  # 保留最慢的阻塞记录数
     
+    # 会话恢复配置 - 新增
+    session_ttl: float = Field(default=60.0, env="SESSION_TTL")  # 连接断开后会话保留时长(秒)
+    session_replay_frames: int = Field(default=256, env="SESSION_REPLAY_FRAMES")  # 每个会话保留的未确认下行帧数
+    session_history_turns: int = Field(default=0, env="SESSION_HISTORY_TURNS")  # 携带到LLM上下文的历史轮数(0为不携带)
+    session_sweep_interval: float = Field(default=30.0, env="SESSION_SWEEP_INTERVAL")  # 过期会话清理间隔(秒)
+    
+    # 转录缓存配置 - 新增
+    asr_cache_enabled: bool = Field(default=True, env="ASR_CACHE_ENABLED")
+    asr_cache_size: int = Field(default=1024, env="ASR_CACHE_SIZE")  # 内存LRU条目数
+    asr_cache_path: str = Field(default="", env="ASR_CACHE_PATH")  # sqlite持久化文件路径(为空则只用内存缓存)
+
+    # 批处理任务配置 - 新增
+    jobs_dir: str = Field(default="data/jobs", env="JOBS_DIR")  # 任务状态、输入和结果文件目录
+    job_save_interval: float = Field(default=1.0, env="JOB_SAVE_INTERVAL")  # 进度写盘的最小间隔(秒)
+    tts_job_concurrency: int = Field(default=4, env="TTS_JOB_CONCURRENCY")  # 每个TTS批处理任务的并发合成数
+    tts_job_max_items: int = Field(default=10000, env="TTS_JOB_MAX_ITEMS")  # 单个任务最多条目数
+    tts_job_retries: int = Field(default=3, env="TTS_JOB_RETRIES")  # 单条合成的最大尝试次数
+    llm_job_concurrency: int = Field(default=8, env="LLM_JOB_CONCURRENCY")  # 批量对话任务的默认并发请求数
+    llm_job_rpm: int = Field(default=60, env="LLM_JOB_RPM")  # 每分钟请求数上限(0为不限)
+    llm_job_tpm: int = Field(default=100000, env="LLM_JOB_TPM")  # 每分钟token数上限(0为不限)
+    llm_job_max_items: int = Field(default=50000, env="LLM_JOB_MAX_ITEMS")  # 单个任务最多条目数
+    llm_job_retries: int = Field(default=3, env="LLM_JOB_RETRIES")  # 单条请求的最大尝试次数
+
+    # Mock服务配置 - 新增（压测时替代真实上游）
+    mock_ttft: str = Field(default="lognormal:300:0.4", env="MOCK_TTFT")  # 首token延迟分布 <fixed|uniform|normal|lognormal>:<均值ms>[:<参数>]
+    mock_itl: str = Field(default="normal:30:10", env="MOCK_ITL")  # token间隔分布，格式同上
+    mock_error_rate: float = Field(default=0.0, env="MOCK_ERROR_RATE")  # 直接返回错误的比例
+    mock_error_status: int = Field(default=500, env="MOCK_ERROR_STATUS")  # 注入错误的HTTP状态码
+    mock_timeout_rate: float = Field(default=0.0, env="MOCK_TIMEOUT_RATE")  # 挂起不响应的比例
+    mock_timeout_s: float = Field(default=120.0, env="MOCK_TIMEOUT_S")  # 挂起时长(秒)
+    mock_abort_rate: float = Field(default=0.0, env="MOCK_ABORT_RATE")  # 流式输出中途断开的比例
+    mock_asr_base_ms: float = Field(default=50.0, env="MOCK_ASR_BASE_MS")  # 模拟转录的固定耗时(ms)
+    mock_asr_rtf: float = Field(default=0.05, env="MOCK_ASR_RTF")  # 模拟转录耗时 = 音频时长 × RTF
+    mock_asr_error_rate: float = Field(default=0.0, env="MOCK_ASR_ERROR_RATE")
+    mock_asr_batch_item_ms: float = Field(default=5.0, env="MOCK_ASR_BATCH_ITEM_MS")  # 批量转录中每条音频额外增加的耗时(ms)
+    mock_asr_concurrency: int = Field(default=0, env="MOCK_ASR_CONCURRENCY")  # 同时处理的转录请求数（模拟GPU占用），0为不限制
+    mock_tts_ttfb_ms: float = Field(default=150.0, env="MOCK_TTS_TTFB_MS")  # 模拟合成的首包延迟(ms)
+    mock_tts_rtf: float = Field(default=0.3, env="MOCK_TTS_RTF")  # 每块音频的生成耗时 = 音频时长 × RTF
+    mock_tts_chunk_ms: int = Field(default=100, env="MOCK_TTS_CHUNK_MS")  # 每块音频时长(ms)
+    mock_tts_char_ms: float = Field(default=180.0, env="MOCK_TTS_CHAR_MS")  # 每个字对应的音频时长(ms)
+    mock_tts_sample_rate: int = Field(default=24000, env="MOCK_TTS_SAMPLE_RATE")
+    mock_tts_error_rate: float = Field(default=0.0, env="MOCK_TTS_ERROR_RATE")
+
+    # 内容过滤配置 - 新增
+    content_filter_enabled: bool = Field(default=False, env="CONTENT_FILTER_ENABLED")  # 分段送入TTS前按关键词拦截
+    content_filter_file: str = Field(default="", env="CONTENT_FILTER_FILE")  # 关键词文件（每行一个），为空时使用内置关键词
+    content_filter_reload_interval: float = Field(default=5.0, env="CONTENT_FILTER_RELOAD_INTERVAL")  # 检查关键词文件是否修改的间隔(秒)
+
+    # 截止时间与自适应超时配置 - 新增
+    turn_deadline_s: float = Field(default=60.0, env="TURN_DEADLINE_S")  # 单轮实时对话（转录+LLM+TTS）的总时限(秒)
+    request_deadline_s: float = Field(default=120.0, env="REQUEST_DEADLINE_S")  # 单个HTTP请求的总时限(秒)
+    adaptive_timeout_enabled: bool = Field(default=True, env="ADAPTIVE_TIMEOUT_ENABLED")  # 按观测延迟收紧上游超时
+    adaptive_timeout_multiplier: float = Field(default=3.0, env="ADAPTIVE_TIMEOUT_MULTIPLIER")  # 自适应超时 = p99 × 倍数
+    adaptive_timeout_min_s: float = Field(default=1.0, env="ADAPTIVE_TIMEOUT_MIN_S")  # 自适应超时下限(秒)
+    adaptive_timeout_min_samples: int = Field(default=20, env="ADAPTIVE_TIMEOUT_MIN_SAMPLES")  # 样本数不足时使用静态超时
+
+    # 常见问题本地检索配置 - 新增
+    faq_enabled: bool = Field(default=False, env="FAQ_ENABLED")  # 转录命中FAQ时直接播报预置答案，不调用LLM
+    faq_file: str = Field(default="", env="FAQ_FILE")  # FAQ文件（JSON数组或JSONL，字段 question/answer/aliases）
+    faq_threshold: float = Field(default=0.7, env="FAQ_THRESHOLD")  # 置信度（问法被转录文本覆盖的程度，0-1）阈值
+    faq_min_query_coverage: float = Field(default=0.5, env="FAQ_MIN_QUERY_COVERAGE")  # 转录文本中须出现在问法里的比例（按idf加权）
+    faq_ngram: int = Field(default=2, env="FAQ_NGRAM")  # 字符n-gram最大长度
+    faq_synthesis_concurrency: int = Field(default=4, env="FAQ_SYNTHESIS_CONCURRENCY")  # 启动时预合成答案音频的并发数
+
+    # 转录微批处理配置 - 新增
+    asr_batch_enabled: bool = Field(default=False, env="ASR_BATCH_ENABLED")  # 合并多个会话的音频为一次批量转录请求
+    transcribe_batch_url: str = Field(default="", env="TRANSCRIBE_BATCH_URL")  # 批量转录接口（multipart，多个files字段），为空时不启用
+    asr_batch_max_size: int = Field(default=8, env="ASR_BATCH_MAX_SIZE")  # 每批最多条数
+    asr_batch_max_wait_ms: float = Field(default=20.0, env="ASR_BATCH_MAX_WAIT_MS")  # 等待窗口上限(ms)，实际窗口按到达间隔自动调整
+    asr_batch_max_inflight: int = Field(default=4, env="ASR_BATCH_MAX_INFLIGHT")  # 同时进行中的批量请求数
+
+    # 日志配置 - 新增
+    log_level: str = Field(default="INFO", env="LOG_LEVEL")
+    log_format: str = Field(default="json", env="LOG_FORMAT")  # json（每行一个JSON对象）或 text
+    log_file: str = Field(default="", env="LOG_FILE")  # 为空时只输出到标准错误
+    log_max_bytes: int = Field(default=50 * 1024 * 1024, env="LOG_MAX_BYTES")  # 单个日志文件上限，超过后轮转
+    log_backup_count: int = Field(default=5, env="LOG_BACKUP_COUNT")
+    log_queue_size: int = Field(default=10000, env="LOG_QUEUE_SIZE")  # 等待写出的日志条数上限，队列满时丢弃
+    log_rate_limit: float = Field(default=5.0, env="LOG_RATE_LIMIT")  # 每个调用位置每秒最多输出的条数（ERROR不限），0为不限流
+    log_rate_burst: int = Field(default=20, env="LOG_RATE_BURST")  # 每个调用位置允许的突发条数
+
+    # 启动与预热配置 - 新增
+    enabled_routers: str = Field(default="realtime,tts,tts_jobs,transcription,llm,llm_jobs,metrics", env="ENABLED_ROUTERS")  # 逗号分隔的路由名称，all为全部；默认不含 mock_llm,mock_audio,debug
+    warmup_enabled: bool = Field(default=True, env="WARMUP_ENABLED")  # 启动后预建上游连接并各发送一个极小的请求，完成前 /ready 返回503
+    warmup_connections: int = Field(default=2, env="WARMUP_CONNECTIONS")  # 每个上游预先建立的连接数
+    warmup_timeout_s: float = Field(default=30.0, env="WARMUP_TIMEOUT_S")  # 预热最长耗时，超时后直接报告就绪
+
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -0,0 +1,100 @@
+import logging
+import os
+import time
+from typing import List, Optional, Tuple
+from .config import get_settings
+from . import metrics
+from .keywords import DEFAULT_KEYWORDS, KeywordAutomaton, StreamMatcher, load_keywords
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+class _FilterState:
+    """当前生效的关键词自动机；关键词文件修改后按 mtime 自动重新加载"""
+
+    def __init__(self):
+        self.automaton: Optional[KeywordAutomaton] = None
+        self.mtime: Optional[float] = None
+        self.checked_at = 0.0
+
+    def current(self) -> KeywordAutomaton:
+        now = time.monotonic()
+        if self.automaton is not None and now - self.checked_at < config.content_filter_reload_interval:
+            return self.automaton
+        self.checked_at = now
+        path = config.content_filter_file
+        if not path:
+            if self.automaton is None:
+                self.automaton = KeywordAutomaton(DEFAULT_KEYWORDS)
+            return self.automaton
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            if self.automaton is None:
+                logger.warning("关键词文件不可用，使用内置关键词: %s", e)
+                self.automaton = KeywordAutomaton(DEFAULT_KEYWORDS)
+            return self.automaton
+        if mtime != self.mtime:
+            self.reload(path, mtime)
+        return self.automaton
+
+    def reload(self, path: str, mtime: Optional[float] = None):
+        """重新构建自动机；文件读取失败时保留旧的关键词"""
+        try:
+            automaton = KeywordAutomaton(load_keywords(path))
+        except Exception as e:
+            logger.error("加载关键词文件失败: %s", e)
+            if self.automaton is None:
+                self.automaton = KeywordAutomaton(DEFAULT_KEYWORDS)
+            return
+        self.automaton = automaton
+        self.mtime = mtime if mtime is not None else os.stat(path).st_mtime
+        metrics.set_gauge("content_filter_keywords", len(automaton))
+        logger.info("已加载内容过滤关键词 %s 个: %s", len(automaton), path)
+
+_state = _FilterState()
+
+def current_automaton() -> KeywordAutomaton:
+    return _state.current()
+
+class SegmentGate:
+    """在LLM增量流上匹配关键词，分段送入TTS前判断是否放行
+
+    每个增量只扫描新到达的字符（跨增量的关键词也能命中），命中记录为累计文本中的区间；
+    分段 [start, end) 与任一命中区间重叠即拦截。分段末尾的字符可能与之后到达的字符组成关键词，
+    因此要等 settled(end) 为真（或流已结束）再检查。一轮对话使用同一个自动机，
+    期间关键词文件的修改从下一轮开始生效。
+    """
+
+    __slots__ = ("_matcher", "_hits", "_holdback")
+
+    def __init__(self, automaton: KeywordAutomaton):
+        self._matcher = StreamMatcher(automaton)
+        self._hits: List[Tuple[int, int, str]] = []
+        self._holdback = max(automaton.max_len - 1, 0)
+
+    def feed(self, delta: str):
+        for end, keyword in self._matcher.feed(delta):
+            self._hits.append((end - len(keyword), end, keyword))
+
+    def settled(self, end: int) -> bool:
+        """结束于 end 的分段是否已可检查：其后已到达最长关键词减一个字符，跨越分段末尾的关键词都已匹配"""
+        return self._matcher.pos >= end + self._holdback
+
+    def check(self, start: int, end: int) -> Optional[str]:
+        """返回与分段重叠的关键词（放行时返回None）；分段按顺序检查，之前的命中随之丢弃"""
+        hits = self._hits
+        while hits and hits[0][1] <= start:
+            hits.pop(0)
+        for hit_start, _, keyword in hits:
+            if hit_start < end:
+                return keyword
+        return None
+
+def new_gate() -> Optional[SegmentGate]:
+    """为一轮LLM输出创建过滤器；未开启内容过滤时返回None"""
+    if not config.content_filter_enabled:
+        return None
+    return SegmentGate(current_automaton())
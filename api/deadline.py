@@ -0,0 +1,142 @@
+import asyncio
+import contextvars
+import logging
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+# 当前请求/对话轮次的截止时间（time.monotonic()），随 asyncio 任务的上下文传递给子任务
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+class DeadlineExceeded(Exception):
+    """剩余时间不足以完成上游调用"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"{stage}超出时限")
+        self.stage = stage
+
+@contextmanager
+def scope(seconds: float):
+    """设置截止时间；已有更早的截止时间时保留更早的那个"""
+    limit = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None and current < limit:
+        limit = current
+    token = _deadline.set(limit)
+    try:
+        yield limit
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    """剩余秒数（未设置截止时间时返回None）"""
+    limit = _deadline.get()
+    if limit is None:
+        return None
+    return limit - time.monotonic()
+
+def enforce() -> asyncio.Timeout:
+    """到达截止时间时中断 async with 块内的等待（抛出 TimeoutError）；未设置截止时间时不限制
+
+    timeout_for 只限制单次读取的等待时间，持续缓慢输出的流式响应需要用它限制整体耗时。
+    """
+    # 事件循环的时钟即 time.monotonic()，可以直接使用截止时间
+    return asyncio.timeout_at(_deadline.get())
+
+class LatencyTracker:
+    """记录某个上游最近的延迟，按分位数给出自适应超时"""
+
+    def __init__(self, name: str, window: int = 200):
+        self.name = name
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._sorted: Optional[list] = None
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self._sorted = None
+        metrics.observe(f"upstream_{self.name}_latency_ms", seconds * 1000)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.samples) < config.adaptive_timeout_min_samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        index = min(len(self._sorted) - 1, max(0, math.ceil(p / 100 * len(self._sorted)) - 1))
+        return self._sorted[index]
+
+    def timeout(self, ceiling: float) -> float:
+        """p99 × 倍数，限制在 [最小超时, 配置的静态超时] 之间；样本不足时使用静态超时"""
+        p99 = self.percentile(99) if config.adaptive_timeout_enabled else None
+        if p99 is None:
+            return ceiling
+        return min(ceiling, max(config.adaptive_timeout_min_s, p99 * config.adaptive_timeout_multiplier))
+
+_trackers: Dict[str, LatencyTracker] = {}
+
+def tracker(name: str) -> LatencyTracker:
+    t = _trackers.get(name)
+    if t is None:
+        t = _trackers[name] = LatencyTracker(name)
+    return t
+
+def observe(upstream: str, seconds: float):
+    """记录一次成功调用的延迟（流式调用记首字节时间）"""
+    tracker(upstream).observe(seconds)
+
+def timeout_for(upstream: str, ceiling: float) -> float:
+    """本次上游调用可用的超时：自适应超时与截止时间剩余量中较小的一个
+
+    Raises:
+        DeadlineExceeded: 已没有剩余时间
+    """
+    timeout = tracker(upstream).timeout(ceiling)
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            metrics.inc("deadline_exceeded_total")
+            raise DeadlineExceeded(upstream)
+        timeout = min(timeout, left)
+    metrics.set_gauge(f"upstream_{upstream}_timeout_ms", round(timeout * 1000, 1))
+    return timeout
+
+def can_retry(upstream: str, backoff: float = 0.0) -> bool:
+    """剩余时间是否足够再试一次（按该上游的中位延迟估计），不够时直接放弃重试"""
+    left = remaining()
+    if left is None:
+        return True
+    expected = tracker(upstream).percentile(50) or 0.0
+    if left > backoff + expected:
+        return True
+    metrics.inc("deadline_retries_skipped_total")
+    logger.info("剩余时间 %.2fs 不足以重试%s（预计 %.2fs）", left, upstream, expected)
+    return False
+
+class DeadlineMiddleware:
+    """为每个HTTP请求设置截止时间：客户端可通过 X-Request-Timeout 头（秒）缩短，不超过配置值"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope_, receive, send):
+        if scope_["type"] != "http":
+            await self.app(scope_, receive, send)
+            return
+        seconds = config.request_deadline_s
+        for name, value in scope_.get("headers", ()):
+            if name == b"x-request-timeout":
+                try:
+                    seconds = min(seconds, max(float(value), 0.0))
+                except ValueError:
+                    pass
+                break
+        with scope(seconds):
+            await self.app(scope_, receive, send)
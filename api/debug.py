@@ -0,0 +1,244 @@
+import asyncio
+import cProfile
+import heapq
+import io
+import logging
+import pstats
+import secrets
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/debug")
+config = get_settings()
+
+def require_debug_access(x_debug_token: Optional[str] = Header(default=None)):
+    """调试接口访问控制：未开启或未配置令牌时隐藏接口，否则校验 X-Debug-Token 请求头"""
+    if not config.debug_endpoints_enabled or not config.debug_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_debug_token is None or not secrets.compare_digest(x_debug_token, config.debug_token):
+        raise HTTPException(status_code=403, detail="调试令牌无效")
+
+def format_stack(frame, max_depth: int = 64) -> str:
+    """将调用栈格式化为collapsed格式（根在前，以;分隔）"""
+    parts = []
+    while frame is not None and len(parts) < max_depth:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+class LoopLagMonitor:
+    """事件循环延迟监控
+
+    协程按固定间隔休眠并测量实际唤醒延迟，写入 event_loop_lag_ms 直方图；
+    看门狗线程在事件循环长时间未唤醒时抓取事件循环线程的调用栈，
+    用于定位阻塞事件循环的回调（JSON解析、日志、WAV处理等）。
+    """
+
+    def __init__(self, interval: float, threshold_ms: float, top_n: int):
+        self.interval = interval
+        self.threshold_ms = threshold_ms
+        self.top_n = top_n
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.perf_counter()
+        self._stall_stack: Optional[str] = None
+        self._slowest: List[Tuple[float, float, str]] = []  # (lag_ms, 时间戳, 调用栈) 小顶堆
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info("事件循环延迟监控已启动 (间隔: %.0fms, 阈值: %.0fms)", self.interval * 1000, self.threshold_ms)
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            self._heartbeat = now
+            lag_ms = max(0.0, (now - t0 - self.interval) * 1000)
+            metrics.observe("event_loop_lag_ms", lag_ms)
+            if lag_ms >= self.threshold_ms:
+                stack = self._stall_stack or "<未捕获调用栈>"
+                self._stall_stack = None
+                self._record(lag_ms, stack)
+                # 只记录最内层的几帧，完整栈可通过 /debug/loop-lag 查看
+                logger.warning("事件循环阻塞 %.1fms: %s", lag_ms, ' <- '.join(reversed(stack.split(';')[-3:])))
+
+    def _watch(self):
+        """看门狗：事件循环超过阈值未唤醒时抓取其调用栈"""
+        check_interval = max(self.threshold_ms / 2000, 0.005)
+        while not self._stopped.wait(check_interval):
+            stalled_ms = (time.perf_counter() - self._heartbeat) * 1000 - self.interval * 1000
+            if stalled_ms < self.threshold_ms or self._stall_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._stall_stack = format_stack(frame)
+
+    def _record(self, lag_ms: float, stack: str):
+        item = (lag_ms, time.time(), stack)
+        if len(self._slowest) < self.top_n:
+            heapq.heappush(self._slowest, item)
+        else:
+            heapq.heappushpop(self._slowest, item)
+
+    def report(self) -> dict:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold_ms,
+            "histogram": metrics.snapshot()["histograms"].get("event_loop_lag_ms"),
+            "slowest": [
+                {"lag_ms": round(lag, 2), "timestamp": ts, "stack": stack.split(";")}
+                for lag, ts, stack in sorted(self._slowest, reverse=True)
+            ]
+        }
+
+# 全局监控实例（在应用启动时创建）
+loop_monitor: Optional[LoopLagMonitor] = None
+
+def start_loop_monitor() -> LoopLagMonitor:
+    """启动事件循环延迟监控（需在事件循环中调用）"""
+    global loop_monitor
+    loop_monitor = LoopLagMonitor(
+        interval=config.loop_lag_interval_ms / 1000,
+        threshold_ms=config.loop_lag_threshold_ms,
+        top_n=config.loop_lag_top_n
+    )
+    loop_monitor.start()
+    return loop_monitor
+
+# 同一时间只允许一个CPU profile
+_profile_lock = asyncio.Lock()
+
+def _sample_thread(thread_id: int, seconds: float, interval: float) -> Counter:
+    """在后台线程中定时采样目标线程的调用栈"""
+    samples: Counter = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is not None:
+            samples[format_stack(frame)] += 1
+        time.sleep(interval)
+    return samples
+
+@router.get("/profile", dependencies=[Depends(require_debug_access)])
+async def cpu_profile(
+    seconds: float = Query(default=5.0, gt=0, le=60, description="采样时长(秒)"),
+    mode: str = Query(default="sample", description="sample: 采样collapsed栈; cprofile: pstats统计"),
+    interval_ms: float = Query(default=5.0, ge=1, le=100, description="采样间隔(毫秒)"),
+    top: int = Query(default=50, ge=1, le=500, description="pstats输出条数")
+):
+    """对事件循环线程做N秒CPU profile"""
+    if mode not in ("sample", "cprofile"):
+        raise HTTPException(status_code=400, detail=f"不支持的模式: {mode}")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="已有profile正在进行")
+
+    async with _profile_lock:
+        logger.info("开始CPU profile: 模式=%s, 时长=%ss", mode, seconds)
+        if mode == "sample":
+            samples = await asyncio.to_thread(_sample_thread, threading.get_ident(), seconds, interval_ms / 1000)
+            # 按次数倒序输出 collapsed stacks（空闲时停留在selector中）
+            body = "\n".join(f"{stack} {count}" for stack, count in samples.most_common())
+            return PlainTextResponse(body + "\n")
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        return PlainTextResponse(out.getvalue())
+
+# tracemalloc 上一次快照，用于计算增量
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+
+@router.post("/tracemalloc/start", dependencies=[Depends(require_debug_access)])
+async def tracemalloc_start(frames: int = Query(default=10, ge=1, le=100)):
+    """开启内存分配追踪并记录基线快照"""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    _last_snapshot = await asyncio.to_thread(tracemalloc.take_snapshot)
+    return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+@router.post("/tracemalloc/stop", dependencies=[Depends(require_debug_access)])
+async def tracemalloc_stop():
+    """停止内存分配追踪"""
+    global _last_snapshot
+    tracemalloc.stop()
+    _last_snapshot = None
+    return {"tracing": False}
+
+@router.get("/tracemalloc/diff", dependencies=[Depends(require_debug_access)])
+async def tracemalloc_diff(
+    top: int = Query(default=20, ge=1, le=200),
+    group_by: str = Query(default="lineno", description="lineno / filename / traceback")
+):
+    """与上一次快照对比，返回内存增长最多的分配位置"""
+    global _last_snapshot
+    if not tracemalloc.is_tracing():
+        raise HTTPException(status_code=400, detail="tracemalloc未开启，请先调用 /debug/tracemalloc/start")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail=f"不支持的分组方式: {group_by}")
+
+    def _diff():
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        stats = snapshot.compare_to(_last_snapshot, group_by) if _last_snapshot else snapshot.statistics(group_by)
+        return snapshot, stats
+
+    snapshot, stats = await asyncio.to_thread(_diff)
+    _last_snapshot = snapshot
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "traced_current_bytes": current,
+        "traced_peak_bytes": peak,
+        "top": [
+            {
+                "location": [str(frame) for frame in stat.traceback],
+                "size_bytes": stat.size,
+                "size_diff_bytes": getattr(stat, "size_diff", None),
+                "count": stat.count,
+                "count_diff": getattr(stat, "count_diff", None)
+            }
+            for stat in stats[:top]
+        ]
+    }
+
+@router.get("/loop-lag", dependencies=[Depends(require_debug_access)])
+async def loop_lag():
+    """事件循环延迟直方图及最慢的阻塞调用栈"""
+    if loop_monitor is None:
+        raise HTTPException(status_code=404, detail="事件循环延迟监控未开启")
+    return loop_monitor.report()
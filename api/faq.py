@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import httpx
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+# 归一化时去掉标点、空白等非文字字符（\w 包含中文）
+_STRIP_PATTERN = re.compile(r"[\W_]+")
+
+# BM25 参数：问题都是短文本，长度归一化取常用值
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def normalize(text: str) -> str:
+    return _STRIP_PATTERN.sub("", text.lower())
+
+def char_ngrams(text: str, n: int) -> List[str]:
+    """中文不分词，直接取1..n字的字符n-gram作为检索词"""
+    text = normalize(text)
+    grams = list(text)
+    for size in range(2, n + 1):
+        grams.extend(text[i:i + size] for i in range(len(text) - size + 1))
+    return grams
+
+class FAQEntry:
+    """一条常见问题：标准问法、相似问法、答案，以及预合成的答案音频（WAV）"""
+
+    def __init__(self, question: str, answer: str, aliases: Optional[List[str]] = None):
+        self.question = question
+        self.answer = answer
+        self.aliases = aliases or []
+        self.audio: Optional[bytes] = None
+
+class FAQMatch:
+    def __init__(self, entry: FAQEntry, confidence: float, query_coverage: float):
+        self.entry = entry
+        self.confidence = confidence
+        self.query_coverage = query_coverage
+
+class FAQIndex:
+    """字符n-gram倒排索引 + BM25打分
+
+    每个问法（标准问法和相似问法）作为一篇文档，命中时返回所属的FAQ条目。
+    BM25分数本身没有上界，置信度取 查询得分 / 该问法对自身的得分，即问法被查询覆盖的程度；
+    另外计算查询中（按idf加权）出现在该问法里的比例，避免长句里碰巧包含一个短问法时误命中。
+    """
+
+    def __init__(self, entries: List[FAQEntry], n: int = 2):
+        self.entries = entries
+        self.n = n
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._doc_entry: List[int] = []
+        self._doc_len: List[int] = []
+        self._doc_terms: List[FrozenSet[str]] = []
+        for entry_id, entry in enumerate(entries):
+            for text in [entry.question, *entry.aliases]:
+                terms = Counter(char_ngrams(text, n))
+                if not terms:
+                    continue
+                doc_id = len(self._doc_entry)
+                self._doc_entry.append(entry_id)
+                self._doc_len.append(sum(terms.values()))
+                self._doc_terms.append(frozenset(terms))
+                for term, tf in terms.items():
+                    self._postings[term].append((doc_id, tf))
+        docs = len(self._doc_entry)
+        self._avgdl = sum(self._doc_len) / docs if docs else 1.0
+        self._idf = {term: math.log(1 + (docs - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()}
+        # 未收录的检索词按只在0篇文档中出现计算，计入查询覆盖率的分母
+        self._unknown_idf = math.log(1 + (docs + 0.5) / 0.5)
+        self._self_score = [self._score_doc(doc_id, self._doc_terms[doc_id]) for doc_id in range(docs)]
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _weight(self, doc_id: int, tf: int) -> float:
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[doc_id] / self._avgdl)
+        return tf * (BM25_K1 + 1) / (tf + norm)
+
+    def _score_doc(self, doc_id: int, terms) -> float:
+        score = 0.0
+        for term in terms:
+            for d, tf in self._postings.get(term, ()):
+                if d == doc_id:
+                    score += self._idf[term] * self._weight(doc_id, tf)
+                    break
+        return score
+
+    def search(self, text: str) -> Optional[FAQMatch]:
+        """返回置信度最高的条目（没有任何共同检索词时返回None）"""
+        terms = set(char_ngrams(text, self.n))
+        if not terms or not self._doc_entry:
+            return None
+        scores: Dict[int, float] = defaultdict(float)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            idf = self._idf[term]
+            for doc_id, tf in postings:
+                scores[doc_id] += idf * self._weight(doc_id, tf)
+        if not scores:
+            return None
+        doc_id, score = max(scores.items(), key=lambda item: item[1] / self._self_score[item[0]])
+        confidence = min(score / self._self_score[doc_id], 1.0)
+        query_weight = sum(self._idf.get(term, self._unknown_idf) for term in terms)
+        matched = sum(self._idf[term] for term in terms & self._doc_terms[doc_id])
+        return FAQMatch(self.entries[self._doc_entry[doc_id]], confidence, matched / query_weight)
+
+def load_entries(path: str) -> List[FAQEntry]:
+    """读取FAQ文件：JSON数组或每行一个JSON对象（question/answer，可选 aliases 相似问法列表）"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    if content.lstrip().startswith("["):
+        items = json.loads(content)
+    else:
+        items = [json.loads(line) for line in content.splitlines() if line.strip()]
+    entries = []
+    for item in items:
+        question = (item.get("question") or "").strip()
+        answer = (item.get("answer") or "").strip()
+        if not question or not answer:
+            logger.warning("跳过不完整的FAQ条目: %s", item)
+            continue
+        entries.append(FAQEntry(question, answer, [a for a in item.get("aliases", []) if a]))
+    return entries
+
+# 启动时构建的索引（未开启或加载失败时为None）
+index: Optional[FAQIndex] = None
+# [查询次数, 命中次数]，用于计算命中率
+_stats = [0, 0]
+
+def lookup(text: str) -> Optional[FAQEntry]:
+    """查询转录文本是否命中FAQ，同时统计命中率"""
+    if index is None:
+        return None
+    metrics.inc("faq_lookups_total")
+    match = index.search(text)
+    hit = (match is not None and match.confidence >= config.faq_threshold
+           and match.query_coverage >= config.faq_min_query_coverage)
+    if match is not None:
+        metrics.observe("faq_confidence", match.confidence, buckets=(0.2, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0))
+        logger.debug("FAQ最佳匹配 '%s' 置信度 %.2f 查询覆盖率 %.2f", match.entry.question, match.confidence, match.query_coverage)
+    if hit:
+        metrics.inc("faq_hits_total")
+    _stats[0] += 1
+    _stats[1] += hit
+    metrics.set_gauge("faq_hit_rate", round(_stats[1] / _stats[0], 4))
+    return match.entry if hit else None
+
+async def _synthesize(client: httpx.AsyncClient, entry: FAQEntry, semaphore: asyncio.Semaphore):
+    # 与实时链路保持一致的模型和音色；保留完整WAV（含文件头），按TTS流的格式下发
+    payload = {"model": "CosyVoice2-0.5B", "input": entry.answer, "voice": "中文女声"}
+    async with semaphore:
+        try:
+            response = await client.post(config.tts_url, json=payload, timeout=config.tts_timeout)
+            response.raise_for_status()
+            entry.audio = response.content
+        except Exception as e:
+            logger.warning("FAQ答案音频合成失败 '%s': %s", entry.question, e)
+
+async def load_faq(client: httpx.AsyncClient):
+    """启动时构建FAQ索引，再通过TTS上游预合成所有答案音频
+
+    索引构建完成后立即生效；音频尚未合成（或合成失败）的条目命中时走实时TTS。
+    """
+    global index
+    if not config.faq_enabled or not config.faq_file:
+        return
+    try:
+        entries = load_entries(config.faq_file)
+    except Exception as e:
+        logger.error("加载FAQ文件失败: %s", e)
+        return
+    index = FAQIndex(entries, config.faq_ngram)
+    metrics.set_gauge("faq_entries", len(entries))
+    logger.info("FAQ索引构建完成: %s 条", len(entries))
+    semaphore = asyncio.Semaphore(max(config.faq_synthesis_concurrency, 1))
+    await asyncio.gather(*(_synthesize(client, entry, semaphore) for entry in entries))
+    ready = sum(1 for entry in entries if entry.audio)
+    metrics.set_gauge("faq_audio_ready", ready)
+    logger.info("FAQ答案音频合成完成: %s/%s 条", ready, len(entries))
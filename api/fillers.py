@@ -0,0 +1,177 @@
+import array
+import asyncio
+import io
+import logging
+import random
+import time
+import wave
+from typing import List, Optional
+import httpx
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+class FillerClip:
+    """预合成的填充音（PCM + 格式信息）"""
+
+    def __init__(self, text: str, pcm: bytes, sample_rate: int, channels: int, sample_width: int):
+        self.text = text
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+
+    @property
+    def bytes_per_ms(self) -> float:
+        return self.sample_rate * self.channels * self.sample_width / 1000
+
+    def frames(self, frame_ms: int) -> List[bytes]:
+        """按固定时长切分PCM（按采样对齐）"""
+        align = self.channels * self.sample_width
+        size = max(int(self.bytes_per_ms * frame_ms) // align * align, align)
+        return [self.pcm[i:i + size] for i in range(0, len(self.pcm), size)]
+
+    def to_wav(self, pcm: bytes) -> bytes:
+        """将一段PCM封装为独立可播放的WAV"""
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(self.sample_width)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(pcm)
+        return buf.getvalue()
+
+    def fade_out(self, pcm: bytes, fade_ms: int) -> bytes:
+        """截取开头 fade_ms 并线性淡出，作为裁剪时的收尾，避免爆音"""
+        if self.sample_width != 2:
+            return b""
+        align = self.channels * self.sample_width
+        tail = pcm[:int(self.bytes_per_ms * fade_ms) // align * align]
+        samples = array.array("h", tail)
+        n = len(samples) // self.channels
+        for i in range(n):
+            gain = 1.0 - (i + 1) / n
+            for c in range(self.channels):
+                idx = i * self.channels + c
+                samples[idx] = int(samples[idx] * gain)
+        return samples.tobytes()
+
+class TTFAPredictor:
+    """首包音频延迟（转录完成 -> 第一块真实TTS音频）的指数滑动平均"""
+
+    def __init__(self, initial: float, alpha: float = 0.2):
+        self.value = initial
+        self.alpha = alpha
+
+    def observe(self, seconds: float):
+        self.value = self.alpha * seconds + (1 - self.alpha) * self.value
+        metrics.observe("realtime_ttfa_ms", seconds * 1000)
+
+    def predict(self) -> float:
+        return self.value
+
+# 预合成的填充音库（启动时加载）
+clips: List[FillerClip] = []
+# 尚无观测值时按阈值估计，即默认播放填充音
+predictor = TTFAPredictor(initial=config.filler_threshold)
+
+def filler_texts() -> List[str]:
+    return [t.strip() for t in config.filler_texts.split("|") if t.strip()]
+
+async def _synthesize(client: httpx.AsyncClient, text: str) -> Optional[FillerClip]:
+    # 与实时链路保持一致的模型和音色
+    payload = {"model": "CosyVoice2-0.5B", "input": text, "voice": "中文女声"}
+    try:
+        response = await client.post(config.tts_url, json=payload, timeout=config.tts_timeout)
+        response.raise_for_status()
+        with wave.open(io.BytesIO(response.content), "rb") as wf:
+            return FillerClip(text, wf.readframes(wf.getnframes()), wf.getframerate(), wf.getnchannels(), wf.getsampwidth())
+    except Exception as e:
+        logger.warning("填充音合成失败 '%s': %s", text, e)
+        return None
+
+async def load_fillers(client: httpx.AsyncClient):
+    """启动时通过TTS上游合成所有填充音并保存在内存中"""
+    if not config.filler_enabled:
+        return
+    results = await asyncio.gather(*(_synthesize(client, text) for text in filler_texts()))
+    clips.extend(clip for clip in results if clip is not None)
+    logger.info("填充音加载完成: %s 条", len(clips))
+
+class FillerGate:
+    """一轮回答的首包音频闸门
+
+    预测的首包延迟超过阈值时立即播放填充音（按实时速率分帧发送）；
+    第一块真实TTS音频到达时停止发送剩余帧，补一小段淡出后发送 filler_end，
+    同时记录本轮实际首包延迟用于后续预测。
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self.started = time.monotonic()
+        self.opened = False
+        self._task: Optional[asyncio.Task] = None
+        self._clip: Optional[FillerClip] = None
+        self._next_frame: Optional[bytes] = None  # 下一帧（裁剪时取其开头做淡出）
+        self._lock = asyncio.Lock()
+
+    def maybe_play(self) -> bool:
+        if not config.filler_enabled or not clips or predictor.predict() < config.filler_threshold:
+            return False
+        self._clip = random.choice(clips)
+        self._task = asyncio.create_task(self._play(self._clip))
+        metrics.inc("filler_played_total")
+        return True
+
+    async def _play(self, clip: FillerClip):
+        frame_s = config.filler_frame_ms / 1000
+        frames = clip.frames(config.filler_frame_ms)
+        t0 = time.monotonic()
+        for i, frame in enumerate(frames):
+            self._next_frame = frame
+            # 保持约两帧的提前量，剩余部分按播放速率发送以便随时裁剪
+            delay = t0 + (i - 2) * frame_s - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if not await self.session.send_bytes(clip.to_wav(frame)):
+                return
+        self._next_frame = None
+
+    async def open(self):
+        """真实音频到达：记录首包延迟并裁剪填充音（同一轮只生效一次）"""
+        if self.opened:
+            return
+        async with self._lock:
+            if self.opened:
+                return
+            self.opened = True
+            predictor.observe(time.monotonic() - self.started)
+            await self._stop(trim=True)
+
+    async def close(self):
+        """本轮结束或被打断：停止填充音，不再发送收尾"""
+        async with self._lock:
+            self.opened = True
+            await self._stop(trim=False)
+
+    async def _stop(self, trim: bool):
+        task = self._task
+        if task is None:
+            return
+        self._task = None
+        trimmed = not task.done()
+        if trimmed:
+            task.cancel()
+            await asyncio.wait({task})
+        if not trim:
+            return
+        if trimmed and self._next_frame:
+            tail = self._clip.fade_out(self._next_frame, config.filler_fade_ms)
+            if tail:
+                await self.session.send_bytes(self._clip.to_wav(tail))
+            metrics.inc("filler_trimmed_total")
+        await self.session.send_json({"type": "filler_end", "trimmed": trimmed})
@@ -0,0 +1,31 @@
+import logging
+from typing import Optional
+import httpx
+from .config import get_settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取进程内共享的上游HTTP客户端（连接池在所有会话间复用）"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=5.0),
+            limits=httpx.Limits(
+                max_connections=config.http_max_connections,
+                max_keepalive_connections=config.http_max_keepalive_connections
+            )
+        )
+    return _client
+
+async def close_http_client():
+    """关闭共享客户端（应用退出时调用）"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
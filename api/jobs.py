@@ -0,0 +1,298 @@
+import asyncio
+import contextvars
+import io
+import json
+import logging
+import os
+import secrets
+import shutil
+import time
+import zipfile
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# 每个任务最多保留的失败明细条数
+MAX_ERRORS = 100
+
+class Job:
+    """后台批处理任务：状态保存在 <jobs_dir>/<job_id>/job.json，输入和输出文件放在同一目录"""
+
+    def __init__(self, job_id: str, kind: str, total: int, params: Optional[dict] = None):
+        self.job_id = job_id
+        self.kind = kind
+        self.status = QUEUED
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.params = params or {}
+        self.errors: List[dict] = []
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self._saved_at = 0.0
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(config.jobs_dir, self.job_id)
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.directory, *parts)
+
+    @property
+    def progress(self) -> float:
+        if self.total <= 0:
+            return 1.0 if self.status == COMPLETED else 0.0
+        return round((self.done + self.failed) / self.total, 4)
+
+    def record_error(self, index: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"index": index, "error": message})
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "progress": self.progress,
+            "params": self.params,
+            "errors": self.errors,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "finished_at": self.finished_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Job":
+        job = cls(data["job_id"], data["kind"], data.get("total", 0), data.get("params"))
+        job.status = data.get("status", QUEUED)
+        job.done = data.get("done", 0)
+        job.failed = data.get("failed", 0)
+        job.errors = data.get("errors", [])
+        job.error = data.get("error")
+        job.created_at = data.get("created_at", job.created_at)
+        job.updated_at = data.get("updated_at", job.updated_at)
+        job.finished_at = data.get("finished_at")
+        return job
+
+    def _write(self, data: dict):
+        # 先写临时文件再替换，进程中途退出也不会留下半个job.json
+        tmp = self.path("job.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.path("job.json"))
+
+    async def save(self, force: bool = True):
+        """持久化任务状态；force=False 时按 job_save_interval 节流（用于进度更新）"""
+        now = time.time()
+        if not force and now - self._saved_at < config.job_save_interval:
+            return
+        self.updated_at = now
+        self._saved_at = now
+        await asyncio.to_thread(self._write, self.to_dict())
+
+Runner = Callable[[Job], Awaitable[None]]
+
+class JobManager:
+    """批处理任务管理：提交、查询、取消，以及重启后恢复未完成的任务
+
+    各类任务通过 register(kind, runner) 注册执行函数；runner 需可重入，
+    即根据目录中已有的输出跳过已完成的条目，这样中断后重新执行即为续跑。
+    """
+
+    def __init__(self):
+        self._runners: Dict[str, Runner] = {}
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._loaded = False
+
+    def register(self, kind: str, runner: Runner):
+        self._runners[kind] = runner
+
+    async def create(self, kind: str, total: int, params: Optional[dict] = None) -> Job:
+        """创建任务目录（调用方随后写入输入文件，再调用 start）"""
+        job = Job(secrets.token_hex(8), kind, total, params)
+        await asyncio.to_thread(os.makedirs, job.directory, exist_ok=True)
+        await job.save()
+        self._jobs[job.job_id] = job
+        return job
+
+    def start(self, job: Job):
+        if job.job_id in self._tasks:
+            return
+        # 使用空的上下文运行：任务不继承提交请求的截止时间和trace
+        self._tasks[job.job_id] = asyncio.create_task(self._run(job), context=contextvars.Context())
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self, kind: Optional[str] = None) -> List[Job]:
+        jobs = [j for j in self._jobs.values() if kind is None or j.kind == kind]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    async def cancel(self, job: Job) -> bool:
+        task = self._tasks.get(job.job_id)
+        if job.status in FINISHED_STATES:
+            return False
+        job.status = CANCELLED
+        if task is not None:
+            task.cancel()
+            await asyncio.wait({task})
+        job.finished_at = time.time()
+        await job.save()
+        return True
+
+    async def delete(self, job: Job):
+        await self.cancel(job)
+        self._jobs.pop(job.job_id, None)
+        await asyncio.to_thread(shutil.rmtree, job.directory, True)
+
+    async def resume(self):
+        """启动时加载已有任务，未完成的任务继续执行"""
+        if self._loaded:
+            return
+        self._loaded = True
+        jobs = await asyncio.to_thread(self._load_all)
+        resumed = 0
+        for job in jobs:
+            self._jobs[job.job_id] = job
+            if job.status in (QUEUED, RUNNING) and job.kind in self._runners:
+                self.start(job)
+                resumed += 1
+        if jobs:
+            logger.info("已加载批处理任务 %s 个，恢复执行 %s 个", len(jobs), resumed)
+
+    async def shutdown(self):
+        """停止所有执行中的任务（状态保持为 running，下次启动时续跑）"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def _load_all(self) -> List[Job]:
+        jobs = []
+        if not os.path.isdir(config.jobs_dir):
+            return jobs
+        for name in os.listdir(config.jobs_dir):
+            path = os.path.join(config.jobs_dir, name, "job.json")
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    jobs.append(Job.from_dict(json.load(f)))
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                logger.warning("读取任务状态失败 %s: %s", path, e)
+        return jobs
+
+    async def _run(self, job: Job):
+        runner = self._runners[job.kind]
+        job.status = RUNNING
+        await job.save()
+        metrics.inc(f"jobs_{job.kind}_started_total")
+        try:
+            await runner(job)
+            if job.done == 0 and job.failed > 0:
+                # 没有任何条目成功（如上游不可用）时整体标记为失败，而不是已完成
+                job.status = FAILED
+                job.error = f"全部 {job.failed} 个条目处理失败"
+                metrics.inc(f"jobs_{job.kind}_failed_total")
+                logger.error("任务 %s 失败: 全部 %s 个条目处理失败", job.job_id, job.failed)
+            else:
+                job.status = COMPLETED
+                metrics.inc(f"jobs_{job.kind}_completed_total")
+                logger.info("任务 %s 完成: 成功 %s，失败 %s", job.job_id, job.done, job.failed)
+        except asyncio.CancelledError:
+            # 取消（或服务退出）时保存当前进度；服务退出的任务保持 running 以便续跑
+            await asyncio.shield(job.save())
+            raise
+        except Exception as e:
+            logger.error("任务 %s 执行失败: %s", job.job_id, e)
+            job.status = FAILED
+            job.error = str(e)
+            metrics.inc(f"jobs_{job.kind}_failed_total")
+        finally:
+            self._tasks.pop(job.job_id, None)
+        job.finished_at = time.time()
+        await job.save()
+
+def read_jsonl(data: bytes) -> List[dict]:
+    """解析上传的JSONL（跳过空行），格式错误时抛出 ValueError 并指出行号"""
+    items = []
+    for lineno, line in enumerate(data.decode("utf-8-sig").splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第 {lineno} 行不是合法的JSON: {e}")
+        if not isinstance(item, dict):
+            raise ValueError(f"第 {lineno} 行应为JSON对象")
+        items.append(item)
+    return items
+
+def write_jsonl(path: str, items: List[dict]):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+def load_jsonl(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class _ZipSink(io.RawIOBase):
+    """只追加、不可seek的写入目标：zipfile 会改用数据描述符，边打包边输出"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def iter_zip(directory: str, names: List[str], chunk_size: int = 256 * 1024) -> Iterator[bytes]:
+    """流式生成zip（不压缩，音频本身压缩率很低），不在内存或磁盘上生成完整的压缩包"""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as src, zf.open(name, "w", force_zip64=True) as dst:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+# 全局任务管理器
+manager = JobManager()
@@ -0,0 +1,107 @@
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 未配置关键词文件时使用的内置关键词（与 script/match_keywords.py 的宗教相关关键词一致）
+DEFAULT_KEYWORDS = ("神", "佛", "教", "灵", "上天", "圣")
+
+class KeywordAutomaton:
+    """多关键词匹配自动机（Aho-Corasick）
+
+    构建后只读，可在多个匹配器之间共享；匹配时每个字符的均摊开销与关键词数量无关。
+    """
+
+    __slots__ = ("keywords", "max_len", "_goto", "_fail", "_out")
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: Tuple[str, ...] = tuple(sorted({k for k in keywords if k}))
+        # 最长关键词的字符数，流式匹配时据此判断一段文本之后的内容是否还可能与它组成关键词
+        self.max_len = max(map(len, self.keywords), default=0)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[Tuple[str, ...]] = [()]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(())
+                state = nxt
+            self._out[state] = (keyword,)
+        self._fail = [0] * len(self._goto)
+        self._build_fail()
+
+    def _build_fail(self):
+        # 按层广度优先，失败指针指向最长的真后缀状态，同时合并后缀状态的输出
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                if self._out[self._fail[nxt]]:
+                    self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def step(self, state: int, ch: str) -> int:
+        goto = self._goto
+        fail = self._fail
+        while state and ch not in goto[state]:
+            state = fail[state]
+        return goto[state].get(ch, 0)
+
+    def scan(self, text: str, state: int = 0, offset: int = 0) -> Tuple[int, List[Tuple[int, str]]]:
+        """从 state 开始扫描 text，返回 (结束状态, [(命中结束位置, 关键词)])，位置加上 offset"""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        hits = []
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                end = offset + i + 1
+                hits.extend((end, keyword) for keyword in out[state])
+        return state, hits
+
+    def search(self, text: str) -> Optional[str]:
+        """返回 text 中最先出现的关键词，没有则返回None"""
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                return out[state][0]
+        return None
+
+class StreamMatcher:
+    """在增量到达的文本上持续匹配：跨分块的关键词也能命中，位置为累计文本中的下标"""
+
+    __slots__ = ("automaton", "state", "pos")
+
+    def __init__(self, automaton: KeywordAutomaton):
+        self.automaton = automaton
+        self.state = 0
+        self.pos = 0
+
+    def feed(self, text: str) -> List[Tuple[int, str]]:
+        self.state, hits = self.automaton.scan(text, self.state, self.pos)
+        self.pos += len(text)
+        return hits
+
+def load_keywords(path: str) -> List[str]:
+    """读取关键词文件：每行一个，# 开头为注释"""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
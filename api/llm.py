@@ -1,11 +1,15 @@
+import asyncio
 import httpx
-import json
 import logging
+import time
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Union
+from typing import AsyncIterator, List, Optional, Dict, Any, Tuple
 from .config import get_settings, get_llm_headers
+from . import tracing, metrics, codec, deadline
+from .singleflight import llm_flight, request_key
+from .http_pool import get_http_client
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -47,61 +51,167 @@ class CompletionRequest(BaseModel):
     top_p: Optional[float] = Field(default=1.0, description="top_p参数")
     stream: Optional[bool] = Field(default=False, description="是否流式输出")
 
-async def llm_request_with_retry(
-    payload: dict,
-    max_retries: int = 3,
-    stream: bool = False
-) -> Union[dict, httpx.Response]:
-    """带重试机制的LLM请求"""
-    
+async def llm_request_with_retry(payload: dict, max_retries: int = 3) -> dict:
+    """带重试机制的非流式LLM请求（相同请求并发时共享一次上游调用）；流式请求见 open_llm_stream"""
+    return await llm_flight.do(request_key(payload), lambda: _llm_upstream(payload, max_retries))
+
+async def _llm_upstream(payload: dict, max_retries: int) -> dict:
+    """请求上游LLM服务（带重试）"""
     timeout = httpx.Timeout(config.ws_timeout)
     headers = get_llm_headers()
     
-    for attempt in range(max_retries):
-        try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                if stream:
-                    # 流式请求
-                    response = await client.post(
-                        config.llm_url,
-                        headers=headers,
-                        json=payload,
-                        timeout=None  # 流式请求不设置超时
-                    )
-                    response.raise_for_status()
-                    return response
-                else:
-                    # 非流式请求
+    with tracing.span("llm.request", kind=tracing.SPAN_KIND_CLIENT, model=payload.get("model"), stream=False):
+        for attempt in range(max_retries):
+            try:
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    started = time.monotonic()
                     response = await client.post(
                         config.llm_url,
                         headers=headers,
                         json=payload,
-                        timeout=60
+                        timeout=deadline.timeout_for("llm_completion", 60)
                     )
                     response.raise_for_status()
+                    deadline.observe("llm_completion", time.monotonic() - started)
                     return response.json()
                     
-        except httpx.TimeoutException:
-            logger.warning(f"LLM请求超时 (尝试 {attempt + 1}/{max_retries})")
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=408, detail="LLM请求超时")
-        except httpx.HTTPStatusError as e:
-            logger.warning(f"LLM HTTP错误 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                try:
-                    error_detail = e.response.json()
-                except:
-                    error_detail = e.response.text
-                raise HTTPException(
-                    status_code=e.response.status_code,
-                    detail=f"LLM服务错误: {error_detail}"
-                )
-        except Exception as e:
-            logger.warning(f"LLM请求失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=500, detail=f"LLM服务异常: {str(e)}")
+            except deadline.DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=f"LLM请求{e}")
+            except httpx.TimeoutException:
+                logger.warning("LLM请求超时 (尝试 %s/%s)", attempt + 1, max_retries)
+                if attempt == max_retries - 1 or not deadline.can_retry("llm_completion"):
+                    raise HTTPException(status_code=408, detail="LLM请求超时")
+            except httpx.HTTPStatusError as e:
+                logger.warning("LLM HTTP错误 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("llm_completion"):
+                    try:
+                        error_detail = e.response.json()
+                    except:
+                        error_detail = e.response.text
+                    raise HTTPException(
+                        status_code=e.response.status_code,
+                        detail=f"LLM服务错误: {error_detail}"
+                    )
+            except Exception as e:
+                logger.warning("LLM请求失败 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("llm_completion"):
+                    raise HTTPException(status_code=500, detail=f"LLM服务异常: {str(e)}")
     
-    raise HTTPException(status_code=500, detail="LLM服务达到最大重试次数")
+        raise HTTPException(status_code=500, detail="LLM服务达到最大重试次数")
+
+# 4xx 中除超时/限流外都是请求本身的问题，重试没有意义
+_RETRYABLE_STATUS = {408, 429}
+
+async def open_llm_stream(payload: dict, max_retries: int = 3) -> Tuple[httpx.Response, AsyncIterator[bytes], bytes]:
+    """
+    打开上游流式请求并读到第一个数据块
+
+    只在收到首字节之前重试（连接失败、上游错误、首包超时）；之后的失败直接交给调用方，
+    避免把半截回答重复发给客户端。
+
+    Returns:
+        (上游响应, 剩余数据块的迭代器, 第一个数据块)，调用方负责关闭响应
+    """
+    client = get_http_client()
+    # 声明 identity 编码，原始字节即可直接转发给客户端
+    headers = {**get_llm_headers(), "Accept-Encoding": "identity"}
+    with tracing.span("llm.request", kind=tracing.SPAN_KIND_CLIENT, model=payload.get("model"), stream=True) as span:
+        for attempt in range(max_retries):
+            span.set_attribute("attempts", attempt + 1)
+            response = None
+            try:
+                # 每次尝试按剩余时间重新计算超时
+                read_timeout = deadline.timeout_for("llm", config.llm_timeout)
+                timeout = httpx.Timeout(connect=min(5.0, read_timeout), read=read_timeout, write=10.0, pool=5.0)
+                started = time.monotonic()
+                request = client.build_request("POST", config.llm_url, headers=headers, json=payload, timeout=timeout)
+                response = await client.send(request, stream=True)
+                if response.status_code != 200:
+                    await response.aread()
+                    response.raise_for_status()
+                if response.headers.get("content-encoding", "identity") == "identity":
+                    chunks = response.aiter_raw()
+                else:
+                    chunks = response.aiter_bytes()
+                first = await chunks.__anext__()
+                deadline.observe("llm", time.monotonic() - started)
+                span.add_event("first_byte")
+                return response, chunks, first
+
+            except deadline.DeadlineExceeded as e:
+                span.set_error(str(e))
+                raise HTTPException(status_code=504, detail=f"LLM请求{e}")
+            except StopAsyncIteration:
+                await response.aclose()
+                logger.warning("LLM流式响应为空 (尝试 %s/%s)", attempt + 1, max_retries)
+                if attempt == max_retries - 1 or not deadline.can_retry("llm", 0.2 * (attempt + 1)):
+                    span.set_error("empty stream")
+                    raise HTTPException(status_code=502, detail="LLM服务返回空响应")
+            except httpx.TimeoutException:
+                if response is not None:
+                    await response.aclose()
+                logger.warning("LLM流式请求超时 (尝试 %s/%s)", attempt + 1, max_retries)
+                if attempt == max_retries - 1 or not deadline.can_retry("llm", 0.2 * (attempt + 1)):
+                    span.set_error("timeout")
+                    raise HTTPException(status_code=408, detail="LLM请求超时")
+            except httpx.HTTPStatusError as e:
+                await response.aclose()
+                status = e.response.status_code
+                logger.warning("LLM HTTP错误 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if (attempt == max_retries - 1 or (status < 500 and status not in _RETRYABLE_STATUS)
+                        or not deadline.can_retry("llm", 0.2 * (attempt + 1))):
+                    span.set_error(f"status {status}")
+                    try:
+                        error_detail = e.response.json()
+                    except Exception:
+                        error_detail = e.response.text
+                    raise HTTPException(status_code=status, detail=f"LLM服务错误: {error_detail}")
+            except Exception as e:
+                if response is not None:
+                    await response.aclose()
+                logger.warning("LLM流式请求失败 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("llm", 0.2 * (attempt + 1)):
+                    span.set_error(str(e))
+                    raise HTTPException(status_code=500, detail=f"LLM服务异常: {str(e)}")
+            await asyncio.sleep(0.2 * (attempt + 1))
+
+        raise HTTPException(status_code=500, detail="LLM服务达到最大重试次数")
+
+async def relay_llm_stream(response: httpx.Response, chunks: AsyncIterator[bytes], first: bytes):
+    """原样转发上游SSE字节（不重新切行/拼接）；客户端断开时生成器被取消，立即关闭上游连接"""
+    relayed = len(first)
+    try:
+        yield first
+        async for chunk in chunks:
+            relayed += len(chunk)
+            yield chunk
+    except asyncio.CancelledError:
+        metrics.inc("llm_proxy_client_aborts_total")
+        logger.info("客户端断开，终止上游LLM流 (已转发 %s 字节)", relayed)
+        raise
+    except Exception as e:
+        # 已经开始输出，不能再重试或改状态码，只能以错误事件结束
+        metrics.inc("llm_proxy_upstream_errors_total")
+        logger.error("流式响应处理错误: %s", e)
+        yield f"data: {codec.dumps({'error': str(e)})}\n\ndata: [DONE]\n\n"
+    finally:
+        # 未读完的响应关闭时会断开连接（不放回连接池），上游随即停止生成；
+        # 被取消时也要等关闭完成，因此放在 shield 里
+        await asyncio.shield(response.aclose())
+        metrics.inc("llm_proxy_bytes_total", relayed)
+
+async def stream_llm_response(payload: dict) -> StreamingResponse:
+    """流式接口的公共实现：首字节到达后才返回响应，之前的失败仍能以正常的HTTP错误返回"""
+    response, chunks, first = await open_llm_stream(payload)
+    return StreamingResponse(
+        relay_llm_stream(response, chunks, first),
+        media_type=response.headers.get("content-type", "text/event-stream"),
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
 
 def validate_messages(messages: List[Message]) -> None:
     """验证消息格式"""
@@ -137,7 +247,7 @@ async def chat_completions(request: ChatRequest):
         # 验证消息
         validate_messages(request.messages)
         
-        logger.info(f"处理聊天请求: 模型={request.model}, 消息数={len(request.messages)}, 流式={request.stream}")
+        logger.info("处理聊天请求: 模型=%s, 消息数=%s, 流式=%s", request.model, len(request.messages), request.stream)
         
         # 构建请求payload
         payload = {
@@ -152,38 +262,18 @@ async def chat_completions(request: ChatRequest):
         }
         
         if request.stream:
-            # 流式响应
-            response = await llm_request_with_retry(payload, stream=True)
-            
-            async def generate_stream():
-                try:
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            yield f"{line}\n"
-                except Exception as e:
-                    logger.error(f"流式响应处理错误: {e}")
-                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                finally:
-                    yield "data: [DONE]\n\n"
-            
-            return StreamingResponse(
-                generate_stream(),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive"
-                }
-            )
+            # 流式响应：直接转发上游字节流
+            return await stream_llm_response(payload)
         else:
             # 非流式响应
-            result = await llm_request_with_retry(payload, stream=False)
+            result = await llm_request_with_retry(payload)
             logger.info("聊天请求处理完成")
             return result
             
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"聊天处理异常: {e}")
+        logger.error("聊天处理异常: %s", e)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 @router.post("/completions")
@@ -202,7 +292,7 @@ async def text_completions(request: CompletionRequest):
         if not request.prompt.strip():
             raise HTTPException(status_code=400, detail="提示文本不能为空")
         
-        logger.info(f"处理文本补全请求: 模型={request.model}, 提示长度={len(request.prompt)}")
+        logger.info("处理文本补全请求: 模型=%s, 提示长度=%s", request.model, len(request.prompt))
         
         # 将文本补全转换为聊天格式
         messages = [{"role": "user", "content": request.prompt}]
@@ -217,38 +307,18 @@ async def text_completions(request: CompletionRequest):
         }
         
         if request.stream:
-            # 流式响应
-            response = await llm_request_with_retry(payload, stream=True)
-            
-            async def generate_stream():
-                try:
-                    async for line in response.aiter_lines():
-                        if line.strip():
-                            yield f"{line}\n"
-                except Exception as e:
-                    logger.error(f"流式响应处理错误: {e}")
-                    yield f"data: {json.dumps({'error': str(e)})}\n\n"
-                finally:
-                    yield "data: [DONE]\n\n"
-            
-            return StreamingResponse(
-                generate_stream(),
-                media_type="text/event-stream",
-                headers={
-                    "Cache-Control": "no-cache",
-                    "Connection": "keep-alive"
-                }
-            )
+            # 流式响应：直接转发上游字节流
+            return await stream_llm_response(payload)
         else:
             # 非流式响应
-            result = await llm_request_with_retry(payload, stream=False)
+            result = await llm_request_with_retry(payload)
             logger.info("文本补全请求处理完成")
             return result
             
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"文本补全处理异常: {e}")
+        logger.error("文本补全处理异常: %s", e)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 @router.get("/llm/models")
@@ -279,7 +349,7 @@ async def get_available_llm_models():
             ]
         }
     except Exception as e:
-        logger.error(f"获取模型列表失败: {e}")
+        logger.error("获取模型列表失败: %s", e)
         raise HTTPException(status_code=500, detail="获取模型列表失败")
 
 @router.get("/usage")
@@ -292,5 +362,5 @@ async def get_usage_stats():
             "status": "healthy"
         }
     except Exception as e:
-        logger.error(f"获取使用统计失败: {e}")
+        logger.error("获取使用统计失败: %s", e)
         raise HTTPException(status_code=500, detail="获取使用统计失败") 
\ No newline at end of file
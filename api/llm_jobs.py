@@ -0,0 +1,289 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Optional, Set
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+from .config import get_settings
+from . import jobs, metrics
+from .llm import _llm_upstream
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+config = get_settings()
+
+JOB_KIND = "chat"
+
+class TokenBucket:
+    """按分钟配额的令牌桶（rate<=0 表示不限制）"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, n: float):
+        if self.rate <= 0:
+            return
+        # 单次请求超过整分钟配额时按配额计，避免永远等不到
+        n = min(n, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= n:
+                self.tokens -= n
+                return
+            await asyncio.sleep((n - self.tokens) / self.rate)
+
+    def adjust(self, delta: float):
+        """按实际用量修正预估值（可为负数，表示退还）"""
+        if self.rate > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - delta)
+
+class RateLimiter:
+    """请求数/分钟 + token数/分钟 双重限速"""
+
+    def __init__(self, rpm: float, tpm: float):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, estimated_tokens: int):
+        # 串行领取配额，保证先到先得
+        async with self._lock:
+            started = time.monotonic()
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            waited = (time.monotonic() - started) * 1000
+            if waited > 1:
+                metrics.observe("llm_job_rate_limit_wait_ms", waited)
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+def estimate_tokens(body: dict) -> int:
+    """粗略估算一次请求消耗的token数：输入按字符数计（中文约1字1token），加上输出上限"""
+    chars = sum(len(str(m.get("content", ""))) for m in body.get("messages", []))
+    return chars + int(body.get("max_tokens") or config.llm_max_tokens)
+
+def _normalize_items(items: list, model: str, max_tokens: Optional[int]) -> list:
+    """每行可以是完整的 chat/completions 请求体（含 messages），或仅含 prompt 的简写"""
+    normalized = []
+    ids = set()
+    for i, item in enumerate(items):
+        body = item.get("body") if isinstance(item.get("body"), dict) else dict(item)
+        custom_id = str(item.get("custom_id", i))
+        body.pop("custom_id", None)
+        if "messages" not in body:
+            prompt = body.pop("prompt", None)
+            if not isinstance(prompt, str) or not prompt.strip():
+                raise ValueError(f"第 {i + 1} 条缺少 messages 或 prompt")
+            body["messages"] = [{"role": "user", "content": prompt}]
+        if not isinstance(body["messages"], list) or not body["messages"]:
+            raise ValueError(f"第 {i + 1} 条 messages 不能为空")
+        if custom_id in ids:
+            raise ValueError(f"第 {i + 1} 条 custom_id 重复: {custom_id}")
+        ids.add(custom_id)
+        body.setdefault("model", model)
+        if max_tokens:
+            body.setdefault("max_tokens", max_tokens)
+        # 批处理只支持非流式请求
+        body["stream"] = False
+        normalized.append({"custom_id": custom_id, "body": body})
+    return normalized
+
+def _load_checkpoint(path: str) -> Set[int]:
+    """读取已写出的结果作为检查点，返回已成功的条目序号
+
+    失败的条目和崩溃时写了一半的最后一行会从文件中去掉，续跑时重新请求（与TTS批处理一致），
+    这样结果文件中每个条目最多一行。
+    """
+    succeeded: Set[int] = set()
+    if not os.path.exists(path):
+        return succeeded
+    kept = []
+    dropped = False
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                dropped = True
+                break
+            try:
+                record = json.loads(line)
+                index = record["index"]
+            except (ValueError, KeyError):
+                dropped = True
+                break
+            if record.get("error") is None:
+                succeeded.add(index)
+                kept.append(line)
+            else:
+                dropped = True
+    if dropped:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.writelines(kept)
+        os.replace(tmp, path)
+    return succeeded
+
+class _OutputWriter:
+    """按完成顺序追加写出结果（每行写完即flush，作为续跑的检查点）"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = asyncio.Lock()
+
+    def _write(self, line: str):
+        self._file.write(line)
+        self._file.flush()
+
+    async def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        async with self._lock:
+            await asyncio.to_thread(self._write, line)
+
+    def close(self):
+        self._file.close()
+
+async def run_chat_job(job: jobs.Job):
+    """执行批量对话任务：结果和错误边完成边写入 output.jsonl，续跑时跳过已成功的条目"""
+    items = await asyncio.to_thread(jobs.load_jsonl, job.path("input.jsonl"))
+    output_path = job.path("output.jsonl")
+    finished = await asyncio.to_thread(_load_checkpoint, output_path)
+
+    # 根据检查点重新统计进度（失败的条目重新尝试）
+    job.done = len(finished)
+    job.failed = 0
+    job.errors = []
+    if finished:
+        logger.info("任务 %s 续跑: 已完成 %s/%s", job.job_id, job.done, job.total)
+
+    params = job.params
+    limiter = RateLimiter(params.get("rpm", config.llm_job_rpm), params.get("tpm", config.llm_job_tpm))
+    writer = await asyncio.to_thread(_OutputWriter, output_path)
+    queue = iter([(i, item) for i, item in enumerate(items) if i not in finished])
+
+    async def worker():
+        for i, item in queue:
+            body = item["body"]
+            estimated = estimate_tokens(body)
+            await limiter.acquire(estimated)
+            record = {"index": i, "custom_id": item["custom_id"]}
+            try:
+                # 直接请求上游：批处理条目不参与在线请求的合并，各自独立计量和重试
+                response = await _llm_upstream(body, config.llm_job_retries)
+                usage = response.get("usage") or {}
+                limiter.settle(estimated, usage.get("total_tokens"))
+                metrics.inc("llm_job_tokens_total", usage.get("total_tokens", 0))
+                record["response"] = response
+                job.done += 1
+                metrics.inc("llm_job_requests_total")
+            except Exception as e:
+                message = getattr(e, "detail", None) or str(e)
+                record["error"] = str(message)
+                job.record_error(i, str(message))
+                metrics.inc("llm_job_errors_total")
+            await writer.write(record)
+            await job.save(force=False)
+
+    try:
+        concurrency = max(int(params.get("concurrency", config.llm_job_concurrency)), 1)
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        writer.close()
+
+jobs.manager.register(JOB_KIND, run_chat_job)
+
+def _get_job(job_id: str) -> jobs.Job:
+    job = jobs.manager.get(job_id)
+    if job is None or job.kind != JOB_KIND:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.post("/chat/jobs")
+async def create_chat_job(
+    file: UploadFile = File(..., description="JSONL文件，每行一个chat/completions请求体或 {\"prompt\": ...}"),
+    model: str = Form(default="gpt-4o-ca", description="默认模型"),
+    max_tokens: Optional[int] = Form(default=None, description="默认最大tokens"),
+    concurrency: Optional[int] = Form(default=None, description="并发请求数"),
+    rpm: Optional[int] = Form(default=None, description="每分钟请求数上限，0为不限"),
+    tpm: Optional[int] = Form(default=None, description="每分钟token数上限，0为不限")
+):
+    """
+    提交批量对话任务
+
+    Args:
+        file: JSONL文件，每行包含 messages（或 prompt），可选 custom_id 及其它请求参数
+        model: 未单独指定时使用的模型
+        max_tokens: 未单独指定时的最大tokens
+        concurrency: 并发请求数（默认 LLM_JOB_CONCURRENCY）
+        rpm: 每分钟请求数上限（默认 LLM_JOB_RPM）
+        tpm: 每分钟token数上限（默认 LLM_JOB_TPM）
+
+    Returns:
+        dict: 任务状态
+    """
+    try:
+        items = _normalize_items(jobs.read_jsonl(await file.read()), model, max_tokens)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"任务文件格式错误: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="任务文件为空")
+    if len(items) > config.llm_job_max_items:
+        raise HTTPException(status_code=400, detail=f"单个任务不能超过{config.llm_job_max_items}条")
+
+    params = {"model": model}
+    for key, value in (("concurrency", concurrency), ("rpm", rpm), ("tpm", tpm)):
+        if value is not None:
+            if value < 0:
+                raise HTTPException(status_code=400, detail=f"{key} 不能为负数")
+            params[key] = value
+    job = await jobs.manager.create(JOB_KIND, len(items), params)
+    await asyncio.to_thread(jobs.write_jsonl, job.path("input.jsonl"), items)
+    jobs.manager.start(job)
+    logger.info("已提交批量对话任务 %s: %s 条", job.job_id, len(items))
+    return job.to_dict()
+
+@router.get("/chat/jobs")
+async def list_chat_jobs():
+    """列出批量对话任务"""
+    return {"jobs": [job.to_dict() for job in jobs.manager.list(JOB_KIND)]}
+
+@router.get("/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str):
+    """查询任务状态和进度"""
+    return _get_job(job_id).to_dict()
+
+@router.post("/chat/jobs/{job_id}/cancel")
+async def cancel_chat_job(job_id: str):
+    """取消任务（已写出的结果保留）"""
+    job = _get_job(job_id)
+    if not await jobs.manager.cancel(job):
+        raise HTTPException(status_code=409, detail=f"任务已结束: {job.status}")
+    return job.to_dict()
+
+@router.delete("/chat/jobs/{job_id}")
+async def delete_chat_job(job_id: str):
+    """删除任务及其所有文件"""
+    await jobs.manager.delete(_get_job(job_id))
+    return {"success": True}
+
+@router.get("/chat/jobs/{job_id}/output")
+async def download_chat_job_output(job_id: str):
+    """下载结果JSONL（按完成顺序，每行含 index/custom_id 及 response 或 error；任务进行中可下载已完成部分）"""
+    job = _get_job(job_id)
+    path = job.path("output.jsonl")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="暂无结果")
+    return FileResponse(path, media_type="application/jsonl", filename=f"chat_{job.job_id}.jsonl")
@@ -0,0 +1,139 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from .config import get_settings
+from . import metrics, tracing
+
+config = get_settings()
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，附带trace id和被限流丢弃的条数"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """与原 basicConfig 格式一致，限流丢弃的条数附在末尾"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (已省略 {suppressed} 条)" if suppressed else text
+
+class RateLimitFilter(logging.Filter):
+    """按调用位置（文件+行号）限流：每秒补充 rate 条、最多累积 burst 条
+
+    ERROR 及以上级别不限流；被丢弃的条数记在该位置下一条放行的日志上。
+    """
+
+    def __init__(self, rate: float, burst: int):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(burst, 1)
+        # 调用位置 -> [令牌数, 上次补充时间, 已丢弃条数]
+        self._buckets: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                metrics.inc("log_suppressed_total")
+                return False
+            bucket[0] -= 1
+            record.suppressed, bucket[2] = bucket[2], 0
+        return True
+
+class _LoopQueueHandler(logging.handlers.QueueHandler):
+    """事件循环侧只做入队和消息插值：其余格式化（时间、JSON、异常堆栈）和写出都在后台线程完成
+
+    参数在入队前插值：args 可能是之后会被修改的可变对象，后台线程再插值会得到错误的内容；
+    异常堆栈的格式化较慢，exc_info 原样保留给后台线程。
+    trace id 保存在 contextvar 中，只能在产生日志的线程上读取，因此在入队前记录。
+    队列满时丢弃并计数，不阻塞事件循环。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        record.trace_id = tracing.current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_dropped_total")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging():
+    """把根日志器（以及uvicorn的日志器）改为经队列由后台线程写出；重复调用无副作用"""
+    global _listener
+    if _listener is not None:
+        return
+    formatter = JsonFormatter() if config.log_format == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if config.log_file:
+        os.makedirs(os.path.dirname(config.log_file) or ".", exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(
+            config.log_file, maxBytes=config.log_max_bytes, backupCount=config.log_backup_count, encoding="utf-8"
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = _LoopQueueHandler(queue.Queue(maxsize=max(config.log_queue_size, 1)))
+    queue_handler.addFilter(RateLimitFilter(config.log_rate_limit, config.log_rate_burst))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(config.log_level.upper())
+    for name in ("uvicorn", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [queue_handler]
+        uvicorn_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """写完队列中剩余的日志后停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,25 +1,97 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import logging
 from .config import get_settings
-from . import realtime, tts, transcription, llm, mock_llm
+# 路由模块及只被路由使用的模块（debug、fillers、faq、jobs、asr_batcher）不在这里导入，按启用的路由延迟导入
+from . import logging_setup, tracing, metrics, http_pool, deadline, warmup
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# 配置日志：经队列由后台线程写出，不在事件循环中做IO
+logging_setup.setup_logging()
 logger = logging.getLogger(__name__)
 
 # 获取配置
 config = get_settings()
 
+# 可按需启用的路由：名称 -> (模块, 路径前缀)
+ROUTERS = {
+    "realtime": ("realtime", "/api/v1"),
+    "tts": ("tts", "/api/v1"),
+    "tts_jobs": ("tts_jobs", "/api/v1"),
+    "transcription": ("transcription", "/api/v1"),
+    "llm": ("llm", "/api/v1"),
+    "llm_jobs": ("llm_jobs", "/api/v1"),
+    "mock_llm": ("mock_llm", "/api/v1"),
+    "mock_audio": ("mock_audio", "/api/v1/mock"),
+    "metrics": ("metrics", ""),
+    "debug": ("debug", ""),
+}
+
+def _enabled_routers() -> list:
+    names = [n.strip() for n in config.enabled_routers.split(",") if n.strip()]
+    if "all" in names:
+        return list(ROUTERS)
+    unknown = [n for n in names if n not in ROUTERS]
+    if unknown:
+        raise ValueError(f"未知的路由: {', '.join(unknown)}，可选: {', '.join(ROUTERS)}")
+    return names
+
+def _check_debug_access(names: list):
+    """调试接口可执行CPU profile、内存快照，开启时必须配置访问令牌，否则拒绝启动"""
+    if "debug" in names and config.debug_endpoints_enabled and not config.debug_token:
+        raise ValueError("已开启调试接口（DEBUG_ENDPOINTS_ENABLED）但未配置 DEBUG_TOKEN")
+
+enabled_routers = _enabled_routers()
+_check_debug_access(enabled_routers)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动后台监控、预合成填充音、构建FAQ索引、恢复未完成的批处理任务、预热上游，退出时刷新追踪日志
+
+    各项只在对应的路由启用时进行，模块在此时才导入（已随路由导入的直接复用）。
+    """
+    realtime_enabled = "realtime" in enabled_routers
+    jobs_enabled = "tts_jobs" in enabled_routers or "llm_jobs" in enabled_routers
+    # 事件循环延迟只能通过 /metrics 或 /debug/loop-lag 查看，两者都未启用时不监控
+    monitor = None
+    if config.loop_lag_monitor and ("debug" in enabled_routers or "metrics" in enabled_routers):
+        from . import debug
+        monitor = debug.start_loop_monitor()
+    cache_tasks = []
+    if realtime_enabled:
+        from . import fillers, faq
+        cache_tasks.append(asyncio.create_task(fillers.load_fillers(http_pool.get_http_client())))
+        cache_tasks.append(asyncio.create_task(faq.load_faq(http_pool.get_http_client())))
+    if jobs_enabled:
+        from . import jobs
+        await jobs.manager.resume()
+    # 预热在后台进行，期间 /ready 返回503
+    warmup_task = asyncio.create_task(warmup.run(http_pool.get_http_client(), cache_tasks))
+    yield
+    warmup_task.cancel()
+    for task in cache_tasks:
+        task.cancel()
+    if jobs_enabled:
+        await jobs.manager.shutdown()
+    if realtime_enabled:
+        from . import asr_batcher
+        await asr_batcher.close_batcher()
+    if monitor is not None:
+        await monitor.stop()
+    await http_pool.close_http_client()
+    tracing.shutdown()
+
 app = FastAPI(
     title="10KV AI Real-time Voice Chat API",
     description="实时语音对话系统API",
     version="1.0.0",
-    debug=config.debug
+    debug=config.debug,
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -31,12 +103,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# 注册路由
-app.include_router(realtime.router, prefix="/api/v1")
-app.include_router(tts.router, prefix="/api/v1")
-app.include_router(transcription.router, prefix="/api/v1")
-app.include_router(llm.router, prefix="/api/v1")
-app.include_router(mock_llm.router, prefix="/api/v1")
+# 每个HTTP请求的截止时间（上游调用只获得剩余的时间）
+app.add_middleware(deadline.DeadlineMiddleware)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """为每个REST请求创建trace，并通过响应头返回trace id
+
+    call_next 返回时只发出了响应头，响应体（流式接口的全部内容）之后才发送，
+    因此根span在响应体发送完毕时结束，另记录 response_headers 事件标记首包时间。
+    """
+    with tracing.start_trace(
+        f"{request.method} {request.url.path}",
+        **{"http.method": request.method, "http.target": request.url.path}
+    ) as trace:
+        response = await call_next(request)
+        if trace is not None:
+            trace.root.set_attribute("http.status_code", response.status_code)
+            trace.root.add_event("response_headers")
+            trace.root.defer_end()
+            response.body_iterator = tracing.end_after_body(response.body_iterator, trace.root)
+    if trace is not None:
+        response.headers["X-Trace-Id"] = trace.trace_id
+    return response
+
+# 注册路由：只导入 enabled_routers 中启用的路由模块，并记录各模块的导入耗时
+# （metrics 模块被日志等基础模块依赖，总是已导入，其导入耗时接近0）
+for name in enabled_routers:
+    module_name, prefix = ROUTERS[name]
+    started = time.perf_counter()
+    module = importlib.import_module(f".{module_name}", __package__)
+    import_ms = (time.perf_counter() - started) * 1000
+    metrics.set_gauge(f"startup_import_{name}_ms", round(import_ms, 2))
+    logger.info("已注册路由 %s (导入耗时 %.1fms)", name, import_ms)
+    app.include_router(module.router, prefix=prefix)
 
 @app.get("/")
 async def root():
@@ -47,6 +147,13 @@ async def root():
         "status": "healthy"
     }
 
+@app.get("/ready")
+async def readiness():
+    """就绪检查：启动预热完成前返回503，负载均衡器据此决定何时转发流量"""
+    if not warmup.state.done.is_set():
+        return JSONResponse(status_code=503, content={"status": "warming_up", **warmup.state.to_dict()})
+    return {"status": "ready", **warmup.state.to_dict()}
+
 @app.get("/health")
 async def health_check():
     """详细的健康检查"""
@@ -60,11 +167,12 @@ async def health_check():
     }
 
 if __name__ == "__main__":
-    logger.info(f"启动服务器 - Host: {config.host}, Port: {config.port}")
+    logger.info("启动服务器 - Host: %s, Port: %s", config.host, config.port)
     uvicorn.run(
         "api.main:app",
         host=config.host,
         port=config.port,
         log_level="info" if not config.debug else "debug",
-        reload=config.debug
+        reload=config.debug,
+        ws_max_size=config.ws_max_size
     ) 
\ No newline at end of file
@@ -0,0 +1,97 @@
+import bisect
+import threading
+from typing import Dict, Optional, Sequence
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+router = APIRouter()
+
+# 默认的毫秒级直方图分桶
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class Histogram:
+    """固定分桶直方图（累计计数在导出时计算）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def to_dict(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "max": round(self.max, 3),
+            "buckets": buckets
+        }
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_histograms: Dict[str, Histogram] = {}
+
+def inc(name: str, value: float = 1):
+    """计数器累加"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def set_gauge(name: str, value: float):
+    """设置瞬时值"""
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value: float, buckets: Optional[Sequence[float]] = None):
+    """记录一次直方图观测值"""
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None:
+            hist = _histograms[name] = Histogram(buckets or DEFAULT_BUCKETS_MS)
+        hist.observe(value)
+
+def snapshot() -> dict:
+    """导出所有指标"""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {name: hist.to_dict() for name, hist in _histograms.items()}
+        }
+
+def render_prometheus() -> str:
+    """按Prometheus文本格式导出"""
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {value}")
+    for name, value in sorted(data["gauges"].items()):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    for name, hist in sorted(data["histograms"].items()):
+        lines.append(f"# TYPE {name} histogram")
+        for bound, n in hist["buckets"].items():
+            lines.append(f'{name}_bucket{{le="{bound}"}} {n}')
+        lines.append(f"{name}_sum {hist['sum']}")
+        lines.append(f"{name}_count {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+@router.get("/metrics")
+async def get_metrics(format: str = "prometheus"):
+    """导出运行指标（默认Prometheus文本格式，format=json时返回JSON）"""
+    if format == "json":
+        return snapshot()
+    return PlainTextResponse(render_prometheus())
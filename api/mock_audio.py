@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import io
+import logging
+import math
+import random
+import struct
+import wave
+from contextlib import asynccontextmanager
+from array import array
+from typing import List, Optional
+from fastapi import APIRouter, File, Form, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from .config import get_settings
+from .mock_llm import MockAborted, tokenize
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+config = get_settings()
+
+# 模拟转录结果，按音频内容哈希确定性地选取
+MOCK_TRANSCRIPTS = [
+    "你好，请介绍一下你自己。",
+    "今天天气怎么样？",
+    "帮我查一下明天的会议安排。",
+    "十千伏线路的巡检周期是多久？",
+    "请用一句话总结刚才的内容。",
+    "变压器温度过高应该怎么处理？",
+    "谢谢，没有其他问题了。",
+    "能再说一遍吗？",
+]
+
+class MockSpeechRequest(BaseModel):
+    model: str = "CosyVoice2-0.5B"
+    input: str
+    voice: Optional[str] = None
+    speed: Optional[float] = 1.0
+    response_format: Optional[str] = None
+    format: Optional[str] = None
+
+def audio_duration(data: bytes) -> float:
+    """音频时长（秒）：WAV按文件头计算，其它格式按16kHz/16bit单声道估算"""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wf:
+            return wf.getnframes() / float(wf.getframerate())
+    except Exception:
+        return len(data) / (16000 * 2)
+
+def mock_transcript(data: bytes) -> str:
+    """相同音频总是得到相同文本"""
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    return MOCK_TRANSCRIPTS[int.from_bytes(digest, "little") % len(MOCK_TRANSCRIPTS)]
+
+# 模拟推理服务的处理能力：MOCK_ASR_CONCURRENCY 限制同时处理的请求数（单个请求与一个批次各占一个）
+_asr_semaphore: Optional[asyncio.Semaphore] = None
+
+@asynccontextmanager
+async def _asr_slot():
+    global _asr_semaphore
+    if config.mock_asr_concurrency <= 0:
+        yield
+        return
+    if _asr_semaphore is None:
+        _asr_semaphore = asyncio.Semaphore(config.mock_asr_concurrency)
+    async with _asr_semaphore:
+        yield
+
+@router.post("/audio/transcriptions")
+async def mock_transcriptions(
+    file: UploadFile = File(...),
+    model: str = Form(default="SenseVoiceSmall"),
+    language: Optional[str] = Form(default=None)
+):
+    """模拟SenseVoice转录：耗时与音频时长成正比（MOCK_ASR_RTF），结果由音频内容决定"""
+    data = await file.read()
+    if random.random() < config.mock_asr_error_rate:
+        return JSONResponse(status_code=config.mock_error_status, content={"error": {"message": "Mock注入的ASR错误", "type": "mock_error"}})
+    duration = audio_duration(data)
+    async with _asr_slot():
+        await asyncio.sleep(config.mock_asr_base_ms / 1000 + duration * config.mock_asr_rtf)
+    return {"text": mock_transcript(data), "language": language or "zh", "duration": round(duration, 3)}
+
+@router.post("/audio/transcriptions/batch")
+async def mock_transcriptions_batch(
+    files: List[UploadFile] = File(...),
+    model: str = Form(default="SenseVoiceSmall"),
+    language: Optional[str] = Form(default=None)
+):
+    """模拟批量转录：一批只付一次固定耗时，按最长音频计算推理耗时，每条再加 MOCK_ASR_BATCH_ITEM_MS
+
+    结果按上传顺序返回在 results 中。
+    """
+    datas = [await f.read() for f in files]
+    if random.random() < config.mock_asr_error_rate:
+        return JSONResponse(status_code=config.mock_error_status, content={"error": {"message": "Mock注入的ASR错误", "type": "mock_error"}})
+    durations = [audio_duration(data) for data in datas]
+    async with _asr_slot():
+        await asyncio.sleep(config.mock_asr_base_ms / 1000 + max(durations, default=0) * config.mock_asr_rtf
+                            + len(datas) * config.mock_asr_batch_item_ms / 1000)
+    return {"results": [
+        {"text": mock_transcript(data), "language": language or "zh", "duration": round(duration, 3)}
+        for data, duration in zip(datas, durations)
+    ]}
+
+def _tone(sample_rate: int) -> bytes:
+    """预生成1秒的合成语音替代音（带起伏的正弦波），流式输出时循环切片"""
+    samples = array("h", (
+        int(8000 * math.sin(2 * math.pi * 220 * t / sample_rate) * (0.6 + 0.4 * math.sin(2 * math.pi * 3 * t / sample_rate)))
+        for t in range(sample_rate)
+    ))
+    return samples.tobytes()
+
+_tone_cache = {}
+
+def _tone_for(sample_rate: int) -> bytes:
+    tone = _tone_cache.get(sample_rate)
+    if tone is None:
+        tone = _tone_cache[sample_rate] = _tone(sample_rate)
+    return tone
+
+def wav_header(sample_rate: int, data_size: int) -> bytes:
+    """16bit单声道WAV文件头"""
+    return b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE" + b"fmt " + struct.pack(
+        "<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16
+    ) + b"data" + struct.pack("<I", data_size)
+
+async def stream_mock_speech(text: str, speed: float, with_header: bool):
+    """按 MOCK_TTS_RTF 的速度流式输出合成音频：先等待首包延迟，之后每块按其音频时长×RTF间隔发送"""
+    sample_rate = config.mock_tts_sample_rate
+    duration = len(tokenize(text)) * config.mock_tts_char_ms / 1000 / max(speed or 1.0, 0.1)
+    total = int(duration * sample_rate) * 2
+    chunk_size = max(int(sample_rate * config.mock_tts_chunk_ms / 1000) * 2, 2)
+    tone = _tone_for(sample_rate)
+    abort_at = random.randrange(max(total, 1)) if random.random() < config.mock_abort_rate else -1
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.mock_tts_ttfb_ms / 1000
+    await asyncio.sleep(max(deadline - loop.time(), 0))
+    if with_header:
+        yield wav_header(sample_rate, total)
+    sent = 0
+    while sent < total:
+        if 0 <= abort_at < sent + chunk_size:
+            raise MockAborted("模拟TTS上游中途断开")
+        size = min(chunk_size, total - sent)
+        start = sent % len(tone)
+        chunk = tone[start:start + size]
+        if len(chunk) < size:
+            chunk += tone[:size - len(chunk)]
+        yield chunk
+        sent += size
+        deadline += size / 2 / sample_rate * config.mock_tts_rtf
+        delay = deadline - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+@router.post("/audio/speech")
+async def mock_speech(request: MockSpeechRequest):
+    """模拟CosyVoice合成：流式返回WAV（response_format=pcm 时返回裸PCM）"""
+    if random.random() < config.mock_tts_error_rate:
+        return JSONResponse(status_code=config.mock_error_status, content={"error": {"message": "Mock注入的TTS错误", "type": "mock_error"}})
+    fmt = request.response_format or request.format or "wav"
+    return StreamingResponse(
+        stream_mock_speech(request.input, request.speed or 1.0, fmt != "pcm"),
+        media_type="audio/wav" if fmt != "pcm" else "application/octet-stream"
+    )
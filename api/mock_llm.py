@@ -1,24 +1,92 @@
 import json
 import asyncio
+import math
 import random
+import re
+import time
 from fastapi import APIRouter
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import Dict, List, Optional, Tuple
 import logging
+from .config import get_settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
+config = get_settings()
 
 class ChatMessage(BaseModel):
     role: str
     content: str
 
+class MockOptions(BaseModel):
+    """单个请求覆盖的模拟参数（未指定时使用 MOCK_* 配置）"""
+    ttft: Optional[str] = None
+    itl: Optional[str] = None
+    error_rate: Optional[float] = None
+    timeout_rate: Optional[float] = None
+    abort_rate: Optional[float] = None
+
 class MockChatRequest(BaseModel):
     model: str = "mock-gpt"
     messages: List[ChatMessage]
     stream: bool = False
+    mock: Optional[MockOptions] = None
+
+class LatencyDistribution:
+    """延迟分布，格式 "<分布>:<均值ms>[:<参数>]"
+
+    - fixed:300            固定值
+    - uniform:300:100      均值±100ms 均匀分布
+    - normal:300:50        正态分布，标准差50ms
+    - lognormal:300:0.5    对数正态分布（长尾），sigma=0.5
+    """
+
+    def __init__(self, spec: str):
+        parts = spec.split(":")
+        self.kind = parts[0].strip().lower()
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal") or len(parts) > 3:
+            raise ValueError(f"不支持的延迟分布: {spec}")
+        try:
+            self.mean = float(parts[1]) / 1000 if len(parts) > 1 else 0.0
+            self.param = float(parts[2]) if len(parts) > 2 else 0.0
+        except ValueError:
+            raise ValueError(f"延迟分布参数不是数字: {spec}") from None
+        if not (math.isfinite(self.mean) and math.isfinite(self.param)) or self.mean < 0 or self.param < 0:
+            raise ValueError(f"延迟分布参数必须为非负数: {spec}")
+        if self.kind == "lognormal":
+            # 使分布均值等于给定均值
+            self._mu = math.log(self.mean) - self.param ** 2 / 2 if self.mean > 0 else 0.0
+
+    def sample(self) -> float:
+        """采样一个延迟（秒）"""
+        if self.kind == "fixed" or self.mean <= 0:
+            value = self.mean
+        elif self.kind == "uniform":
+            spread = self.param / 1000
+            value = random.uniform(self.mean - spread, self.mean + spread)
+        elif self.kind == "normal":
+            value = random.gauss(self.mean, self.param / 1000)
+        else:
+            value = random.lognormvariate(self._mu, self.param)
+        return max(value, 0.0)
+
+_distributions: Dict[str, LatencyDistribution] = {}
+
+def get_distribution(spec: str) -> LatencyDistribution:
+    """解析后缓存，避免每个请求重复解析；格式错误时抛出 ValueError"""
+    dist = _distributions.get(spec)
+    if dist is None:
+        dist = LatencyDistribution(spec)
+        # 请求可以携带任意参数，缓存大小有上限
+        if len(_distributions) < 1024:
+            _distributions[spec] = dist
+    return dist
+
+def resolve_latency(options: "MockOptions") -> Tuple[LatencyDistribution, LatencyDistribution]:
+    """解析请求的首token延迟和token间隔分布（未指定时使用配置）"""
+    return get_distribution(options.ttft or config.mock_ttft), get_distribution(options.itl or config.mock_itl)
 
 # 预设的回复模板
 MOCK_RESPONSES = [
@@ -51,46 +119,72 @@ def generate_mock_response(user_content: str) -> str:
     
     return response
 
-async def stream_mock_response(content: str):
-    """流式返回模拟回复"""
-    response_text = generate_mock_response(content)
-    
-    # 将回复分成小块进行流式传输
-    words = response_text.split()
-    
-    for i, word in enumerate(words):
-        chunk_data = {
-            "id": f"mock-{random.randint(1000, 9999)}",
-            "object": "chat.completion.chunk",
-            "created": 1677652288,
-            "model": "mock-gpt",
-            "choices": [{
-                "index": 0,
-                "delta": {
-                    "content": word + (" " if i < len(words) - 1 else "")
-                },
-                "finish_reason": None
-            }]
-        }
-        
-        yield f"data: {json.dumps(chunk_data, ensure_ascii=False)}\n\n"
-        await asyncio.sleep(0.1)  # 模拟真实的流式延迟
-    
-    # 发送结束标记
-    final_chunk = {
-        "id": f"mock-{random.randint(1000, 9999)}",
-        "object": "chat.completion.chunk",
-        "created": 1677652288,
-        "model": "mock-gpt",
-        "choices": [{
-            "index": 0,
-            "delta": {},
-            "finish_reason": "stop"
-        }]
-    }
-    
-    yield f"data: {json.dumps(final_chunk, ensure_ascii=False)}\n\n"
-    yield "data: [DONE]\n\n"
+# 中文等CJK字符逐字输出，其它文本按词（连同后面的空白）输出
+TOKEN_PATTERN = re.compile(r"[\u2e80-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]|[^\s\u2e80-\u9fff\uf900-\ufaff\u3000-\u303f\uff00-\uffef]+\s*|\s+")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text)
+
+# 预编码的SSE片段：每个分块 = 流头部 + 缓存的 token JSON 与结尾
+_CHUNK_TAIL = b'},"finish_reason":null}]}\n\n'
+_DONE = b"data: [DONE]\n\n"
+_encoded_tokens: Dict[str, bytes] = {}
+
+def _encode_token(token: str) -> bytes:
+    encoded = _encoded_tokens.get(token)
+    if encoded is None:
+        encoded = b'{"content":' + json.dumps(token, ensure_ascii=False).encode("utf-8") + _CHUNK_TAIL
+        # 逐字输出时常用字集合有限，缓存大小有上限
+        if len(_encoded_tokens) < 65536:
+            _encoded_tokens[token] = encoded
+    return encoded
+
+def _stream_head(stream_id: str) -> bytes:
+    return (
+        'data: {"id":"' + stream_id + '","object":"chat.completion.chunk","created":1677652288,'
+        '"model":"mock-gpt","choices":[{"index":0,"delta":'
+    ).encode("utf-8")
+
+def _final_chunk(stream_id: str) -> bytes:
+    return _stream_head(stream_id) + b'{},"finish_reason":"stop"}]}\n\n' + _DONE
+
+class MockAborted(Exception):
+    """模拟上游在流式输出中途断开"""
+
+async def stream_mock_response(content: str, options: Optional[MockOptions] = None,
+                               latency: Optional[Tuple[LatencyDistribution, LatencyDistribution]] = None):
+    """流式返回模拟回复：首token延迟和token间隔按配置的分布采样，按计划时间发送避免累积误差
+
+    latency 为已解析的 (首token延迟, token间隔) 分布；路由在返回响应前解析，
+    参数错误时直接返回400，而不是在200之后中断流。
+    """
+    options = options or MockOptions()
+    ttft, itl = latency or resolve_latency(options)
+    abort_rate = options.abort_rate if options.abort_rate is not None else config.mock_abort_rate
+
+    tokens = tokenize(generate_mock_response(content))
+    abort_at = random.randrange(len(tokens)) if random.random() < abort_rate else -1
+    stream_id = f"mock-{random.randint(1000, 9999)}"
+    head = _stream_head(stream_id)
+
+    deadline = time.monotonic() + ttft.sample()
+    pending: List[bytes] = []
+    for i, token in enumerate(tokens):
+        if i == abort_at:
+            raise MockAborted("模拟上游中途断开")
+        pending.append(head + _encode_token(token))
+        if i > 0:
+            deadline += itl.sample()
+        delay = deadline - time.monotonic()
+        # 不到1ms的间隔不单独等待，与后续token合并为一次写出
+        if delay >= 0.001:
+            if len(pending) > 1:
+                yield b"".join(pending[:-1])
+                del pending[:-1]
+            await asyncio.sleep(delay)
+            yield pending.pop()
+    pending.append(_final_chunk(stream_id))
+    yield b"".join(pending)
 
 @router.post("/mock/chat/completions")
 async def mock_chat_completions(request: MockChatRequest):
@@ -106,18 +200,39 @@ async def mock_chat_completions(request: MockChatRequest):
         if not user_message:
             user_message = "默认消息"
         
-        logger.info(f"Mock LLM 收到请求: {user_message}")
+        logger.debug("Mock LLM 收到请求: %s", user_message)
+        
+        options = request.mock or MockOptions()
+        try:
+            latency = resolve_latency(options)
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"error": {"message": str(e), "type": "invalid_request_error"}})
+        error_rate = options.error_rate if options.error_rate is not None else config.mock_error_rate
+        timeout_rate = options.timeout_rate if options.timeout_rate is not None else config.mock_timeout_rate
+        roll = random.random()
+        if roll < error_rate:
+            return JSONResponse(
+                status_code=config.mock_error_status,
+                content={"error": {"message": "Mock注入的上游错误", "type": "mock_error"}}
+            )
+        if roll < error_rate + timeout_rate:
+            # 模拟上游无响应：挂起直到客户端超时断开
+            await asyncio.sleep(config.mock_timeout_s)
+            return JSONResponse(status_code=504, content={"error": {"message": "Mock注入的超时", "type": "mock_timeout"}})
         
         if request.stream:
-            # 流式响应
+            # 流式响应（预编码的SSE字节）
             return StreamingResponse(
-                stream_mock_response(user_message),
-                media_type="text/plain",
+                stream_mock_response(user_message, options, latency),
+                media_type="text/event-stream",
                 headers={"Cache-Control": "no-cache", "Connection": "keep-alive"}
             )
         else:
             # 非流式响应
             response_text = generate_mock_response(user_message)
+            tokens = tokenize(response_text)
+            ttft, itl = latency
+            await asyncio.sleep(ttft.sample() + itl.mean * max(len(tokens) - 1, 0))
             return {
                 "id": f"mock-{random.randint(1000, 9999)}",
                 "object": "chat.completion",
@@ -132,14 +247,14 @@ async def mock_chat_completions(request: MockChatRequest):
                     "finish_reason": "stop"
                 }],
                 "usage": {
-                    "prompt_tokens": len(user_message.split()),
-                    "completion_tokens": len(response_text.split()),
-                    "total_tokens": len(user_message.split()) + len(response_text.split())
+                    "prompt_tokens": len(tokenize(user_message)),
+                    "completion_tokens": len(tokens),
+                    "total_tokens": len(tokenize(user_message)) + len(tokens)
                 }
             }
             
     except Exception as e:
-        logger.error(f"Mock LLM 处理异常: {e}")
+        logger.error("Mock LLM 处理异常: %s", e)
         return {"error": {"message": f"Mock服务错误: {str(e)}", "type": "mock_error"}}
 
 @router.get("/mock/models")
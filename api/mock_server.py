@@ -0,0 +1,39 @@
+"""
+独立运行的模拟上游（ASR/TTS/LLM），接口路径与真实上游一致，便于在单机无网络环境下压测完整链路
+
+    python -m api.mock_server --port 9001
+
+然后在 .env 中指向该服务：
+    TRANSCRIBE_URL=http://127.0.0.1:9001/v1/audio/transcriptions
+    TRANSCRIBE_BATCH_URL=http://127.0.0.1:9001/v1/audio/transcriptions/batch
+    TTS_URL=http://127.0.0.1:9001/v1/audio/speech
+    LLM_URL=http://127.0.0.1:9001/v1/chat/completions
+"""
+import argparse
+import logging
+import uvicorn
+from fastapi import FastAPI
+from . import mock_audio, mock_llm
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="10KV AI Mock Upstreams", description="模拟ASR/TTS/LLM上游")
+app.include_router(mock_audio.router, prefix="/v1")
+app.add_api_route("/v1/chat/completions", mock_llm.mock_chat_completions, methods=["POST"])
+app.add_api_route("/v1/models", mock_llm.mock_models, methods=["GET"])
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟上游服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9001)
+    args = parser.parse_args()
+    base = f"http://{args.host}:{args.port}/v1"
+    print(f"TRANSCRIBE_URL={base}/audio/transcriptions")
+    print(f"TRANSCRIBE_BATCH_URL={base}/audio/transcriptions/batch")
+    print(f"TTS_URL={base}/audio/speech")
+    print(f"LLM_URL={base}/chat/completions")
+    # 关闭访问日志，避免压测时日志成为瓶颈
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,25 @@
 import httpx
 import asyncio
-import io
 import json
 import time
 import re
 import logging
+from contextlib import aclosing
+from collections import deque
+from typing import Deque, Optional, Tuple
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from starlette.websockets import WebSocketState
 from .config import get_settings, get_llm_headers
+from . import tracing, metrics, codec, content_filter, deadline, faq, asr_batcher
+from .sessions import RealtimeSession, parse_seq, registry
+from .asr_cache import asr_cache, cache_key
+from .singleflight import asr_realtime_flight, tts_stream_flight, request_key
+from .http_pool import get_http_client
+from .fillers import FillerGate
+from .ws_writer import FrameCoalescer
+from .buffers import BufferLimitError, max_utterance_bytes
 
 # 配置日志
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
@@ -22,6 +31,12 @@ config = get_settings()
 SPLIT_PATTERN = re.compile(r'[。！？.!?]')  # 简化标点符号匹配
 QUICK_SPLIT_PATTERN = re.compile(r'[，、；;：:，]')  # 快速分段的辅助符号
 
+# 实时链路使用的转录模型
+ASR_MODEL = "SenseVoiceSmall"
+
+# TTS上游未返回WAV文件头时按 24kHz/16bit/单声道 计算帧大小
+TTS_FALLBACK_BYTE_RATE = 24000 * 2
+
 # VAD改进：使用配置参数
 SILENCE_THRESHOLD = config.vad_silence_threshold
 SILENCE_DURATION = config.vad_silence_duration
@@ -74,89 +89,173 @@ async def safe_send_text(websocket: WebSocket, message: str):
             await websocket.send_text(message)
             return True
         except Exception as e:
-            logger.error(f"发送文本消息失败: {e}")
-            return False
-    return False
-
-async def safe_send_bytes(websocket: WebSocket, data: bytes):
-    """安全发送字节数据"""
-    if websocket.client_state == WebSocketState.CONNECTED:
-        try:
-            await websocket.send_bytes(data)
-            return True
-        except Exception as e:
-            logger.error(f"发送字节数据失败: {e}")
+            logger.error("发送文本消息失败: %s", e)
             return False
     return False
 
 async def transcribe_audio_with_retry(client: httpx.AsyncClient, audio_bytes: bytes, max_retries: int = 2):
-    """优化的音频转录：减少重试次数"""
+    """优化的音频转录：减少重试次数，相同音频直接命中缓存或合并到进行中的请求"""
+    with tracing.span("asr.transcribe", kind=tracing.SPAN_KIND_CLIENT, audio_bytes=len(audio_bytes)) as span:
+        key = cache_key(audio_bytes, ASR_MODEL)
+        if asr_cache is not None:
+            cached = await asr_cache.get(key)
+            span.set_attribute("cache_hit", cached is not None)
+            if cached is not None:
+                return cached.get("text", "").strip(), None
+        
+        return await asr_realtime_flight.do(key, lambda: _transcribe_upstream(client, audio_bytes, key, max_retries, span))
+
+async def _transcribe_upstream(client: httpx.AsyncClient, audio_bytes: bytes, key: str, max_retries: int, span):
+    """请求上游转录服务（带重试）"""
     for attempt in range(max_retries):
+        span.set_attribute("attempts", attempt + 1)
         try:
-            files = {'file': ('audio.wav', io.BytesIO(audio_bytes), 'audio/wav')}
-            data = {'model': 'SenseVoiceSmall'}
-            
-            response = await client.post(config.transcribe_url, files=files, data=data, timeout=config.transcribe_timeout)
-            response.raise_for_status()
+            # 超时取自适应超时与本轮剩余时间中较小的一个
+            timeout = deadline.timeout_for("asr", config.transcribe_timeout)
+            started = time.monotonic()
+            if asr_batcher.batching_enabled():
+                # 与其它会话的音频合并为一次批量请求
+                result = await asr_batcher.get_batcher().submit(audio_bytes, timeout)
+            else:
+                # 直接传入bytes，避免复制到BytesIO
+                files = {'file': ('audio.wav', audio_bytes, 'audio/wav')}
+                data = {'model': ASR_MODEL}
+                response = await client.post(config.transcribe_url, files=files, data=data, timeout=timeout)
+                response.raise_for_status()
+                result = response.json()
+            deadline.observe("asr", time.monotonic() - started)
+            if not isinstance(result, dict):
+                raise ValueError("转录服务返回格式错误")
+            result.setdefault("text", "")
             
-            result = response.json()
-            text = result.get("text", "").strip()
+            text = str(result["text"]).strip()
+            span.set_attribute("text_len", len(text))
+            # 与REST接口相同，缓存上游的完整响应
+            if asr_cache is not None:
+                await asr_cache.put(key, result)
             return text, None
             
+        except deadline.DeadlineExceeded as e:
+            span.set_error(str(e))
+            return None, f"转录失败: {e}"
         except Exception as e:
-            logger.warning(f"转录失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
+            logger.warning("转录失败 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+            if attempt == max_retries - 1 or not deadline.can_retry("asr", 0.2 * (attempt + 1)):
+                span.set_error(str(e))
                 return None, f"转录失败: {e}"
             await asyncio.sleep(0.2 * (attempt + 1))  # 减少等待时间
     
     return None, "转录失败: 达到最大重试次数"
 
-async def generate_tts_stream(client: httpx.AsyncClient, text: str, websocket: WebSocket):
-    """优化的TTS生成：减少重试，快速失败"""
+class TTSUpstreamError(Exception):
+    """TTS上游返回非200状态"""
+
+    def __init__(self, status_code: int, body: bytes):
+        super().__init__(f"TTS上游错误 (状态码: {status_code})")
+        self.status_code = status_code
+        self.body = body
+
+async def _open_tts_stream(client: httpx.AsyncClient, tts_payload: dict):
+    """打开TTS上游流并逐块返回音频数据"""
+    timeout = deadline.timeout_for("tts", config.tts_timeout)
+    started = time.monotonic()
+    async with client.stream("POST", config.tts_url, json=tts_payload, timeout=timeout) as tts_resp:
+        if tts_resp.status_code != 200:
+            raise TTSUpstreamError(tts_resp.status_code, await tts_resp.aread())
+        first = True
+        async for chunk in tts_resp.aiter_bytes():
+            if chunk:
+                if first:
+                    # 流式调用按首包时间估计上游延迟
+                    deadline.observe("tts", time.monotonic() - started)
+                    first = False
+                yield chunk
+
+async def generate_tts_stream(client: httpx.AsyncClient, text: str, session: RealtimeSession):
+    """优化的TTS生成：减少重试，快速失败；相同文本的并发合成共享同一上游流"""
     tts_payload = {
         "model": "CosyVoice2-0.5B",
         "input": text,
         "voice": "中文女声"
     }
     
-    try:
-        # 使用配置的超时时间
-        async with client.stream("POST", config.tts_url, json=tts_payload, timeout=config.tts_timeout) as tts_resp:
-            if tts_resp.status_code == 200:
-                logger.debug(f"TTS流式合成中: {text[:20]}...")
-                chunk_count = 0
-                async for chunk in tts_resp.aiter_bytes():
-                    if websocket.client_state != WebSocketState.CONNECTED:
-                        logger.info("WebSocket已断开，停止TTS流")
+    gate = session.audio_gate
+    coalescer = FrameCoalescer(config.ws_frame_ms, TTS_FALLBACK_BYTE_RATE)
+    with tracing.span("tts.segment", kind=tracing.SPAN_KIND_CLIENT, text_len=len(text)) as span:
+        try:
+            logger.debug("TTS流式合成中: %s...", text[:20])
+            chunk_count = 0
+            total_bytes = 0
+            frame_count = 0
+            chunks = tts_stream_flight.stream(request_key(tts_payload), lambda: _open_tts_stream(client, tts_payload))
+            # 与LLM流相同，整段合成和转发不超过本轮截止时间
+            async with deadline.enforce(), aclosing(chunks):
+                async for chunk in chunks:
+                    if not session.active:
+                        logger.info("会话已失效，停止TTS流")
+                        span.set_error("session expired")
                         return False
-                    if chunk:
-                        chunk_count += 1
-                        if not await safe_send_bytes(websocket, chunk):
+                    if chunk_count == 0:
+                        span.add_event("first_chunk")
+                        # 真实音频到达，裁剪正在播放的填充音
+                        if gate is not None:
+                            await gate.open()
+                    chunk_count += 1
+                    total_bytes += len(chunk)
+                    # 零碎的上游数据块合并为固定时长的帧；发送队列满时 send_bytes 会等待，暂停读取上游
+                    for frame in coalescer.feed(chunk):
+                        frame_count += 1
+                        if not await session.send_bytes(frame):
+                            span.set_error("session expired")
                             return False
-                        # 每发送几个chunk就让出控制权，避免阻塞
-                        if chunk_count % 5 == 0:
-                            await asyncio.sleep(0.001)
-                return True
-            else:
-                error_text = await tts_resp.aread()
-                logger.error(f"TTS失败 (状态码: {tts_resp.status_code}): {error_text}")
-                return False
-                
-    except asyncio.TimeoutError:
-        logger.warning(f"TTS请求超时: {text[:20]}...")
-        await safe_send_text(websocket, json.dumps({"error": "TTS生成超时"}))
+            rest = coalescer.flush()
+            if rest:
+                frame_count += 1
+                if not await session.send_bytes(rest):
+                    span.set_error("session expired")
+                    return False
+            span.set_attribute("frames", frame_count)
+            span.set_attribute("chunks", chunk_count)
+            span.set_attribute("audio_bytes", total_bytes)
+            return True
+        
+        except TTSUpstreamError as e:
+            logger.error("TTS失败 (状态码: %s): %s", e.status_code, e.body)
+            span.set_error(f"status {e.status_code}")
+            return False
+        except (asyncio.TimeoutError, deadline.DeadlineExceeded):
+            logger.warning("TTS请求超时: %s...", text[:20])
+            span.set_error("timeout")
+            await session.send_json({"error": "TTS生成超时"})
+            return False
+        except Exception as e:
+            logger.error("TTS请求失败: %s", e)
+            span.set_error(str(e))
+            await session.send_json({"error": f"TTS生成失败: {e}"})
+            return False
+        finally:
+            # 提前退出（会话失效/被打断/出错）时归还拼帧缓冲区
+            coalescer.close()
+
+def _segment_blocked(gate: Optional[content_filter.SegmentGate], start: int, end: int, seg: str, span) -> bool:
+    """内容过滤：命中关键词的分段不发送文本也不合成语音"""
+    if gate is None:
         return False
-    except Exception as e:
-        logger.error(f"TTS请求失败: {e}")
-        await safe_send_text(websocket, json.dumps({"error": f"TTS生成失败: {e}"}))
+    keyword = gate.check(start, end)
+    if keyword is None:
         return False
+    logger.info("LLM分段命中过滤关键词 '%s'，跳过播报: %s", keyword, seg)
+    span.add_event("segment_blocked", keyword=keyword, chars=len(seg))
+    metrics.inc("content_filter_blocked_total")
+    return True
 
-async def process_llm_stream_optimized(client: httpx.AsyncClient, text: str, websocket: WebSocket):
+async def process_llm_stream_optimized(client: httpx.AsyncClient, text: str, session: RealtimeSession):
     """优化的LLM流式处理"""
     llm_payload = {
         "model": "gpt-4o-ca",
         "messages": [
             {"role": "system", "content": "You are a helpful assistant. Respond naturally and conversationally."},
+            *session.recent_history(),
             {"role": "user", "content": text}
         ],
         "stream": True,
@@ -164,183 +263,366 @@ async def process_llm_stream_optimized(client: httpx.AsyncClient, text: str, web
         "temperature": config.llm_temperature  # 使用配置参数
     }
     
-    try:
-        async with client.stream("POST", config.llm_url, headers=get_llm_headers(), json=llm_payload, timeout=config.llm_timeout) as llm_resp:
-            if llm_resp.status_code != 200:
-                error_text = await llm_resp.aread()
-                error_msg = f"LLM API错误 (状态码: {llm_resp.status_code}): {error_text}"
-                logger.error(error_msg)
-                await safe_send_text(websocket, json.dumps({"error": error_msg}))
-                return False
+    # 用于控制TTS任务
+    tts_tasks = []
+    
+    with tracing.span("llm.stream", kind=tracing.SPAN_KIND_CLIENT, model=llm_payload["model"]) as span:
+        try:
+            llm_started = time.monotonic()
+            llm_timeout = deadline.timeout_for("llm", config.llm_timeout)
+            async with client.stream("POST", config.llm_url, headers={**get_llm_headers(), "Accept-Encoding": "identity"}, json=llm_payload, timeout=llm_timeout) as llm_resp:
+                if llm_resp.status_code != 200:
+                    error_text = await llm_resp.aread()
+                    error_msg = f"LLM API错误 (状态码: {llm_resp.status_code}): {error_text}"
+                    logger.error(error_msg)
+                    span.set_error(f"status {llm_resp.status_code}")
+                    await session.send_json({"error": error_msg})
+                    return False
             
-            llm_accum = ""
-            last_idx = 0
-            logger.debug("LLM流式输出中...")
+                llm_accum = ""
+                last_idx = 0
+                logger.debug("LLM流式输出中...")
             
-            # 用于控制TTS任务
-            tts_tasks = []
-            segment_count = 0
+                segment_count = 0
+                segment_time = 0.0  # 分段耗时累计（用于定位慢轮次）
+                gate = content_filter.new_gate()
+                # 已切出、等待过滤检查的分段 (文本, 起始位置, 结束位置)：开启内容过滤时，
+                # 分段末尾之后还要再到达若干字符才能确定没有跨越边界的关键词
+                queued: Deque[Tuple[str, int, int]] = deque()
+
+                async def release(final: bool) -> bool:
+                    """按顺序发送已可检查的分段（final 为真时发送全部）；返回 False 表示应停止"""
+                    nonlocal segment_count
+                    while queued and (final or gate is None or gate.settled(queued[0][2])):
+                        seg, seg_start, seg_end = queued.popleft()
+                        if not session.active:
+                            return False
+                        if not seg.strip() or _segment_blocked(gate, seg_start, seg_end, seg, span):  # 确保不发送空段
+                            continue
+                        logger.debug("LLM分段 #%s: %s", segment_count, seg)
+                        span.add_event("segment", index=segment_count, chars=len(seg))
+                        segment_count += 1
+
+                        # 发送LLM文本
+                        if not await session.send_json({"type": "llm", "text": seg}):
+                            return False
+
+                        # 并发处理TTS，不等待完成
+                        tts_task = asyncio.create_task(generate_tts_stream(client, seg, session))
+                        tts_tasks.append(tts_task)
+
+                        # 使用配置的并发限制
+                        if len(tts_tasks) > config.max_concurrent_tts:
+                            # 等待最早的任务完成
+                            await tts_tasks.pop(0)
+                    return True
             
-            async for line in llm_resp.aiter_lines():
-                if websocket.client_state != WebSocketState.CONNECTED:
-                    logger.info("WebSocket已断开，终止LLM流式处理")
-                    break
+                parser = codec.SSEDeltaParser()
+                # 请求时声明 identity 编码，原始字节即SSE文本；上游仍压缩时退回解压后的字节流
+                if llm_resp.headers.get("content-encoding", "identity") == "identity":
+                    chunks = llm_resp.aiter_raw()
+                else:
+                    chunks = llm_resp.aiter_bytes()
+                # 上游持续缓慢输出时单次读取不会超时，整体耗时按本轮截止时间限制
+                async with deadline.enforce():
+                    async for chunk in chunks:
+                        if not session.active:
+                            logger.info("会话已失效，终止LLM流式处理")
+                            break
                     
-                if not line.strip():
-                    continue
-                if line.startswith("data:"):
-                    data = line[5:].strip()
-                    if data == "[DONE]":
-                        break
-                    try:
-                        obj = json.loads(data)
-                        choices = obj.get("choices", [])
-                        if not choices or "delta" not in choices[0]:
-                            continue
-                        delta = choices[0]["delta"].get("content", "")
-                        if delta:
-                            llm_accum += delta
-                            # 使用优化的分段策略
-                            force_quick = segment_count > 0  # 第一段之后使用快速分段
-                            segs, new_last_idx = optimized_segment(llm_accum, last_idx, force_quick)
-                            last_idx = new_last_idx
-                            
-                            for seg in segs:
-                                if websocket.client_state != WebSocketState.CONNECTED:
+                        for delta in parser.feed(chunk):
+                            try:
+                                if not llm_accum:
+                                    span.add_event("first_token")
+                                    deadline.observe("llm", time.monotonic() - llm_started)
+                                llm_accum += delta
+                                if gate is not None:
+                                    gate.feed(delta)
+                                # 使用优化的分段策略
+                                force_quick = last_idx > 0  # 第一段之后使用快速分段
+                                seg_t0 = time.perf_counter()
+                                segs, new_last_idx = optimized_segment(llm_accum, last_idx, force_quick)
+                                segment_time += time.perf_counter() - seg_t0
+                                # 分段已去掉首尾空白，按各自在累计文本中的实际位置做过滤检查
+                                seg_end = last_idx
+                                for seg in segs:
+                                    seg_start = llm_accum.index(seg, seg_end)
+                                    seg_end = seg_start + len(seg)
+                                    queued.append((seg, seg_start, seg_end))
+                                last_idx = new_last_idx
+
+                                if not await release(False):
                                     break
-                                if seg.strip():  # 确保不发送空段
-                                    logger.debug(f"LLM分段 #{segment_count}: {seg}")
-                                    segment_count += 1
-                                    
-                                    # 发送LLM文本
-                                    if not await safe_send_text(websocket, json.dumps({"type": "llm", "text": seg})):
-                                        break
-                                    
-                                    # 并发处理TTS，不等待完成
-                                    tts_task = asyncio.create_task(generate_tts_stream(client, seg, websocket))
-                                    tts_tasks.append(tts_task)
-                                    
-                                    # 使用配置的并发限制
-                                    if len(tts_tasks) > config.max_concurrent_tts:
-                                        # 等待最早的任务完成
-                                        await tts_tasks.pop(0)
-                                    
-                    except json.JSONDecodeError as e:
-                        logger.warning(f"解析LLM流式数据出错: {e}")
-                        continue
-                    except Exception as e:
-                        logger.error(f"处理LLM流式数据出错: {e}")
-                        continue
+                            except Exception as e:
+                                logger.error("处理LLM流式数据出错: %s", e)
+                        if parser.done:
+                            break
             
-            # 处理最后一段未分割的内容
-            if last_idx < len(llm_accum) and websocket.client_state == WebSocketState.CONNECTED:
-                seg = llm_accum[last_idx:].strip()
-                if seg:
-                    logger.debug(f"LLM尾段: {seg}")
-                    if await safe_send_text(websocket, json.dumps({"type": "llm", "text": seg})):
-                        tts_task = asyncio.create_task(generate_tts_stream(client, seg, websocket))
-                        tts_tasks.append(tts_task)
+                # 流已结束：发送仍在等待检查的分段和最后一段未分割的内容
+                tail = llm_accum[last_idx:].strip()
+                if tail:
+                    seg_start = llm_accum.index(tail, last_idx)
+                    queued.append((tail, seg_start, seg_start + len(tail)))
+                await release(True)
             
-            # 等待所有TTS任务完成（设置超时）
-            if tts_tasks:
-                try:
-                    await asyncio.wait_for(asyncio.gather(*tts_tasks, return_exceptions=True), timeout=10.0)
-                except asyncio.TimeoutError:
-                    logger.warning("部分TTS任务超时")
+                span.set_attribute("llm_chars", len(llm_accum))
+                span.set_attribute("segments", segment_count)
+                span.set_attribute("segment_ms", round(segment_time * 1000, 3))
             
-            return True
+                # 等待所有TTS任务完成（最多等到本轮截止时间，未完成的在finally中取消）
+                if tts_tasks:
+                    left = deadline.remaining()
+                    _, late = await asyncio.wait(tts_tasks, timeout=max(left, 0) if left is not None else 10.0)
+                    if late:
+                        logger.warning("部分TTS任务超时")
+                        span.set_error("tts wait timeout")
             
-    except asyncio.TimeoutError:
-        logger.error("LLM请求超时")
-        await safe_send_text(websocket, json.dumps({"error": "LLM处理超时"}))
-        return False
-    except Exception as e:
-        logger.error(f"LLM流式处理失败: {e}")
-        await safe_send_text(websocket, json.dumps({"error": f"LLM处理失败: {e}"}))
+                session.add_turn(text, llm_accum)
+                return True
+            
+        except (asyncio.TimeoutError, deadline.DeadlineExceeded):
+            logger.error("LLM请求超时")
+            span.set_error("timeout")
+            await session.send_json({"error": "LLM处理超时"})
+            return False
+        except Exception as e:
+            logger.error("LLM流式处理失败: %s", e)
+            span.set_error(str(e))
+            await session.send_json({"error": f"LLM处理失败: {e}"})
+            return False
+        except asyncio.CancelledError:
+            # 被打断：LLM流已随上下文退出关闭，剩余TTS任务在finally中取消
+            span.set_attribute("interrupted", True)
+            raise
+        finally:
+            # 取消尚未完成的TTS任务，立即关闭其上游流、释放连接池
+            pending = [t for t in tts_tasks if not t.done()]
+            for t in pending:
+                t.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                metrics.inc("barge_in_cancelled_tts_total", len(pending))
+
+async def answer_from_faq(client: httpx.AsyncClient, text: str, entry: faq.FAQEntry, session: RealtimeSession) -> bool:
+    """命中FAQ：直接下发预置答案和预合成音频（音频尚未合成时走实时TTS）"""
+    with tracing.span("faq.answer", question=entry.question, cached_audio=entry.audio is not None) as span:
+        if not await session.send_json({"type": "llm", "text": entry.answer, "source": "faq"}):
+            return False
+        if entry.audio is None:
+            success = await generate_tts_stream(client, entry.answer, session)
+        else:
+            # 与TTS流相同的分帧方式，发送队列满时 send_bytes 会等待
+            coalescer = FrameCoalescer(config.ws_frame_ms, TTS_FALLBACK_BYTE_RATE)
+            frames = coalescer.feed(entry.audio)
+            rest = coalescer.flush()
+            if rest:
+                frames.append(rest)
+            success = True
+            for frame in frames:
+                if not await session.send_bytes(frame):
+                    span.set_error("session expired")
+                    success = False
+                    break
+            span.set_attribute("frames", len(frames))
+        session.add_turn(text, entry.answer)
+        return success
+
+async def run_realtime_turn(client: httpx.AsyncClient, audio_bytes: bytes, session: RealtimeSession):
+    """处理一轮对话：转录 -> LLM+TTS流式输出（每轮对应一个trace）"""
+    try:
+        session.budget.reserve(len(audio_bytes), "音频")
+    except BufferLimitError as e:
+        logger.warning("会话 %s %s", session.session_id, e)
+        await session.send_json({"error": str(e), "code": "session_memory_limit"})
+        return
+    # 本轮所有上游调用（及其派生的TTS任务）共享同一个截止时间
+    with deadline.scope(config.turn_deadline_s), \
+            tracing.start_trace("realtime.turn", audio_bytes=len(audio_bytes), session_id=session.session_id) as trace:
+        # 1. 异步转录（优化重试）
+        t0 = time.time()
+        try:
+            text, error = await transcribe_audio_with_retry(client, audio_bytes)
+        finally:
+            # 转录完成后音频不再占用会话内存额度
+            session.budget.release(len(audio_bytes))
+        t1 = time.time()
+        
+        if error:
+            logger.error(error)
+            await session.send_json({"error": error})
+            return
+        
+        if not text or len(text.strip()) < 2:
+            logger.debug("转录结果为空或过短: '%s'，跳过此次处理", text)
+            await session.send_json({"type": "transcription", "text": ""})
+            return
+        
+        logger.info("转录成功: '%s' (耗时: %.2fs)", text, t1-t0)
+        await session.send_json({"type": "transcription", "text": text})
+        
+        # 2. 生成回答
+        await _answer(client, text, session, trace)
+    
+    # 根span结束后发送本轮耗时摘要
+    if trace is not None and config.trace_summary_frame:
+        await session.send_json(trace.summary())
+
+async def run_text_turn(client: httpx.AsyncClient, text: str, session: RealtimeSession):
+    """处理一轮文本输入的对话：跳过转录，直接进入 LLM+TTS 流式输出"""
+    with deadline.scope(config.turn_deadline_s), \
+            tracing.start_trace("realtime.text_turn", text_len=len(text), session_id=session.session_id) as trace:
+        logger.info("收到文本输入: '%s'", text)
+        await _answer(client, text, session, trace)
+    
+    if trace is not None and config.trace_summary_frame:
+        await session.send_json(trace.summary())
+
+async def _answer(client: httpx.AsyncClient, text: str, session: RealtimeSession, trace):
+    """常见问题直接使用本地答案，不经过LLM；其余走LLM+TTS"""
+    entry = faq.lookup(text)
+    if entry is not None:
+        logger.info("命中FAQ: '%s'", entry.question)
+        await answer_from_faq(client, text, entry, session)
+    else:
+        await _answer_with_llm(client, text, session, trace)
+
+async def _answer_with_llm(client: httpx.AsyncClient, text: str, session: RealtimeSession, trace):
+    """LLM+TTS流式回答（预计首包较慢时先播放填充音）"""
+    gate = FillerGate(session)
+    session.audio_gate = gate
+    if gate.maybe_play() and trace is not None:
+        trace.root.add_event("filler_started")
+    t0 = time.time()
+    try:
+        success = await process_llm_stream_optimized(client, text, session)
+    finally:
+        await gate.close()
+        session.audio_gate = None
+    t1 = time.time()
+    
+    if success:
+        logger.info("LLM+TTS全流程耗时: %.2fs", t1-t0)
+    else:
+        logger.warning("LLM+TTS处理失败")
+
+async def barge_in(session: RealtimeSession, reason: str) -> bool:
+    """打断进行中的回答：取消LLM流和所有TTS任务，通知客户端停止播放"""
+    if not await session.interrupt():
         return False
+    logger.info("回答被打断 (会话: %s, 原因: %s)", session.session_id, reason)
+    metrics.inc("barge_in_total")
+    await session.send_json({"type": "stop_playback", "reason": reason})
+    return True
 
 @router.websocket("/ws/realtime")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, session_id: Optional[str] = None, last_seq: Optional[int] = None):
+    """实时语音对话
+
+    二进制消息为一段语音；文本消息 {"type": "text", "text": ...} 为文本输入，跳过转录直接生成语音回答。
+    连接参数 session_id / last_seq 用于断线重连：服务端保留会话 session_ttl 秒，
+    重连后从 last_seq 之后的帧继续发送（进行中的回答不会重新生成）。
+    """
     await websocket.accept()
-    logger.info("WebSocket 连接已建立")
     
-    # 使用配置的超时和连接参数
-    timeout = httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=5.0)
-    limits = httpx.Limits(max_connections=config.http_max_connections)
-    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
-        try:
-            while True:
-                logger.debug("等待接收消息...")
+    session = registry.get(session_id) if session_id else None
+    if session is not None:
+        # 未携带 last_seq 时从客户端最后确认的帧继续
+        resume_from = last_seq if last_seq is not None else session.acked_seq
+        replayed = await session.attach(websocket, resume_from)
+        logger.info("WebSocket 连接已恢复 (会话: %s, 重放帧数: %s)", session.session_id, replayed)
+    else:
+        session = registry.create()
+        await session.attach(websocket)
+        logger.info("WebSocket 连接已建立 (会话: %s)", session.session_id)
+    
+    # 上游请求使用共享连接池：会话级任务（断线后仍在生成的回答、被合并的TTS流）不依赖单个连接的生命周期
+    client = get_http_client()
+    try:
+        while True:
+            logger.debug("等待接收消息...")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            
+            if message.get("text") is not None:
+                # 文本消息为控制消息（ping/ack/interrupt）或文本输入（text）
                 try:
-                    # 尝试接收文本消息（可能是ping）
-                    message = await websocket.receive_text()
-                    # 处理ping消息
-                    try:
-                        msg_data = json.loads(message)
-                        if msg_data.get('type') == 'ping':
-                            # 响应ping消息
-                            await safe_send_text(websocket, json.dumps({"type": "ping", "timestamp": msg_data.get('timestamp')}))
-                            continue
-                    except json.JSONDecodeError:
-                        logger.warning(f"收到无效JSON消息: {message}")
-                        continue
-                except:
-                    # 如果不是文本消息，尝试接收音频数据
-                    audio_bytes = await websocket.receive_bytes()
-                    logger.debug(f"收到音频分片，长度: {len(audio_bytes)}")
-                    
-                    # 检查音频数据有效性
-                    if len(audio_bytes) == 0:
-                        logger.warning("收到空音频数据，跳过处理")
-                        continue
-                
-                # 使用配置的音频大小过滤
-                if len(audio_bytes) < config.min_audio_size:
-                    logger.debug(f"音频数据过小，当前大小: {len(audio_bytes)}, 最小要求: {config.min_audio_size}，跳过处理")
+                    msg_data = json.loads(message["text"])
+                except json.JSONDecodeError:
+                    logger.warning("收到无效JSON消息: %s", message['text'])
                     continue
-                
-                logger.info(f"✅ 音频数据大小合适: {len(audio_bytes)} 字节，开始处理...")
-                
-                # 1. 异步转录（优化重试）
-                t0 = time.time()
-                text, error = await transcribe_audio_with_retry(client, audio_bytes)
-                t1 = time.time()
-                
-                if error:
-                    logger.error(error)
-                    await safe_send_text(websocket, json.dumps({"error": error}))
-                    continue
-                
-                if not text or len(text.strip()) < 2:
-                    logger.debug(f"转录结果为空或过短: '{text}'，跳过此次处理")
-                    await safe_send_text(websocket, json.dumps({"type": "transcription", "text": ""}))
+                if not isinstance(msg_data, dict):
+                    logger.warning("收到非对象JSON消息，忽略: %s", message['text'])
                     continue
+                msg_type = msg_data.get('type')
+                if msg_type == 'ping':
+                    # 响应ping消息
+                    session.send_control({"type": "ping", "timestamp": msg_data.get('timestamp')})
+                elif msg_type == 'ack':
+                    seq = parse_seq(msg_data.get('seq'))
+                    if seq is None:
+                        logger.warning("收到无效的ack序号，忽略: %r", msg_data.get('seq'))
+                    else:
+                        session.ack(seq)
+                elif msg_type == 'interrupt':
+                    await barge_in(session, "interrupt")
+                elif msg_type == 'text':
+                    # 客户端已有文本（键盘输入或端侧识别）：跳过转录，与语音输入一样打断进行中的回答
+                    text = str(msg_data.get('text') or "").strip()
+                    if not text:
+                        await session.send_json({"error": "文本输入为空", "code": "empty_text"})
+                    elif len(text) > config.text_input_max_chars:
+                        await session.send_json({
+                            "error": f"文本过长: {len(text)} 字，上限 {config.text_input_max_chars} 字",
+                            "code": "text_too_long"
+                        })
+                    else:
+                        metrics.inc("realtime_text_turns_total")
+                        await barge_in(session, "text")
+                        session.start_turn(run_text_turn(client, text, session))
+                continue
+            
+            # 二进制消息为音频数据
+            audio_bytes = message.get("bytes") or b""
+            logger.debug("收到音频分片，长度: %s", len(audio_bytes))
+            
+            # 检查音频数据有效性
+            if len(audio_bytes) == 0:
+                logger.warning("收到空音频数据，跳过处理")
+                continue
+            
+            # 使用配置的音频大小过滤
+            if len(audio_bytes) < config.min_audio_size:
+                logger.debug("音频数据过小，当前大小: %s, 最小要求: %s，跳过处理", len(audio_bytes), config.min_audio_size)
+                continue
+            
+            if len(audio_bytes) > max_utterance_bytes():
+                logger.warning("音频数据过大: %s 字节，上限 %s 字节", len(audio_bytes), max_utterance_bytes())
+                await session.send_json({
+                    "error": f"音频过长: {len(audio_bytes)} 字节，单段语音上限 {max_utterance_bytes()} 字节",
+                    "code": "audio_too_large"
+                })
+                continue
+            
+            logger.debug("音频数据大小合适: %s 字节，开始处理", len(audio_bytes))
+            # 用户在回答过程中再次说话：先打断当前回答
+            await barge_in(session, "speech")
+            session.start_turn(run_realtime_turn(client, audio_bytes, session))
                 
-                logger.info(f"📝 转录成功: '{text}' (耗时: {t1-t0:.2f}s)")
-                await safe_send_text(websocket, json.dumps({"type": "transcription", "text": text}))
-                
-                # 2. 优化的LLM+TTS流式处理
-                t0 = time.time()
-                success = await process_llm_stream_optimized(client, text, websocket)
-                t1 = time.time()
-                
-                if success:
-                    logger.info(f"LLM+TTS全流程耗时: {t1-t0:.2f}s")
-                else:
-                    logger.warning("LLM+TTS处理失败")
-                    
-        except WebSocketDisconnect:
-            logger.info("WebSocket 连接已断开")
-        except Exception as e:
-            logger.error(f"WebSocket处理异常: {e}")
+    except WebSocketDisconnect:
+        logger.info("WebSocket 连接已断开 (会话: %s)", session.session_id)
+    except Exception as e:
+        logger.error("WebSocket处理异常: %s", e)
+        try:
+            await safe_send_text(websocket, codec.dumps({"error": f"服务器内部错误: {str(e)}"}))
+        except:
+            pass  # 如果连接已断开，忽略发送错误
+    finally:
+        # 会话在保留期内等待重连，进行中的回答继续缓存
+        session.detach(websocket)
+        if websocket.client_state == WebSocketState.CONNECTED:
             try:
-                await safe_send_text(websocket, json.dumps({"error": f"服务器内部错误: {str(e)}"}))
+                await websocket.close()
             except:
-                pass  # 如果连接已断开，忽略发送错误
-        finally:
-            if websocket.client_state == WebSocketState.CONNECTED:
-                try:
-                    await websocket.close()
-                except:
-                    pass
-            logger.info("WebSocket连接已清理") 
\ No newline at end of file
+                pass
+        logger.info("WebSocket连接已清理")
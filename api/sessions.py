@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import secrets
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple, Union
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+from .config import get_settings
+from . import codec
+from .ws_writer import ConnectionWriter
+from .buffers import SessionBudget, message_size
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+Frame = Tuple[int, Union[str, bytes]]
+
+def parse_seq(value) -> Optional[int]:
+    """校验客户端上报的帧序号：必须为非负整数，否则返回None"""
+    if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+        return None
+    return value
+
+class RealtimeSession:
+    """实时对话会话
+
+    每个下行的文本/音频帧都分配递增序号并保留在重放缓冲区中：文本帧携带 seq 字段，
+    二进制帧的序号为前一帧序号+1。客户端通过 {"type": "ack", "seq": N} 确认已收到的帧。
+    连接断开后会话在 session_ttl 秒内保留，进行中的回答继续生成并缓存，
+    客户端带 session_id 和 last_seq 重连即可从最后确认的帧继续接收。
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.history: List[dict] = []  # 已完成的对话轮次 (role/content)
+        self.frames: Deque[Frame] = deque(maxlen=config.session_replay_frames)
+        self.last_seq = 0  # 最后分配的帧序号
+        self.delivered_seq = 0  # 最后成功发送给客户端的帧序号
+        self.acked_seq = 0  # 客户端最后确认的帧序号
+        self.websocket: Optional[WebSocket] = None
+        self.detached_at: Optional[float] = time.monotonic()
+        self.turn_task: Optional[asyncio.Task] = None
+        self.turn_start_seq = 0  # 当前回答开始前最后分配的帧序号，打断时据此清除该回答的音频
+        self.audio_gate = None  # 本轮回答的首包音频闸门（见 fillers.FillerGate）
+        self.writer: Optional[ConnectionWriter] = None  # 当前连接的下行发送任务
+        self.budget = SessionBudget(session_id, config.ws_max_size)  # 待转录音频 + 重放缓冲区的内存记账
+        self.closed = False
+
+    @property
+    def expired(self) -> bool:
+        """断开时间超过保留期"""
+        if self.closed:
+            return True
+        return self.websocket is None and time.monotonic() - self.detached_at > config.session_ttl
+
+    @property
+    def active(self) -> bool:
+        """会话仍然有效：已连接，或断开后仍在保留期内（此时继续生成并缓存输出）"""
+        return not self.expired
+
+    @property
+    def turn_active(self) -> bool:
+        return self.turn_task is not None and not self.turn_task.done()
+
+    async def attach(self, websocket: WebSocket, last_seq: Optional[int] = None) -> int:
+        """绑定新的连接；last_seq 不为空时重放客户端未收到的帧，返回重放的帧数"""
+        old = self.websocket
+        if self.writer is not None:
+            self.writer.stop()
+        self.websocket = websocket
+        self.detached_at = None
+        self.writer = ConnectionWriter(websocket, self._on_sent, self._on_writer_closed)
+        # 会话帧和重放帧先于之后产生的帧入队，保证顺序
+        self.writer.enqueue(None, codec.dumps({
+            "type": "session",
+            "session_id": self.session_id,
+            "resumed": last_seq is not None,
+            "last_seq": self.last_seq,
+            "turn_active": self.turn_active
+        }))
+        replayed = 0
+        if last_seq is not None:
+            self.ack(last_seq)
+            if self.frames and self.frames[0][0] > last_seq + 1:
+                logger.warning("会话 %s 重放缓冲区不足，缺失帧 %s-%s", self.session_id, last_seq + 1, self.frames[0][0] - 1)
+            for seq, message in self.frames:
+                if seq > last_seq:
+                    self.writer.enqueue(seq, message)
+                    replayed += 1
+        # 同一会话的旧连接（客户端换网后未及时断开）直接关闭
+        if old is not None and old is not websocket and old.client_state == WebSocketState.CONNECTED:
+            try:
+                await old.close(code=4000)
+            except Exception:
+                pass
+        return replayed
+
+    def detach(self, websocket: WebSocket):
+        """解除连接绑定（仅当当前绑定的就是该连接时），开始计算保留期"""
+        if self.websocket is websocket:
+            self.websocket = None
+            self.detached_at = time.monotonic()
+            if self.writer is not None:
+                writer, self.writer = self.writer, None
+                writer.stop()
+
+    def ack(self, seq: int):
+        """客户端确认已收到 seq 及之前的所有帧，释放重放缓冲区"""
+        # 超过已分配序号的确认按最后一帧处理，避免之后生成的帧未发送就被当作已确认
+        seq = min(seq, self.last_seq)
+        if seq > self.acked_seq:
+            self.acked_seq = seq
+        while self.frames and self.frames[0][0] <= self.acked_seq:
+            _, message = self.frames.popleft()
+            self.budget.release(message_size(message))
+
+    async def send_json(self, payload: dict) -> bool:
+        """发送带序号的文本帧；返回 False 表示会话已失效，应停止生成"""
+        self.last_seq += 1
+        payload["seq"] = self.last_seq
+        message = codec.dumps(payload)
+        self._remember(self.last_seq, message)
+        return await self._deliver(self.last_seq, message)
+
+    async def send_bytes(self, data: bytes) -> bool:
+        """发送音频帧；返回 False 表示会话已失效，应停止生成"""
+        self.last_seq += 1
+        self._remember(self.last_seq, data)
+        return await self._deliver(self.last_seq, data)
+
+    def _remember(self, seq: int, message: Union[str, bytes]):
+        """放入重放缓冲区；超过帧数或会话内存上限时丢弃最早的帧"""
+        if len(self.frames) == self.frames.maxlen:
+            self.budget.release(message_size(self.frames[0][1]))
+        self.frames.append((seq, message))
+        self.budget.charge(message_size(message))
+        while self.budget.over_limit() and len(self.frames) > 1:
+            _, old = self.frames.popleft()
+            self.budget.release(message_size(old))
+
+    def send_control(self, payload: dict):
+        """发送不参与序号和重放的控制帧（如ping响应）"""
+        if self.writer is not None:
+            self.writer.enqueue(None, codec.dumps(payload))
+
+    async def _deliver(self, seq: int, message: Union[str, bytes]) -> bool:
+        # 放入当前连接的发送队列；队列超过高水位时在此等待，从而暂停上游读取
+        writer = self.writer
+        if writer is not None and writer.enqueue(seq, message):
+            await writer.wait_writable()
+        return self.active
+
+    def _on_sent(self, seq: int):
+        self.delivered_seq = seq
+
+    def _on_writer_closed(self, writer: ConnectionWriter):
+        if self.writer is writer:
+            logger.info("会话 %s 连接已断开，缓存输出等待重连", self.session_id)
+            self.detach(writer.websocket)
+
+    def add_turn(self, user_text: str, assistant_text: str):
+        """记录一轮完成的对话"""
+        self.history.append({"role": "user", "content": user_text})
+        self.history.append({"role": "assistant", "content": assistant_text})
+        # 只保留最近的若干轮，避免会话状态无限增长
+        max_messages = max(config.session_history_turns, 1) * 2
+        if len(self.history) > max_messages:
+            del self.history[:-max_messages]
+
+    def recent_history(self) -> List[dict]:
+        """用于LLM上下文的历史消息（session_history_turns 为0时不携带）"""
+        if config.session_history_turns <= 0:
+            return []
+        return self.history[-config.session_history_turns * 2:]
+
+    def start_turn(self, coro) -> asyncio.Task:
+        """在会话级任务中执行一轮对话：连接断开不会中断进行中的回答，接收循环也不被阻塞"""
+        self.turn_start_seq = self.last_seq
+        self.turn_task = asyncio.create_task(coro)
+        return self.turn_task
+
+    async def interrupt(self) -> bool:
+        """取消进行中的回答并等待其清理完成，返回是否确实有回答被打断
+
+        被打断回答的音频帧从发送队列和重放缓冲区中清除：尚未发出的不再发送，重连时也不再重放。
+        文本帧（转录、LLM分段）保留，客户端仍能看到被打断前的内容。
+        """
+        task = self.turn_task
+        if task is None or task.done():
+            return False
+        task.cancel()
+        await asyncio.wait({task})
+        self._purge_audio(self.turn_start_seq)
+        return True
+
+    def _purge_audio(self, after_seq: int):
+        """清除序号大于 after_seq 的音频帧"""
+        def stale(seq: Optional[int], message: Union[str, bytes]) -> bool:
+            return seq is not None and seq > after_seq and isinstance(message, bytes)
+
+        kept: Deque[Frame] = deque(maxlen=self.frames.maxlen)
+        purged = 0
+        for seq, message in self.frames:
+            if stale(seq, message):
+                self.budget.release(len(message))
+                purged += 1
+            else:
+                kept.append((seq, message))
+        self.frames = kept
+        dropped = self.writer.discard(stale) if self.writer is not None else 0
+        logger.debug("会话 %s 清除被打断回答的音频: 重放缓冲区 %s 帧，发送队列 %s 帧", self.session_id, purged, dropped)
+
+    def close(self):
+        self.closed = True
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        if self.turn_active:
+            self.turn_task.cancel()
+        self.frames.clear()
+        self.budget.close()
+
+class SessionRegistry:
+    """服务端会话注册表（按TTL清理断开的会话）"""
+
+    def __init__(self):
+        self._sessions: Dict[str, RealtimeSession] = {}
+        self._last_sweep = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self) -> RealtimeSession:
+        self._maybe_sweep()
+        session = RealtimeSession(secrets.token_urlsafe(16))
+        self._sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id: str) -> Optional[RealtimeSession]:
+        """获取未过期的会话"""
+        self._maybe_sweep()
+        session = self._sessions.get(session_id)
+        if session is not None and session.expired:
+            self.remove(session)
+            return None
+        return session
+
+    def remove(self, session: RealtimeSession):
+        session.close()
+        self._sessions.pop(session.session_id, None)
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep < config.session_sweep_interval:
+            return
+        self._last_sweep = now
+        for session in [s for s in self._sessions.values() if s.expired]:
+            logger.info("会话 %s 已过期，清理", session.session_id)
+            self.remove(session)
+
+# 全局会话注册表
+registry = SessionRegistry()
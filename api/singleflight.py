@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+from .config import get_settings
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+T = TypeVar("T")
+
+def request_key(payload: dict) -> str:
+    """按请求内容生成合并用的key"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """合并并发的相同请求：同一key同时只有一个上游调用，其余调用者共享其结果
+
+    上游调用在独立任务中执行，单个调用者取消不会影响其他调用者；
+    所有调用者都取消后上游调用随之取消。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        if not config.singleflight_enabled:
+            return await fn()
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            metrics.inc(f"singleflight_{self.name}_upstream_total")
+        else:
+            metrics.inc(f"singleflight_{self.name}_shared_total")
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+
+    def _forget(self, key: str, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+class _Broadcast:
+    """一路上游流的已收数据及订阅者"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self._notify()
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.done = True
+        self.error = error
+        self._notify()
+
+    def _notify(self):
+        # 唤醒所有等待者，并为下一批数据换一个新的事件
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def iterate(self) -> AsyncIterator[bytes]:
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._changed.wait()
+
+class StreamFlight:
+    """流式请求合并：后加入的调用者先重放已收到的数据块，再跟随实时流
+
+    调用方应通过 contextlib.aclosing 使用返回的迭代器，以便提前退出时立即释放订阅；
+    最后一个订阅者退出时上游流被取消，连接随即关闭。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._streams: Dict[str, _Broadcast] = {}
+
+    async def stream(self, key: str, open_stream: Callable[[], AsyncIterator[bytes]]) -> AsyncIterator[bytes]:
+        if not config.singleflight_enabled:
+            # 提前退出或被取消时立即关闭上游流，不等垃圾回收
+            upstream = open_stream()
+            try:
+                async for chunk in upstream:
+                    yield chunk
+            finally:
+                await upstream.aclose()
+            return
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            broadcast = _Broadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.create_task(self._pump(key, broadcast, open_stream))
+            metrics.inc(f"singleflight_{self.name}_upstream_total")
+        else:
+            metrics.inc(f"singleflight_{self.name}_shared_total")
+        broadcast.subscribers += 1
+        try:
+            async for chunk in broadcast.iterate():
+                yield chunk
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                self._forget(key, broadcast)
+                broadcast.task.cancel()
+
+    async def _pump(self, key: str, broadcast: _Broadcast, open_stream: Callable[[], AsyncIterator[bytes]]):
+        try:
+            async for chunk in open_stream():
+                broadcast.publish(chunk)
+            broadcast.finish()
+        except asyncio.CancelledError:
+            broadcast.finish(RuntimeError("上游流已取消"))
+            raise
+        except Exception as e:
+            broadcast.finish(e)
+        finally:
+            # 流结束后新请求重新发起上游调用
+            self._forget(key, broadcast)
+
+    def _forget(self, key: str, broadcast: _Broadcast):
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+# 全局合并器（按上游区分）
+# 同一个合并器内的调用必须返回相同类型的结果：实时链路返回 (text, error)，REST接口返回上游响应dict，
+# 两者的key相同（同一段音频），因此分开合并
+asr_flight = SingleFlight("asr")
+asr_realtime_flight = SingleFlight("asr_realtime")
+tts_flight = SingleFlight("tts")
+tts_stream_flight = StreamFlight("tts_stream")
+llm_flight = SingleFlight("llm")
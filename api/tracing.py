@@ -0,0 +1,294 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+from .config import get_settings
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+# OTLP span kind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+# OTLP status code
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+SERVICE_NAME = "10kv-ai"
+
+class Trace:
+    """一次对话轮次或一次REST请求对应的trace"""
+    __slots__ = ("trace_id", "name", "root", "spans")
+
+    def __init__(self, name: str):
+        self.trace_id = secrets.token_hex(16)
+        self.name = name
+        self.root: Optional["Span"] = None
+        # 已结束span的耗时记录，用于生成本轮耗时摘要
+        self.spans: List[Dict[str, Any]] = []
+
+    def summary(self) -> dict:
+        """生成本轮耗时摘要（按span结束顺序）"""
+        total_ms = self.root.duration_ms() if self.root else None
+        return {
+            "type": "timing",
+            "trace_id": self.trace_id,
+            "total_ms": total_ms,
+            "spans": list(self.spans)
+        }
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+_current_span_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_span_id", default=None)
+
+def _otlp_value(value: Any) -> dict:
+    """转换为OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+class Span:
+    """单个span，结束时提交给后台写入线程"""
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "attributes",
+                 "events", "status_code", "status_message", "start_ns", "end_ns", "deferred")
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes
+        self.events: List[dict] = []
+        self.status_code = STATUS_OK
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.deferred = False
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        """记录span内的时间点，例如LLM首token、TTS首包"""
+        self.events.append({
+            "timeUnixNano": str(time.time_ns()),
+            "name": name,
+            "attributes": _otlp_attributes(attributes)
+        })
+
+    def set_error(self, message: str):
+        self.status_code = STATUS_ERROR
+        self.status_message = message
+
+    def elapsed_ms(self) -> float:
+        """从span开始到现在的耗时"""
+        return (time.time_ns() - self.start_ns) / 1e6
+
+    def duration_ms(self) -> Optional[float]:
+        if self.end_ns is None:
+            return None
+        return round((self.end_ns - self.start_ns) / 1e6, 2)
+
+    def defer_end(self):
+        """退出 span() 上下文时不结束，由调用方稍后调用 end()（如流式响应体发送完毕时）"""
+        self.deferred = True
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        self.trace.spans.append({"name": self.name, "duration_ms": self.duration_ms(), "ok": self.status_code == STATUS_OK})
+        _writer.submit(self.to_otlp())
+
+    def to_otlp(self) -> dict:
+        record = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "events": self.events,
+            "status": {"code": self.status_code, "message": self.status_message}
+        }
+        if self.parent_id:
+            record["parentSpanId"] = self.parent_id
+        return record
+
+class _NoopSpan:
+    """追踪关闭或当前无trace时使用的空span"""
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, **attributes):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def elapsed_ms(self) -> float:
+        return 0.0
+
+_NOOP_SPAN = _NoopSpan()
+
+class SpanWriter:
+    """后台线程批量写入span，避免在事件循环中做文件IO"""
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue: "queue.SimpleQueue[Optional[dict]]" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._file = None
+
+    def submit(self, record: dict):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="span-writer", daemon=True)
+                    self._thread.start()
+        self._queue.put(record)
+
+    def close(self):
+        """写完队列中剩余的span后退出"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            # 一次取出所有已排队的span，合并为一行写入
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [r for r in batch if r is not None]
+            if not batch:
+                continue
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.warning("写入span日志失败: %s", e)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, spans: List[dict]):
+        line = json.dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]
+            }]
+        }, ensure_ascii=False) + "\n"
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        if self.max_bytes > 0 and self._file.tell() + len(line) > self.max_bytes:
+            self._rollover()
+        self._file.write(line)
+        self._file.flush()
+
+    def _rollover(self):
+        """滚动文件: traces.jsonl -> traces.jsonl.1 -> traces.jsonl.2 ..."""
+        self._file.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+_writer = SpanWriter(config.trace_file, config.trace_max_bytes, config.trace_backup_count)
+atexit.register(_writer.close)
+
+def shutdown():
+    """刷新并关闭span写入线程"""
+    _writer.close()
+
+@contextmanager
+def start_trace(name: str, kind: int = SPAN_KIND_SERVER, **attributes):
+    """开启一个新的trace（每轮对话/每个REST请求），并创建根span"""
+    if not config.trace_enabled:
+        yield None
+        return
+    trace = Trace(name)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span_id.set(None)
+    try:
+        with span(name, kind=kind, **attributes) as root:
+            trace.root = root
+            yield trace
+    finally:
+        _current_span_id.reset(span_token)
+        _current_trace.reset(trace_token)
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """在当前trace下创建子span；asyncio任务会继承创建时的上下文"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield _NOOP_SPAN
+        return
+    current = Span(trace, name, _current_span_id.get(), kind, attributes)
+    token = _current_span_id.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.set_error(type(e).__name__ if not str(e) else str(e))
+        raise
+    finally:
+        _current_span_id.reset(token)
+        if not current.deferred:
+            current.end()
+
+async def end_after_body(body: AsyncIterator[bytes], root: Span) -> AsyncIterator[bytes]:
+    """包装响应体：发送完毕（或中途失败、客户端断开）时才结束根span，流式响应的耗时包含整个响应体"""
+    size = 0
+    try:
+        async for chunk in body:
+            size += len(chunk)
+            yield chunk
+    except BaseException as e:
+        root.set_error(type(e).__name__ if not str(e) else str(e))
+        raise
+    finally:
+        root.set_attribute("http.response_body_bytes", size)
+        root.end()
+
+def current_trace_id() -> Optional[str]:
+    """获取当前trace id（无trace时返回None）"""
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
@@ -1,11 +1,14 @@
 import httpx
-import io
 import logging
+import time
 from fastapi import APIRouter, File, UploadFile, HTTPException, Form
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import Optional
 from .config import get_settings
+from . import tracing, deadline
+from .asr_cache import asr_cache, cache_key
+from .singleflight import asr_flight
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -33,59 +36,94 @@ async def transcribe_with_retry(
     filename: str,
     content_type: str,
     model: str = "SenseVoiceSmall",
-    max_retries: int = 3
+    max_retries: int = 3,
+    language: Optional[str] = None
 ) -> dict:
-    """带重试机制的音频转录"""
+    """带重试机制的音频转录（相同音频命中缓存时不请求上游）"""
+    
+    key = None
+    if asr_cache is not None:
+        key = cache_key(file_content, model, language)
+        cached = await asr_cache.get(key)
+        if cached is not None:
+            logger.info("转录缓存命中: 文件=%s", filename)
+            return cached
     
+    # 并发的相同音频共享一次上游调用
+    return await asr_flight.do(
+        key or cache_key(file_content, model, language),
+        lambda: _transcribe_upstream(file_content, filename, content_type, model, max_retries, language, key)
+    )
+
+async def _transcribe_upstream(
+    file_content: bytes,
+    filename: str,
+    content_type: str,
+    model: str,
+    max_retries: int,
+    language: Optional[str],
+    key: Optional[str]
+) -> dict:
+    """请求上游转录服务（带重试）"""
     timeout = httpx.Timeout(config.ws_timeout)
     
-    for attempt in range(max_retries):
-        try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                files = {
-                    'file': (filename, io.BytesIO(file_content), content_type)
-                }
-                data = {
-                    'model': model
-                }
-                
-                response = await client.post(
-                    config.transcribe_url,
-                    files=files,
-                    data=data,
-                    timeout=30
-                )
-                response.raise_for_status()
+    with tracing.span("asr.request", kind=tracing.SPAN_KIND_CLIENT, audio_bytes=len(file_content), model=model):
+        for attempt in range(max_retries):
+            try:
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    # 直接传入bytes，避免复制到BytesIO
+                    files = {
+                        'file': (filename, file_content, content_type)
+                    }
+                    data = {
+                        'model': model
+                    }
+                    if language:
+                        data['language'] = language
                 
-                result = response.json()
+                    started = time.monotonic()
+                    response = await client.post(
+                        config.transcribe_url,
+                        files=files,
+                        data=data,
+                        timeout=deadline.timeout_for("asr", 30)
+                    )
+                    response.raise_for_status()
+                    deadline.observe("asr", time.monotonic() - started)
                 
-                # 验证响应格式
-                if not isinstance(result, dict):
-                    raise ValueError("转录服务返回格式错误")
+                    result = response.json()
                 
-                # 确保有text字段
-                if "text" not in result:
-                    result["text"] = ""
+                    # 验证响应格式
+                    if not isinstance(result, dict):
+                        raise ValueError("转录服务返回格式错误")
                 
-                return result
+                    # 确保有text字段
+                    if "text" not in result:
+                        result["text"] = ""
+                    
+                    if key is not None:
+                        await asr_cache.put(key, result)
+                    return result
                 
-        except httpx.TimeoutException:
-            logger.warning(f"转录请求超时 (尝试 {attempt + 1}/{max_retries})")
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=408, detail="转录请求超时")
-        except httpx.HTTPStatusError as e:
-            logger.warning(f"转录HTTP错误 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise HTTPException(
-                    status_code=e.response.status_code,
-                    detail=f"转录服务错误: {e.response.text}"
-                )
-        except Exception as e:
-            logger.warning(f"转录请求失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=500, detail=f"转录服务异常: {str(e)}")
+            except deadline.DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=f"转录请求{e}")
+            except httpx.TimeoutException:
+                logger.warning("转录请求超时 (尝试 %s/%s)", attempt + 1, max_retries)
+                if attempt == max_retries - 1 or not deadline.can_retry("asr"):
+                    raise HTTPException(status_code=408, detail="转录请求超时")
+            except httpx.HTTPStatusError as e:
+                logger.warning("转录HTTP错误 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("asr"):
+                    raise HTTPException(
+                        status_code=e.response.status_code,
+                        detail=f"转录服务错误: {e.response.text}"
+                    )
+            except Exception as e:
+                logger.warning("转录请求失败 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("asr"):
+                    raise HTTPException(status_code=500, detail=f"转录服务异常: {str(e)}")
     
-    raise HTTPException(status_code=500, detail="转录服务达到最大重试次数")
+        raise HTTPException(status_code=500, detail="转录服务达到最大重试次数")
 
 def validate_audio_file(file: UploadFile) -> None:
     """验证音频文件"""
@@ -148,7 +186,7 @@ async def transcribe_audio(
         # 验证文件
         validate_audio_file(file)
         
-        logger.info(f"处理转录请求: 文件={file.filename}, 模型={model}")
+        logger.info("处理转录请求: 文件=%s, 模型=%s", file.filename, model)
         
         # 读取文件内容
         file_content = await file.read()
@@ -161,10 +199,11 @@ async def transcribe_audio(
             file_content,
             file.filename or "audio.wav",
             file.content_type or "audio/wav",
-            model
+            model,
+            language=language
         )
         
-        logger.info(f"转录完成: 文本长度={len(result.get('text', ''))}")
+        logger.info("转录完成: 文本长度=%s", len(result.get('text', '')))
         
         # 构建响应
         response = TranscriptionResponse(
@@ -179,7 +218,7 @@ async def transcribe_audio(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"转录处理异常: {e}")
+        logger.error("转录处理异常: %s", e)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 @router.post("/audio/transcriptions/batch")
@@ -201,7 +240,7 @@ async def transcribe_audio_batch(
         if len(files) > 10:  # 限制批量文件数量
             raise HTTPException(status_code=400, detail="批量文件数量不能超过10个")
         
-        logger.info(f"处理批量转录请求: {len(files)}个文件")
+        logger.info("处理批量转录请求: %s个文件", len(files))
         
         results = []
         
@@ -231,7 +270,7 @@ async def transcribe_audio_batch(
                 })
                 
             except Exception as e:
-                logger.error(f"文件 {file.filename} 转录失败: {e}")
+                logger.error("文件 %s 转录失败: %s", file.filename, e)
                 results.append({
                     "filename": file.filename,
                     "success": False,
@@ -250,7 +289,7 @@ async def transcribe_audio_batch(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"批量转录处理异常: {e}")
+        logger.error("批量转录处理异常: %s", e)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 @router.get("/transcription/models")
@@ -268,5 +307,5 @@ async def get_available_transcription_models():
             ]
         }
     except Exception as e:
-        logger.error(f"获取模型列表失败: {e}")
+        logger.error("获取模型列表失败: %s", e)
         raise HTTPException(status_code=500, detail="获取模型列表失败") 
\ No newline at end of file
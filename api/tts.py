@@ -1,11 +1,14 @@
 import httpx
 import io
 import logging
+import time
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 from .config import get_settings
+from . import tracing, deadline
+from .singleflight import tts_flight, request_key
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -35,43 +38,52 @@ async def tts_with_retry(request: TTSRequest, max_retries: int = 3):
         "voice": request.voice or "中文女",
         "speed": request.speed
     }
-    
+    # 并发的相同请求共享一次上游调用
+    return await tts_flight.do(request_key(payload), lambda: _tts_upstream(payload, max_retries))
+
+async def _tts_upstream(payload: dict, max_retries: int) -> bytes:
+    """请求上游TTS服务（带重试）"""
     timeout = httpx.Timeout(config.ws_timeout)
     
-    for attempt in range(max_retries):
-        try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                response = await client.post(config.tts_url, json=payload, timeout=30)
-                response.raise_for_status()
+    with tracing.span("tts.request", kind=tracing.SPAN_KIND_CLIENT, text_len=len(payload["input"])):
+        for attempt in range(max_retries):
+            try:
+                async with httpx.AsyncClient(timeout=timeout) as client:
+                    started = time.monotonic()
+                    response = await client.post(config.tts_url, json=payload, timeout=deadline.timeout_for("tts_file", 30))
+                    response.raise_for_status()
+                    deadline.observe("tts_file", time.monotonic() - started)
                 
-                if response.status_code == 200:
-                    content = response.content
-                    if len(content) == 0:
-                        raise ValueError("TTS服务返回空音频")
-                    return content
-                else:
+                    if response.status_code == 200:
+                        content = response.content
+                        if len(content) == 0:
+                            raise ValueError("TTS服务返回空音频")
+                        return content
+                    else:
+                        raise HTTPException(
+                            status_code=response.status_code,
+                            detail=f"TTS服务错误: {response.text}"
+                        )
+                    
+            except deadline.DeadlineExceeded as e:
+                raise HTTPException(status_code=504, detail=f"TTS请求{e}")
+            except httpx.TimeoutException:
+                logger.warning("TTS请求超时 (尝试 %s/%s)", attempt + 1, max_retries)
+                if attempt == max_retries - 1 or not deadline.can_retry("tts_file"):
+                    raise HTTPException(status_code=408, detail="TTS请求超时")
+            except httpx.HTTPStatusError as e:
+                logger.warning("TTS HTTP错误 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("tts_file"):
                     raise HTTPException(
-                        status_code=response.status_code,
-                        detail=f"TTS服务错误: {response.text}"
+                        status_code=e.response.status_code,
+                        detail=f"TTS服务错误: {e.response.text}"
                     )
-                    
-        except httpx.TimeoutException:
-            logger.warning(f"TTS请求超时 (尝试 {attempt + 1}/{max_retries})")
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=408, detail="TTS请求超时")
-        except httpx.HTTPStatusError as e:
-            logger.warning(f"TTS HTTP错误 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise HTTPException(
-                    status_code=e.response.status_code,
-                    detail=f"TTS服务错误: {e.response.text}"
-                )
-        except Exception as e:
-            logger.warning(f"TTS请求失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-            if attempt == max_retries - 1:
-                raise HTTPException(status_code=500, detail=f"TTS服务异常: {str(e)}")
+            except Exception as e:
+                logger.warning("TTS请求失败 (尝试 %s/%s): %s", attempt + 1, max_retries, e)
+                if attempt == max_retries - 1 or not deadline.can_retry("tts_file"):
+                    raise HTTPException(status_code=500, detail=f"TTS服务异常: {str(e)}")
     
-    raise HTTPException(status_code=500, detail="TTS服务达到最大重试次数")
+        raise HTTPException(status_code=500, detail="TTS服务达到最大重试次数")
 
 @router.post("/speech", response_class=StreamingResponse)
 async def tts_speech(request: TTSRequest):
@@ -92,12 +104,12 @@ async def tts_speech(request: TTSRequest):
         if len(request.input) > 1000:  # 限制文本长度
             raise HTTPException(status_code=400, detail="文本长度不能超过1000字符")
         
-        logger.info(f"处理TTS请求: 模型={request.model}, 文本长度={len(request.input)}")
+        logger.info("处理TTS请求: 模型=%s, 文本长度=%s", request.model, len(request.input))
         
         # 调用TTS服务
         audio_content = await tts_with_retry(request)
         
-        logger.info(f"TTS处理完成，音频大小: {len(audio_content)} bytes")
+        logger.info("TTS处理完成，音频大小: %s bytes", len(audio_content))
         
         # 创建流式响应
         def generate():
@@ -119,7 +131,7 @@ async def tts_speech(request: TTSRequest):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"TTS处理异常: {e}")
+        logger.error("TTS处理异常: %s", e)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 @router.post("/speech/stream")
@@ -138,7 +150,7 @@ async def tts_speech_stream(request: TTSRequest):
         if not request.input or not request.input.strip():
             raise HTTPException(status_code=400, detail="输入文本不能为空")
         
-        logger.info(f"处理流式TTS请求: {request.input[:50]}...")
+        logger.info("处理流式TTS请求: %s...", request.input[:50])
         
         payload = {
             "model": request.model,
@@ -148,7 +160,8 @@ async def tts_speech_stream(request: TTSRequest):
             "stream": True  # 启用流式响应
         }
         
-        timeout = httpx.Timeout(config.ws_timeout)
+        # 首包超时按自适应超时与请求剩余时间计算
+        timeout = httpx.Timeout(deadline.timeout_for("tts", config.ws_timeout))
         
         async def generate_audio_stream():
             try:
@@ -161,7 +174,7 @@ async def tts_speech_stream(request: TTSRequest):
                                 yield chunk
                                 
             except Exception as e:
-                logger.error(f"流式TTS错误: {e}")
+                logger.error("流式TTS错误: %s", e)
                 raise HTTPException(status_code=500, detail=f"流式TTS失败: {str(e)}")
         
         return StreamingResponse(
@@ -172,8 +185,10 @@ async def tts_speech_stream(request: TTSRequest):
         
     except HTTPException:
         raise
+    except deadline.DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"TTS请求{e}")
     except Exception as e:
-        logger.error(f"流式TTS处理异常: {e}")
+        logger.error("流式TTS处理异常: %s", e)
         raise HTTPException(status_code=500, detail=f"服务器内部错误: {str(e)}")
 
 @router.get("/voices")
@@ -193,5 +208,5 @@ async def get_available_voices():
             ]
         }
     except Exception as e:
-        logger.error(f"获取语音列表失败: {e}")
+        logger.error("获取语音列表失败: %s", e)
         raise HTTPException(status_code=500, detail="获取语音列表失败") 
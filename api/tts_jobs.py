@@ -0,0 +1,194 @@
+import asyncio
+import os
+import re
+import logging
+from typing import Optional
+import httpx
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from .config import get_settings
+from . import jobs, metrics
+from .http_pool import get_http_client
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+config = get_settings()
+
+JOB_KIND = "tts"
+
+# 输出文件名中需要替换的字符
+_NAME_PATTERN = re.compile(r"[^\w\-.]+")
+
+def _normalize_items(items: list, model: str, voice: Optional[str]) -> list:
+    """校验并补全每一条合成请求，确定输出文件名"""
+    normalized = []
+    names = set()
+    for i, item in enumerate(items):
+        text = item.get("input") or item.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise ValueError(f"第 {i + 1} 条缺少 text/input")
+        if len(text) > 1000:
+            raise ValueError(f"第 {i + 1} 条文本长度超过1000字符")
+        name = item.get("name")
+        name = _NAME_PATTERN.sub("_", str(name)).strip("._") if name else ""
+        filename = f"{name or f'{i:05d}'}.wav"
+        if filename in names:
+            raise ValueError(f"第 {i + 1} 条输出文件名重复: {filename}")
+        names.add(filename)
+        normalized.append({
+            "model": item.get("model") or model,
+            "input": text,
+            "voice": item.get("voice") or voice or "中文女",
+            "speed": item.get("speed", 1.0),
+            "file": filename
+        })
+    return normalized
+
+async def _synthesize_to_file(client: httpx.AsyncClient, item: dict, path: str):
+    """流式合成并直接写入磁盘：先写 .part 文件，完成后改名，续跑时据此判断是否已完成"""
+    payload = {k: item[k] for k in ("model", "input", "voice", "speed")}
+    part = path + ".part"
+    for attempt in range(config.tts_job_retries):
+        try:
+            async with client.stream("POST", config.tts_url, json=payload, timeout=config.ws_timeout) as response:
+                if response.status_code != 200:
+                    body = await response.aread()
+                    raise RuntimeError(f"TTS服务错误 (状态码: {response.status_code}): {body[:200]!r}")
+                f = await asyncio.to_thread(open, part, "wb")
+                try:
+                    size = 0
+                    async for chunk in response.aiter_bytes():
+                        size += len(chunk)
+                        await asyncio.to_thread(f.write, chunk)
+                finally:
+                    await asyncio.to_thread(f.close)
+            if size == 0:
+                raise RuntimeError("TTS服务返回空音频")
+            await asyncio.to_thread(os.replace, part, path)
+            return
+        except Exception as e:
+            logger.warning("批量TTS合成失败 (尝试 %s/%s): %s", attempt + 1, config.tts_job_retries, e)
+            if attempt == config.tts_job_retries - 1:
+                raise
+            await asyncio.sleep(0.5 * (attempt + 1))
+
+async def run_tts_job(job: jobs.Job):
+    """执行TTS批处理任务：已存在的输出文件视为完成，中断后重新执行即从断点继续"""
+    items = await asyncio.to_thread(jobs.load_jsonl, job.path("input.jsonl"))
+    audio_dir = job.path("audio")
+    await asyncio.to_thread(os.makedirs, audio_dir, exist_ok=True)
+    existing = set(await asyncio.to_thread(os.listdir, audio_dir))
+
+    # 续跑时重新统计进度（失败的条目重新尝试）
+    job.done = 0
+    job.failed = 0
+    job.errors = []
+    pending = []
+    for i, item in enumerate(items):
+        if item["file"] in existing:
+            job.done += 1
+        else:
+            pending.append((i, item))
+    if job.done:
+        logger.info("任务 %s 续跑: 已完成 %s/%s", job.job_id, job.done, job.total)
+
+    client = get_http_client()
+    queue = iter(pending)
+
+    async def worker():
+        # 固定数量的worker依次领取条目，限制对TTS上游的并发
+        for i, item in queue:
+            try:
+                await _synthesize_to_file(client, item, os.path.join(audio_dir, item["file"]))
+                job.done += 1
+                metrics.inc("tts_job_items_total")
+            except Exception as e:
+                job.record_error(i, str(e))
+                metrics.inc("tts_job_item_failures_total")
+            await job.save(force=False)
+
+    await asyncio.gather(*(worker() for _ in range(max(config.tts_job_concurrency, 1))))
+
+jobs.manager.register(JOB_KIND, run_tts_job)
+
+def _get_job(job_id: str) -> jobs.Job:
+    job = jobs.manager.get(job_id)
+    if job is None or job.kind != JOB_KIND:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return job
+
+@router.post("/speech/jobs")
+async def create_tts_job(
+    file: UploadFile = File(..., description="JSONL文件，每行一个对象: {\"text\": ..., \"voice\": ..., \"name\": ...}"),
+    model: str = Form(default="CosyVoice2-0.5B", description="默认模型"),
+    voice: Optional[str] = Form(default=None, description="默认音色")
+):
+    """
+    提交批量TTS任务
+
+    Args:
+        file: JSONL文件，每行包含 text(或input)，可选 voice/model/speed/name
+        model: 未单独指定时使用的模型
+        voice: 未单独指定时使用的音色
+
+    Returns:
+        dict: 任务状态
+    """
+    try:
+        items = _normalize_items(jobs.read_jsonl(await file.read()), model, voice)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"任务文件格式错误: {e}")
+    if not items:
+        raise HTTPException(status_code=400, detail="任务文件为空")
+    if len(items) > config.tts_job_max_items:
+        raise HTTPException(status_code=400, detail=f"单个任务不能超过{config.tts_job_max_items}条")
+
+    job = await jobs.manager.create(JOB_KIND, len(items), {"model": model, "voice": voice})
+    await asyncio.to_thread(jobs.write_jsonl, job.path("input.jsonl"), items)
+    jobs.manager.start(job)
+    logger.info("已提交TTS批处理任务 %s: %s 条", job.job_id, len(items))
+    return job.to_dict()
+
+@router.get("/speech/jobs")
+async def list_tts_jobs():
+    """列出TTS批处理任务"""
+    return {"jobs": [job.to_dict() for job in jobs.manager.list(JOB_KIND)]}
+
+@router.get("/speech/jobs/{job_id}")
+async def get_tts_job(job_id: str):
+    """查询任务状态和进度"""
+    return _get_job(job_id).to_dict()
+
+@router.post("/speech/jobs/{job_id}/cancel")
+async def cancel_tts_job(job_id: str):
+    """取消任务（已合成的音频保留）"""
+    job = _get_job(job_id)
+    if not await jobs.manager.cancel(job):
+        raise HTTPException(status_code=409, detail=f"任务已结束: {job.status}")
+    return job.to_dict()
+
+@router.delete("/speech/jobs/{job_id}")
+async def delete_tts_job(job_id: str):
+    """删除任务及其所有文件"""
+    await jobs.manager.delete(_get_job(job_id))
+    return {"success": True}
+
+@router.get("/speech/jobs/{job_id}/download")
+async def download_tts_job(job_id: str):
+    """以zip流下载已完成任务的音频（附带 input.jsonl 记录每条的文本、音色和文件名）"""
+    job = _get_job(job_id)
+    if job.status != jobs.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"任务尚未完成: {job.status}")
+
+    def list_files():
+        audio = sorted(name for name in os.listdir(job.path("audio")) if name.endswith(".wav"))
+        return [os.path.join("audio", name) for name in audio]
+
+    names = await asyncio.to_thread(list_files)
+    return StreamingResponse(
+        jobs.iter_zip(job.directory, ["input.jsonl", *names]),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=tts_{job.job_id}.zip"}
+    )
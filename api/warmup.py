@@ -0,0 +1,114 @@
+import asyncio
+import io
+import logging
+import time
+import wave
+from typing import Awaitable, Dict, List, Optional
+import httpx
+from .config import get_settings, get_llm_headers
+from . import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+class WarmupState:
+    """启动预热的进度；预热结束（无论各步骤成功与否）后才报告就绪"""
+
+    def __init__(self):
+        self.done = asyncio.Event()
+        self.started: Optional[float] = None
+        self.seconds: Optional[float] = None
+        self.steps: Dict[str, dict] = {}
+
+    def to_dict(self) -> dict:
+        return {
+            "ready": self.done.is_set(),
+            "seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "steps": self.steps
+        }
+
+state = WarmupState()
+
+def _silence_wav(seconds: float = 0.3, sample_rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+    return buf.getvalue()
+
+async def _connect(client: httpx.AsyncClient):
+    """向每个上游并发发起几个轻量请求，完成DNS解析和TLS握手，连接留在连接池中复用（响应状态不重要）"""
+    origins = {}
+    for url in (config.transcribe_url, config.tts_url, config.llm_url):
+        origin = httpx.URL(url)
+        origins.setdefault((origin.scheme, origin.host, origin.port), url)
+    await asyncio.gather(*(
+        client.head(url) for url in origins.values() for _ in range(max(config.warmup_connections, 1))
+    ))
+
+async def _asr(client: httpx.AsyncClient):
+    files = {"file": ("warmup.wav", _silence_wav(), "audio/wav")}
+    response = await client.post(config.transcribe_url, files=files, data={"model": "SenseVoiceSmall"}, timeout=config.transcribe_timeout)
+    response.raise_for_status()
+
+async def _tts(client: httpx.AsyncClient):
+    payload = {"model": "CosyVoice2-0.5B", "input": "你好", "voice": "中文女声"}
+    async with client.stream("POST", config.tts_url, json=payload, timeout=config.tts_timeout) as response:
+        response.raise_for_status()
+        async for _ in response.aiter_bytes():
+            pass
+
+async def _llm(client: httpx.AsyncClient):
+    payload = {
+        "model": "gpt-4o-ca",
+        "messages": [{"role": "user", "content": "你好"}],
+        "stream": False,
+        "max_tokens": 1
+    }
+    response = await client.post(config.llm_url, headers=get_llm_headers(), json=payload, timeout=config.llm_timeout)
+    response.raise_for_status()
+
+async def _step(name: str, coro: Awaitable):
+    started = time.monotonic()
+    try:
+        await coro
+        result = {"ok": True}
+    except Exception as e:
+        logger.warning("预热步骤 %s 失败: %s", name, e)
+        result = {"ok": False, "error": str(e) or type(e).__name__}
+    elapsed = time.monotonic() - started
+    result["ms"] = round(elapsed * 1000, 1)
+    state.steps[name] = result
+    metrics.set_gauge(f"warmup_{name}_ms", result["ms"])
+
+async def run(client: httpx.AsyncClient, caches: List[asyncio.Task]):
+    """预热上游：预建连接池中的连接 -> 各上游发送一个极小的请求 -> 等待缓存（填充音、FAQ音频）加载完成
+
+    整个预热最多 warmup_timeout_s 秒，超时或失败的步骤记录在 /ready 的返回中，不阻止就绪。
+    """
+    state.started = time.monotonic()
+    if not config.warmup_enabled:
+        state.seconds = 0.0
+        state.done.set()
+        return
+    try:
+        await asyncio.wait_for(_step("connect", _connect(client)), config.warmup_timeout_s)
+        await asyncio.wait_for(asyncio.gather(
+            _step("asr", _asr(client)),
+            _step("tts", _tts(client)),
+            _step("llm", _llm(client)),
+        ), max(config.warmup_timeout_s - (time.monotonic() - state.started), 0))
+        if caches:
+            left = max(config.warmup_timeout_s - (time.monotonic() - state.started), 0)
+            await _step("caches", asyncio.wait_for(asyncio.gather(*(asyncio.shield(t) for t in caches)), left))
+    except asyncio.TimeoutError:
+        logger.warning("预热超过 %ss，跳过剩余步骤", config.warmup_timeout_s)
+    finally:
+        state.seconds = time.monotonic() - state.started
+        state.done.set()
+        metrics.set_gauge("warmup_seconds", round(state.seconds, 3))
+        logger.info("预热完成，耗时 %.2fs: %s", state.seconds, state.steps)
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import struct
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple, Union
+from fastapi import WebSocket
+from starlette.websockets import WebSocketState
+from .config import get_settings
+from . import metrics
+from .buffers import PooledBuffer, message_size, pool
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+config = get_settings()
+
+# 所有连接待发送的字节总数（用于监控）
+_total_queued = 0
+
+def _account(delta: int):
+    global _total_queued
+    _total_queued += delta
+    metrics.set_gauge("ws_send_queue_bytes", _total_queued)
+
+class ConnectionWriter:
+    """单个WebSocket连接的下行发送任务
+
+    生产者（LLM/TTS任务）只把帧放入有界的发送队列，由独立任务按顺序写入连接。
+    待发送字节超过高水位后 wait_writable() 会挂起生产者（从而暂停读取上游），
+    降到低水位以下再恢复；持续高于高水位或单帧发送超时的客户端视为慢客户端并断开。
+    """
+
+    def __init__(self, websocket: WebSocket, on_sent: Callable[[int], None],
+                 on_closed: Callable[["ConnectionWriter"], None]):
+        self.websocket = websocket
+        self.queued_bytes = 0
+        self.closed = False
+        self._queue: Deque[Tuple[Optional[int], Union[str, bytes]]] = deque()
+        self._sending = False  # 队首的帧正在写入连接
+        self._wakeup = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._on_sent = on_sent
+        self._on_closed = on_closed
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, seq: Optional[int], message: Union[str, bytes]) -> bool:
+        """放入发送队列（不等待）；seq 为空表示不参与重放的控制帧"""
+        if self.closed:
+            return False
+        self._queue.append((seq, message))
+        self._add_bytes(message_size(message))
+        if self.queued_bytes >= config.ws_send_high_watermark:
+            self._drained.clear()
+        self._wakeup.set()
+        return True
+
+    def discard(self, predicate: Callable[[Optional[int], Union[str, bytes]], bool]) -> int:
+        """丢弃队列中满足条件的未发送帧（正在写入的帧除外），返回丢弃的帧数"""
+        kept: Deque[Tuple[Optional[int], Union[str, bytes]]] = deque()
+        dropped = 0
+        freed = 0
+        for i, (seq, message) in enumerate(self._queue):
+            if (i == 0 and self._sending) or not predicate(seq, message):
+                kept.append((seq, message))
+            else:
+                dropped += 1
+                freed += message_size(message)
+        if dropped:
+            self._queue = kept
+            self._add_bytes(-freed)
+            if self.queued_bytes <= config.ws_send_low_watermark:
+                self._drained.set()
+        return dropped
+
+    async def wait_writable(self) -> bool:
+        """高于高水位时等待队列降到低水位以下；返回 False 表示连接已关闭"""
+        if self._drained.is_set():
+            return not self.closed
+        metrics.inc("ws_backpressure_pauses_total")
+        try:
+            await asyncio.wait_for(self._drained.wait(), config.ws_slow_client_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("客户端接收过慢，待发送 %s 字节，断开连接", self.queued_bytes)
+            await self.drop(4001, "slow consumer")
+            return False
+        return not self.closed
+
+    def stop(self):
+        """停止发送任务并丢弃未发送的帧（帧仍保留在会话重放缓冲区中）"""
+        if self._finish() and asyncio.current_task() is not self._task:
+            self._task.cancel()
+
+    async def drop(self, code: int, reason: str):
+        """断开慢客户端"""
+        metrics.inc("ws_slow_client_dropped_total")
+        self.stop()
+        if self.websocket.client_state == WebSocketState.CONNECTED:
+            try:
+                await asyncio.wait_for(self.websocket.close(code=code, reason=reason), config.ws_send_timeout)
+            except Exception:
+                pass
+
+    async def _run(self):
+        while not self.closed:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            seq, message = self._queue[0]
+            self._sending = True
+            try:
+                await asyncio.wait_for(self._send(message), config.ws_send_timeout)
+            except asyncio.TimeoutError:
+                logger.warning("单帧发送超过 %ss，断开连接", config.ws_send_timeout)
+                await self.drop(4001, "slow consumer")
+                return
+            except Exception as e:
+                logger.debug("下行帧发送失败: %s", e)
+                self._finish()
+                return
+            finally:
+                self._sending = False
+            self._queue.popleft()
+            self._add_bytes(-message_size(message))
+            if self.queued_bytes <= config.ws_send_low_watermark:
+                self._drained.set()
+            if seq is not None:
+                self._on_sent(seq)
+
+    async def _send(self, message: Union[str, bytes]):
+        if self.websocket.client_state != WebSocketState.CONNECTED:
+            raise ConnectionError("连接已关闭")
+        if isinstance(message, bytes):
+            await self.websocket.send_bytes(message)
+        else:
+            await self.websocket.send_text(message)
+
+    def _add_bytes(self, delta: int):
+        self.queued_bytes += delta
+        _account(delta)
+
+    def _finish(self) -> bool:
+        if self.closed:
+            return False
+        self.closed = True
+        self._add_bytes(-self.queued_bytes)
+        self._queue.clear()
+        # 唤醒所有等待中的生产者
+        self._drained.set()
+        self._wakeup.set()
+        self._on_closed(self)
+        return True
+
+# WAV文件头最多累积的字节数，超过仍未找到 data 块时按裸PCM处理
+MAX_WAV_HEADER = 4096
+PCM_WAV_HEADER_SIZE = 44
+
+def wav_layout(head: bytes) -> Optional[Tuple[int, int, int, int]]:
+    """解析WAV文件头，返回 (声道数, 采样率, 采样字节数, PCM起始位置)
+
+    不是WAV数据时返回 (0, 0, 0, 0)；文件头尚不完整时返回None。
+    """
+    if len(head) < 12:
+        return None if b"RIFF".startswith(bytes(head[:4])) else (0, 0, 0, 0)
+    if head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return 0, 0, 0, 0
+    pos = 12
+    fmt = None
+    while pos + 8 <= len(head):
+        chunk_id = bytes(head[pos:pos + 4])
+        (size,) = struct.unpack_from("<I", head, pos + 4)
+        if chunk_id == b"data":
+            return (*fmt, pos + 8) if fmt is not None else (0, 0, 0, 0)
+        if chunk_id == b"fmt ":
+            if pos + 24 > len(head):
+                return None
+            channels, sample_rate, _, _, bits = struct.unpack_from("<HIIHH", head, pos + 10)
+            fmt = (channels, sample_rate, bits // 8)
+        pos += 8 + size + (size & 1)
+    return None
+
+def pcm_wav_header(channels: int, sample_rate: int, sample_width: int, data_size: int) -> bytes:
+    """PCM WAV文件头（44字节）"""
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1,
+        channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8, b"data", data_size
+    )
+
+class FrameCoalescer:
+    """将上游零碎的音频块合并为固定时长的下行帧，减少帧数和每帧开销
+
+    每帧都封装为独立可播放的WAV（与填充音帧相同），客户端逐帧解码播放。
+    上游第一块为WAV文件头时按其格式封装，否则按 fallback_byte_rate 的单声道16bit PCM 处理。
+    拼帧使用缓冲池中的slab，文件头和PCM写入同一块slab，用完需调用 flush() 或 close() 归还。
+    frame_ms 为0时原样转发上游数据块。
+    """
+
+    def __init__(self, frame_ms: int, fallback_byte_rate: int):
+        self.frame_ms = frame_ms
+        self.fallback_byte_rate = fallback_byte_rate
+        self.frame_bytes = 0  # 每帧的PCM字节数
+        self.block_align = 2
+        self._head: Optional[bytearray] = bytearray()  # 尚未解析完的上游文件头
+        self._header = b""  # 每帧的WAV文件头（满帧）
+        self._buffer: Optional[PooledBuffer] = None
+
+    def feed(self, chunk: bytes) -> List[bytes]:
+        """追加一块数据，返回已凑满的帧"""
+        if self.frame_ms <= 0:
+            return [chunk]
+        if self._head is not None:
+            self._head += chunk
+            layout = wav_layout(self._head)
+            if layout is None and len(self._head) < MAX_WAV_HEADER:
+                return []
+            chunk = self._start(layout or (0, 0, 0, 0))
+        if self._buffer is None:
+            self._buffer = pool.acquire(PCM_WAV_HEADER_SIZE + self.frame_bytes)
+            self._buffer.write(self._header)
+        buffer = self._buffer
+        full = PCM_WAV_HEADER_SIZE + self.frame_bytes
+        frames = []
+        view = memoryview(chunk)
+        while view:
+            n = buffer.write(view[:full - buffer.length])
+            view = view[n:]
+            if buffer.length == full:
+                frames.append(buffer.take())
+                buffer.write(self._header)
+        return frames
+
+    def _start(self, layout: Tuple[int, int, int, int]) -> bytes:
+        """按上游格式确定帧大小和文件头，返回文件头之后的PCM数据"""
+        channels, sample_rate, sample_width, offset = layout
+        if not channels or not sample_rate or not sample_width:
+            channels, sample_rate, sample_width, offset = 1, self.fallback_byte_rate // 2, 2, 0
+        self.block_align = channels * sample_width
+        size = int(sample_rate * self.block_align * self.frame_ms / 1000) // self.block_align * self.block_align
+        self.frame_bytes = max(size, self.block_align)
+        self._header = pcm_wav_header(channels, sample_rate, sample_width, self.frame_bytes)
+        rest = bytes(self._head[offset:])
+        self._head = None
+        return rest
+
+    def flush(self) -> bytes:
+        """返回剩余不足一帧的数据（同样封装为WAV）并归还缓冲区"""
+        rest = b""
+        buffer = self._buffer
+        if buffer is not None:
+            size = (buffer.length - PCM_WAV_HEADER_SIZE) // self.block_align * self.block_align
+            if size > 0:
+                buffer.length = PCM_WAV_HEADER_SIZE + size
+                struct.pack_into("<I", buffer.slab, 4, 36 + size)
+                struct.pack_into("<I", buffer.slab, 40, size)
+                rest = buffer.take()
+        self.close()
+        return rest
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.release()
+            self._buffer = None
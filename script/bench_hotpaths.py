@@ -0,0 +1,243 @@
+"""
+文本/解析热点路径的微基准：每个token或每句话都会执行的CPU密集函数
+
+    # 与已提交的基线对比，任一用例变慢超过阈值时以非0状态码退出
+    python script/bench_hotpaths.py
+
+    # 优化后（或更换机器后）更新基线
+    python script/bench_hotpaths.py --save
+
+    # 只跑部分用例
+    python script/bench_hotpaths.py -k segment -k sse
+
+带 _legacy 后缀的用例是被替换掉的旧实现（逐行解码的SSE解析、标准库json编码），保留作为对照。
+
+语料为确定性生成的中文文本（small/medium/large 三种规模），结果单位为每次调用的微秒数，
+取多轮重复中的最小值以降低调度噪声。基线与机器相关，对比前应在同一台机器上生成。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "script"))
+# 基准不访问上游，未配置 .env 时补一个占位密钥以便加载配置
+os.environ.setdefault("LLM_API_KEY", "bench")
+
+from api.realtime import optimized_segment  # noqa: E402
+from api.codec import SSEDeltaParser, dumps  # noqa: E402
+from api.mock_llm import _encode_token, _stream_head, tokenize  # noqa: E402
+from match_keywords import filter_religious_sentences  # noqa: E402
+
+BASELINE_PATH = os.path.join(ROOT, "script", "bench_baseline.json")
+
+# 语料来源句子：混合长短句、中英文标点和宗教关键词，贴近实际LLM输出
+SENTENCES = [
+    "十千伏线路的巡检周期一般为每月一次，",
+    "遇到雷雨天气时应增加特巡。",
+    "变压器油温超过八十五摄氏度时，需要立即检查冷却系统是否正常运行！",
+    "您好，我是智能助手，很高兴为您服务。",
+    "这个问题涉及多个方面：设备状态、负荷情况、环境温度；",
+    "我们建议先断开负荷开关，再进行验电和接地。",
+    "如果您还有其他问题，请随时告诉我？",
+    "圣诞节期间用电负荷会明显上升，",
+    "据说老人们会去庙里拜佛祈福。",
+    "The load is about 80% of rated capacity.",
+    "配电室的温度和湿度需要保持在规定范围内，",
+    "神经网络模型可以辅助识别绝缘子缺陷。",
+    "总的来说，安全永远是第一位的。",
+]
+
+SIZES = {"small": 60, "medium": 600, "large": 6000}
+
+def corpus(chars: int, seed: int = 42) -> str:
+    rng = random.Random(seed)
+    parts: List[str] = []
+    total = 0
+    while total < chars:
+        s = rng.choice(SENTENCES)
+        parts.append(s)
+        total += len(s)
+    return "".join(parts)[:chars]
+
+def _sse_lines(text: str) -> List[str]:
+    """按 OpenAI chat.completion.chunk 格式把文本编码为逐字的SSE行"""
+    lines = []
+    for token in tokenize(text):
+        chunk = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "gpt-4o-ca",
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+        }
+        lines.append("data: " + json.dumps(chunk, ensure_ascii=False))
+    lines.append("data: [DONE]")
+    return lines
+
+def bench_segment(text: str) -> Callable[[], None]:
+    """模拟流式分段：每收到一个token调用一次 optimized_segment"""
+    tokens = tokenize(text)
+
+    def run():
+        accum = ""
+        last_idx = 0
+        count = 0
+        for token in tokens:
+            accum += token
+            segs, last_idx = optimized_segment(accum, last_idx, count > 0)
+            count += len(segs)
+    return run
+
+def _legacy_parse_sse_line(line: str):
+    """逐行解码 + 完整 json.loads 的旧实现，作为 SSEDeltaParser 的对照"""
+    if not line.startswith("data:"):
+        return False, ""
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return True, ""
+    obj = json.loads(data)
+    choices = obj.get("choices", [])
+    if not choices or "delta" not in choices[0]:
+        return False, ""
+    return False, choices[0]["delta"].get("content") or ""
+
+def _raw_chunks(lines: List[str], size: int = 1024) -> List[bytes]:
+    """把SSE行拼成字节流并按网络读取的大小切块（切点可能落在行中间）"""
+    raw = "".join(line + "\n\n" for line in lines).encode("utf-8")
+    return [raw[i:i + size] for i in range(0, len(raw), size)]
+
+def bench_sse_legacy(text: str) -> Callable[[], None]:
+    chunks = _raw_chunks(_sse_lines(text))
+
+    def run():
+        # 等价于 aiter_lines()：解码、切行，再逐行解析
+        buffer = ""
+        for chunk in chunks:
+            buffer += chunk.decode("utf-8", errors="ignore")
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                if line.strip():
+                    _legacy_parse_sse_line(line)
+    return run
+
+def bench_sse(text: str) -> Callable[[], None]:
+    chunks = _raw_chunks(_sse_lines(text))
+
+    def run():
+        parser = SSEDeltaParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+    return run
+
+def _frames(text: str) -> List[dict]:
+    return [{"type": "llm", "text": s, "seq": i} for i, s in enumerate(text.split("。"))]
+
+def bench_encode_legacy(text: str) -> Callable[[], None]:
+    frames = _frames(text)
+    return lambda: [json.dumps(f) for f in frames]
+
+def bench_encode(text: str) -> Callable[[], None]:
+    frames = _frames(text)
+    return lambda: [dumps(f) for f in frames]
+
+def bench_mock_stream(text: str) -> Callable[[], None]:
+    # 模拟LLM逐token输出时的编码：分块头部 + 缓存的token JSON（与 stream_mock_response 相同）
+    tokens = tokenize(text)
+    head = _stream_head("mock-0000")
+    return lambda: b"".join([head + _encode_token(token) for token in tokens])
+
+def bench_filter(text: str) -> Callable[[], None]:
+    return lambda: filter_religious_sentences(text)
+
+CASES: Dict[str, Callable[[str], Callable[[], None]]] = {
+    "segment": bench_segment,
+    "sse_legacy": bench_sse_legacy,
+    "sse": bench_sse,
+    "encode_legacy": bench_encode_legacy,
+    "encode": bench_encode,
+    "mock_stream": bench_mock_stream,
+    "filter_religious": bench_filter,
+}
+
+def measure(fn: Callable[[], None], repeat: int, min_time: float) -> float:
+    """返回单次调用耗时（微秒）：自动确定循环次数，取多轮最小值"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(int(number * min_time / max(elapsed, 1e-9)), 1)
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+def run_all(selected: List[str], repeat: int, min_time: float) -> Dict[str, float]:
+    results = {}
+    for name, factory in CASES.items():
+        if selected and not any(k in name for k in selected):
+            continue
+        for size, chars in SIZES.items():
+            key = f"{name}[{size}]"
+            results[key] = round(measure(factory(corpus(chars)), repeat, min_time), 3)
+            print(f"{key:<32} {results[key]:>12.3f} us", file=sys.stderr)
+    return results
+
+def compare(baseline: Dict[str, float], current: Dict[str, float], threshold: float) -> Tuple[List[dict], List[dict]]:
+    rows, regressions = [], []
+    for key, value in current.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        ratio = value / old if old else 1.0
+        row = {"case": key, "baseline_us": old, "current_us": value, "ratio": round(ratio, 3)}
+        rows.append(row)
+        if ratio > 1 + threshold:
+            regressions.append(row)
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="热点路径微基准")
+    parser.add_argument("-k", dest="select", action="append", default=[], help="只运行名称包含该字符串的用例")
+    parser.add_argument("--repeat", type=int, default=5, help="重复轮数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每轮最少运行时间(秒)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="相对基线变慢超过该比例视为回退")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument("--save", action="store_true", help="把本次结果写入基线")
+    parser.add_argument("--output", help="把本次结果和对比报告写入JSON文件")
+    args = parser.parse_args()
+
+    current = run_all(args.select, args.repeat, args.min_time)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline.update(current)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(baseline.items())), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"基线已更新: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"基线文件不存在: {args.baseline}，请先使用 --save 生成")
+        sys.exit(2)
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows, regressions = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "  <-- 回退" if row in regressions else ""
+        print(f"{row['case']:<32} {row['baseline_us']:>12.3f} -> {row['current_us']:>12.3f} us  x{row['ratio']:.3f}{flag}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"threshold": args.threshold, "results": current, "comparisons": rows,
+                       "regressions": regressions}, f, ensure_ascii=False, indent=2)
+    if regressions:
+        print(f"{len(regressions)} 个用例超过阈值 {args.threshold:.0%}")
+        sys.exit(1)
+    print("未发现性能回退")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+大规模语料关键词过滤：内存映射读取UTF-8文本，按句子边界切块后用多进程过滤
+
+    python script/filter_corpus.py dump1.txt dump2.txt --kept kept.txt --dropped dropped.txt
+    python script/filter_corpus.py kb.txt --keywords keywords.txt --workers 8 --chunk-mb 32
+
+句子切分和关键词匹配与 match_keywords.filter_religious_sentences 一致：
+kept 文件为不含关键词的句子，dropped 文件为 "关键词<TAB>句子"，每行一句，按输入顺序输出。
+结束后在标准输出打印统计（JSON）：处理字节数、吞吐(MB/s)、句子数及各关键词命中次数。
+
+也可以作为批处理API调用：
+
+    from filter_corpus import filter_corpus
+    stats = filter_corpus(["dump.txt"], "kept.txt", "dropped.txt", workers=4)
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Pattern, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from match_keywords import RELIGIOUS_PATTERN, keyword_pattern, partition_sentences  # noqa: E402
+
+# 句子结束符（。？！.,）及换行的UTF-8字节；在其后切块不会改变 SENTENCE_PATTERN 的匹配结果
+BOUNDARY_PATTERN = re.compile(b"|".join(re.escape(c.encode("utf-8")) for c in "。？！.,\n"))
+
+Chunk = Tuple[str, int, int]
+
+def plan_chunks(path: str, chunk_size: int) -> Iterator[Chunk]:
+    """按大约 chunk_size 字节切分文件，每块的结尾推进到下一个句子边界之后"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                m = BOUNDARY_PATTERN.search(mm, end)
+                end = m.end() if m else size
+            yield path, start, end
+            start = end
+
+# 每个工作进程只编译一次关键词模式
+_pattern: Pattern = RELIGIOUS_PATTERN
+
+def _init_worker(keywords: Optional[List[str]]):
+    global _pattern
+    _pattern = keyword_pattern(keywords) if keywords else RELIGIOUS_PATTERN
+
+def _filter_chunk(chunk: Chunk) -> Tuple[int, str, str, int, Counter]:
+    """工作进程：自行映射文件读取分块（不通过进程间传递原文），返回拼好的输出文本和统计"""
+    path, start, end = chunk
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", errors="replace")
+    kept, dropped = partition_sentences(text, _pattern)
+    hits = Counter(keyword for _, keyword in dropped)
+    kept_text = "".join(s + "\n" for s in kept)
+    dropped_text = "".join(f"{keyword}\t{s}\n" for s, keyword in dropped)
+    return end - start, kept_text, dropped_text, len(kept), hits
+
+def _ordered(pool: ProcessPoolExecutor, chunks: Iterator[Chunk], window: int):
+    """按提交顺序返回结果，最多同时提交 window 个分块，限制等待写出的结果占用的内存"""
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(_filter_chunk, chunk))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def filter_corpus(paths: List[str], kept_path: str, dropped_path: str, workers: Optional[int] = None,
+                  chunk_size: int = 16 * 1024 * 1024, keywords: Optional[List[str]] = None,
+                  progress: bool = False) -> dict:
+    """
+    过滤一批文本文件
+
+    Args:
+        paths: 输入文件（UTF-8）
+        kept_path: 不含关键词的句子输出路径
+        dropped_path: 含关键词的句子输出路径
+        workers: 进程数，默认为CPU核数
+        chunk_size: 每个分块的大约字节数
+        keywords: 自定义关键词，默认为宗教相关关键词
+        progress: 是否在标准错误输出进度
+
+    Returns:
+        dict: 统计信息
+    """
+    workers = workers or os.cpu_count() or 1
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    processed = 0
+    kept_count = 0
+    dropped_count = 0
+    hits: Counter = Counter()
+    started = time.perf_counter()
+
+    def chunks() -> Iterator[Chunk]:
+        for path in paths:
+            yield from plan_chunks(path, chunk_size)
+
+    with open(kept_path, "w", encoding="utf-8") as kept_file, \
+            open(dropped_path, "w", encoding="utf-8") as dropped_file, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(keywords,)) as pool:
+        for size, kept_text, dropped_text, kept_n, chunk_hits in _ordered(pool, chunks(), workers * 2):
+            kept_file.write(kept_text)
+            dropped_file.write(dropped_text)
+            processed += size
+            kept_count += kept_n
+            dropped_count += sum(chunk_hits.values())
+            hits.update(chunk_hits)
+            if progress:
+                elapsed = time.perf_counter() - started
+                print(f"\r{processed / total_bytes:6.1%}  {processed / 1e6 / max(elapsed, 1e-9):8.1f} MB/s",
+                      end="", file=sys.stderr, flush=True)
+    if progress:
+        print(file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    sentences = kept_count + dropped_count
+    return {
+        "files": len(paths),
+        "bytes": processed,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(processed / 1e6 / elapsed, 2) if elapsed > 0 else None,
+        "sentences": sentences,
+        "kept": kept_count,
+        "dropped": dropped_count,
+        "drop_rate": round(dropped_count / sentences, 4) if sentences else 0.0,
+        "keyword_hits": dict(hits.most_common())
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="大规模语料关键词过滤")
+    parser.add_argument("inputs", nargs="+", help="输入文件（UTF-8）")
+    parser.add_argument("--kept", default="kept.txt", help="不含关键词的句子输出路径")
+    parser.add_argument("--dropped", default="dropped.txt", help="含关键词的句子输出路径")
+    parser.add_argument("--keywords", help="关键词文件（每行一个，# 开头为注释），默认为宗教相关关键词")
+    parser.add_argument("--workers", type=int, default=None, help="进程数，默认为CPU核数")
+    parser.add_argument("--chunk-mb", type=float, default=16, help="每个分块的大约大小(MB)")
+    parser.add_argument("--quiet", action="store_true", help="不输出进度")
+    args = parser.parse_args()
+
+    keywords = None
+    if args.keywords:
+        with open(args.keywords, "r", encoding="utf-8") as f:
+            keywords = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+    stats = filter_corpus(
+        args.inputs, args.kept, args.dropped,
+        workers=args.workers,
+        chunk_size=max(int(args.chunk_mb * 1024 * 1024), 1024),
+        keywords=keywords,
+        progress=not args.quiet
+    )
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
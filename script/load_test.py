@@ -0,0 +1,317 @@
+"""
+实时语音链路压测：通过多个并发 /ws/realtime 连接回放WAV文件，统计各阶段延迟分位数
+
+    # 20个连接，每秒平均2轮（泊松到达），共200轮
+    python script/load_test.py --connections 20 --rate 2 --turns 200 --wav samples/ --output run.json
+
+    # 对比两次结果，出现性能回退时以非0状态码退出（用于上线前检查）
+    python script/load_test.py --compare baseline.json run.json --threshold 0.1
+
+统计项（毫秒，从发送音频开始计时）：
+    transcript    收到转录结果
+    first_audio   收到第一帧音频（可能是填充音）
+    first_speech  收到第一帧回答音频（填充音之后）
+    turn          本轮最后一帧（收到 timing 帧，或之后 --idle-ms 内无新帧）
+以及错误率、连接失败数和按帧序号检测到的丢帧数。
+"""
+import argparse
+import asyncio
+import glob
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+import wave
+from typing import Dict, List, Optional
+
+import websockets
+
+METRICS = ("transcript", "first_audio", "first_speech", "turn")
+PERCENTILES = (50, 90, 95, 99)
+
+def synthetic_wav(seconds: float = 1.5, sample_rate: int = 16000) -> bytes:
+    """未指定WAV文件时使用的合成音频"""
+    samples = bytearray()
+    for t in range(int(seconds * sample_rate)):
+        value = int(6000 * math.sin(2 * math.pi * 200 * t / sample_rate))
+        samples += value.to_bytes(2, "little", signed=True)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(bytes(samples))
+    return buf.getvalue()
+
+def load_wavs(paths: List[str]) -> List[bytes]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.wav"))))
+        else:
+            files.extend(sorted(glob.glob(path)))
+    if not files:
+        return [synthetic_wav()]
+    result = []
+    for name in files:
+        with open(name, "rb") as f:
+            result.append(f.read())
+    return result
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """线性插值分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = math.floor(k), math.ceil(k)
+    return round(ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo), 2)
+
+def summarize(values: List[float]) -> dict:
+    stats = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+    stats["count"] = len(values)
+    stats["mean"] = round(sum(values) / len(values), 2) if values else None
+    stats["max"] = round(max(values), 2) if values else None
+    return stats
+
+class TurnResult:
+    __slots__ = ("transcript", "first_audio", "first_speech", "turn", "error", "timed_out")
+
+    def __init__(self):
+        self.transcript: Optional[float] = None
+        self.first_audio: Optional[float] = None
+        self.first_speech: Optional[float] = None
+        self.turn: Optional[float] = None
+        self.error: Optional[str] = None
+        self.timed_out = False
+
+class Connection:
+    """单个压测连接：跟踪帧序号（丢帧检测）并定期确认已收到的帧"""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.expected_seq = 1
+        self.dropped = 0
+
+    def track(self, seq: Optional[int]):
+        if seq is None:
+            return
+        if seq > self.expected_seq:
+            self.dropped += seq - self.expected_seq
+        self.expected_seq = max(self.expected_seq, seq + 1)
+
+    async def run_turn(self, audio: bytes, args) -> TurnResult:
+        result = TurnResult()
+        start = time.perf_counter()
+        await self.ws.send(audio)
+        last_frame = None
+        filler_end = None
+        audio_times: List[float] = []
+        deadline = start + args.turn_timeout
+        while True:
+            now = time.perf_counter()
+            # 已收到回答后，空闲超过 idle_ms 视为本轮结束（服务端未开启 TRACE_SUMMARY_FRAME 时）
+            if last_frame is not None and audio_times:
+                wait = min(deadline, last_frame + args.idle_ms / 1000) - now
+            else:
+                wait = deadline - now
+            if wait <= 0:
+                break
+            try:
+                message = await asyncio.wait_for(self.ws.recv(), wait)
+            except asyncio.TimeoutError:
+                break
+            now = time.perf_counter()
+            if isinstance(message, bytes):
+                # 二进制帧不带序号，按前一帧+1计
+                self.track(self.expected_seq)
+                audio_times.append(now)
+                last_frame = now
+                continue
+            data = json.loads(message)
+            self.track(data.get("seq"))
+            msg_type = data.get("type")
+            if data.get("error"):
+                result.error = str(data["error"])
+                break
+            if msg_type == "ping":
+                continue
+            last_frame = now
+            if msg_type == "transcription":
+                result.transcript = (now - start) * 1000
+                if not data.get("text"):
+                    # 转录为空时服务端不会继续回答
+                    break
+            elif msg_type == "filler_end":
+                filler_end = now
+            elif msg_type == "timing":
+                break
+        if audio_times:
+            result.first_audio = (audio_times[0] - start) * 1000
+            # 收到 filler_end 时，之前的音频是填充音，回答从其后第一帧开始
+            speech = [t for t in audio_times if filler_end is None or t > filler_end]
+            if speech:
+                result.first_speech = (speech[0] - start) * 1000
+        if result.transcript is None and result.error is None:
+            result.timed_out = True
+            result.error = "timeout"
+        if last_frame is not None:
+            result.turn = (last_frame - start) * 1000
+        if self.expected_seq > 1:
+            await self.ws.send(json.dumps({"type": "ack", "seq": self.expected_seq - 1}))
+        return result
+
+async def worker(args, wavs: List[bytes], arrivals: asyncio.Queue, results: List[TurnResult], stats: Dict[str, int]):
+    try:
+        ws = await websockets.connect(args.url, max_size=None, open_timeout=args.turn_timeout)
+    except Exception as e:
+        stats["connect_failures"] += 1
+        print(f"连接失败: {e}", file=sys.stderr)
+        return
+    conn = Connection(ws)
+    try:
+        session = json.loads(await ws.recv())
+        if session.get("type") != "session":
+            raise RuntimeError(f"未收到会话帧: {session}")
+        while True:
+            scheduled = await arrivals.get()
+            if scheduled is None:
+                break
+            # 开环模式下，到达时间早于连接空闲时间的部分计入排队延迟
+            if scheduled:
+                stats["queue_ms"] += max(0, int((time.perf_counter() - scheduled) * 1000))
+            try:
+                results.append(await conn.run_turn(random.choice(wavs), args))
+            except websockets.ConnectionClosed as e:
+                result = TurnResult()
+                result.error = f"connection closed: {e.code}"
+                results.append(result)
+                break
+            if args.think_ms:
+                await asyncio.sleep(args.think_ms / 1000)
+    except Exception as e:
+        stats["connect_failures"] += 1
+        print(f"连接异常: {e}", file=sys.stderr)
+    finally:
+        stats["dropped_frames"] += conn.dropped
+        await ws.close()
+
+async def feed_arrivals(args, arrivals: asyncio.Queue):
+    """rate>0 时按泊松过程产生到达；rate=0 时为闭环（每个连接完成一轮立即开始下一轮）"""
+    for _ in range(args.turns):
+        if args.rate > 0:
+            await asyncio.sleep(random.expovariate(args.rate))
+            arrivals.put_nowait(time.perf_counter())
+        else:
+            arrivals.put_nowait(0.0)
+    for _ in range(args.connections):
+        arrivals.put_nowait(None)
+
+async def run(args) -> dict:
+    wavs = load_wavs(args.wav)
+    arrivals: asyncio.Queue = asyncio.Queue()
+    results: List[TurnResult] = []
+    stats = {"connect_failures": 0, "dropped_frames": 0, "queue_ms": 0}
+    started = time.perf_counter()
+    await asyncio.gather(
+        feed_arrivals(args, arrivals),
+        *(worker(args, wavs, arrivals, results, stats) for _ in range(args.connections))
+    )
+    wall = time.perf_counter() - started
+    errors = [r for r in results if r.error]
+    error_kinds: Dict[str, int] = {}
+    for r in errors:
+        kind = "timeout" if r.timed_out else r.error.split(":")[0][:60]
+        error_kinds[kind] = error_kinds.get(kind, 0) + 1
+    return {
+        "config": {
+            "url": args.url,
+            "connections": args.connections,
+            "turns": args.turns,
+            "rate": args.rate,
+            "wav_files": len(wavs)
+        },
+        "summary": {
+            "turns": len(results),
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(results), 4) if results else None,
+            "error_kinds": error_kinds,
+            "connect_failures": stats["connect_failures"],
+            "dropped_frames": stats["dropped_frames"],
+            "queue_ms_total": stats["queue_ms"],
+            "wall_seconds": round(wall, 2),
+            "turns_per_second": round(len(results) / wall, 2) if wall > 0 else None
+        },
+        "latency_ms": {
+            name: summarize([getattr(r, name) for r in results if not r.error and getattr(r, name) is not None])
+            for name in METRICS
+        }
+    }
+
+def compare(baseline: dict, candidate: dict, threshold: float, min_delta_ms: float) -> dict:
+    """逐项对比延迟分位数和错误率，超过阈值的记为回退"""
+    regressions = []
+    rows = []
+    for name in METRICS:
+        for p in ("p50", "p95", "p99"):
+            old = baseline["latency_ms"].get(name, {}).get(p)
+            new = candidate["latency_ms"].get(name, {}).get(p)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            row = {"metric": f"{name}.{p}", "baseline": old, "candidate": new, "change": round(change, 4)}
+            rows.append(row)
+            if change > threshold and new - old > min_delta_ms:
+                regressions.append(row)
+    for key in ("error_rate",):
+        old = baseline["summary"].get(key) or 0.0
+        new = candidate["summary"].get(key) or 0.0
+        row = {"metric": key, "baseline": old, "candidate": new, "change": round(new - old, 4)}
+        rows.append(row)
+        if new - old > 0.01:
+            regressions.append(row)
+    old_drop = baseline["summary"].get("dropped_frames", 0)
+    new_drop = candidate["summary"].get("dropped_frames", 0)
+    if new_drop > old_drop:
+        row = {"metric": "dropped_frames", "baseline": old_drop, "candidate": new_drop, "change": new_drop - old_drop}
+        rows.append(row)
+        regressions.append(row)
+    return {"threshold": threshold, "comparisons": rows, "regressions": regressions, "passed": not regressions}
+
+def main():
+    parser = argparse.ArgumentParser(description="实时语音链路压测")
+    parser.add_argument("--url", default="ws://127.0.0.1:8000/api/v1/ws/realtime")
+    parser.add_argument("--wav", nargs="*", default=[], help="WAV文件、通配符或目录（默认使用合成音频）")
+    parser.add_argument("--connections", type=int, default=10, help="并发连接数")
+    parser.add_argument("--turns", type=int, default=50, help="总轮数")
+    parser.add_argument("--rate", type=float, default=0.0, help="每秒到达轮数（泊松），0为闭环")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="闭环模式下每轮之间的间隔")
+    parser.add_argument("--idle-ms", type=float, default=1500.0, help="无 timing 帧时，空闲多久视为本轮结束")
+    parser.add_argument("--turn-timeout", type=float, default=30.0, help="单轮超时(秒)")
+    parser.add_argument("--output", help="结果JSON输出路径（默认打印到标准输出）")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="对比两次结果")
+    parser.add_argument("--threshold", type=float, default=0.1, help="分位数相对增长超过该比例视为回退")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0, help="绝对增长小于该值时忽略")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.compare[1], "r", encoding="utf-8") as f:
+            candidate = json.load(f)
+        report = compare(baseline, candidate, args.threshold, args.min_delta_ms)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        sys.exit(0 if report["passed"] else 1)
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
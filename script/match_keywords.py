@@ -1,4 +1,36 @@
 import re
+from typing import List, Pattern, Tuple
+
+# 提取所有中文句子（包括以 "。？！" 结尾的）
+SENTENCE_PATTERN = re.compile(r'[^。？！\n.,]+[。？！.,]')
+
+# 宗教相关关键词匹配模式
+RELIGIOUS_PATTERN = re.compile(r'(神|佛|教|灵|上天|圣)')
+
+def keyword_pattern(keywords: List[str]) -> Pattern:
+    """由关键词列表构建匹配模式（长词优先，避免被短词截断）"""
+    words = sorted({k for k in keywords if k}, key=len, reverse=True)
+    if not words:
+        raise ValueError("关键词列表为空")
+    return re.compile("(" + "|".join(re.escape(w) for w in words) + ")")
+
+def partition_sentences(text: str, pattern: Pattern = RELIGIOUS_PATTERN) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    把文本切成句子并按关键词分为两组
+
+    Returns:
+        (不含关键词的句子, [(含关键词的句子, 命中的第一个关键词)])
+    """
+    unmatched = []
+    matched = []
+    for s in SENTENCE_PATTERN.findall(text):
+        s = s.strip()
+        m = pattern.search(s)
+        if m is None:
+            unmatched.append(s)
+        else:
+            matched.append((s, m.group(0)))
+    return unmatched, matched
 
 def filter_religious_sentences(text: str) -> str:
     """
@@ -10,18 +42,7 @@ def filter_religious_sentences(text: str) -> str:
     Returns:
         str: 不包含宗教关键词的句子,以换行符分隔
     """
-    # 提取所有中文句子（包括以 "。？！" 结尾的）
-    sentences = re.findall(r'[^。？！\n.,]+[。？！.,]', text)
-    
-    # 宗教相关关键词匹配模式
-    pattern = r'(神|佛|教|灵|上天|圣)'
-    
-    # 过滤不包含关键词的句子
-    unmatched = []
-    for s in sentences:
-        s = s.strip()
-        if not re.search(pattern, s):
-            unmatched.append(s)
+    unmatched, _ = partition_sentences(text)
             
     # 将结果组合成字符串返回
     return '\n'.join(unmatched)
@@ -76,7 +76,8 @@ def main():
             host=config.host,
             port=config.port,
             log_level="info" if not config.debug else "debug",
-            reload=config.debug
+            reload=config.debug,
+            ws_max_size=config.ws_max_size
         )
         
     except KeyboardInterrupt:
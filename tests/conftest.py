@@ -0,0 +1,12 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "script"))
+
+# 测试不访问上游，未配置 .env 时补一个占位密钥以便加载配置
+os.environ.setdefault("LLM_API_KEY", "test")
+
+# 需要麦克风和运行中服务的手动调试脚本，不作为自动化测试收集
+collect_ignore = ["test_mic_ws.py"]
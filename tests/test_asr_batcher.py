@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+import pytest
+
+from api.asr_batcher import ASRBatcher, BatchItemError, config
+
+def test_concurrent_submissions_share_one_batch(monkeypatch):
+    monkeypatch.setattr(config, "transcribe_batch_url", "http://asr/batch")
+    monkeypatch.setattr(config, "asr_batch_max_size", 8)
+    batches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        count = request.content.count(b'name="files"')
+        batches.append(count)
+        results = [{"error": "坏音频"} if i == 2 else {"text": f"第{i}条"} for i in range(count)]
+        return httpx.Response(200, json={"results": results})
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        batcher = ASRBatcher(lambda: client)
+        try:
+            results = await asyncio.gather(
+                *(batcher.submit(bytes([i]) * 10, 5) for i in range(4)), return_exceptions=True
+            )
+        finally:
+            await batcher.close()
+            await client.aclose()
+        assert batches == [4]
+        assert results[0] == {"text": "第0条"} and results[3] == {"text": "第3条"}
+        # 单条失败不影响同批其它条目
+        assert isinstance(results[2], BatchItemError)
+    asyncio.run(run())
+
+def test_upstream_failure_reaches_every_waiter(monkeypatch):
+    monkeypatch.setattr(config, "transcribe_batch_url", "http://asr/batch")
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503)
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        batcher = ASRBatcher(lambda: client)
+        try:
+            return await asyncio.gather(*(batcher.submit(b"x", 5) for _ in range(3)), return_exceptions=True)
+        finally:
+            await batcher.close()
+            await client.aclose()
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, httpx.HTTPStatusError) for r in results)
+
+def test_window_is_zero_without_arrival_history():
+    batcher = ASRBatcher(lambda: None)
+    assert batcher.window() == 0.0
+    batcher.interarrival = 0.001
+    assert 0 < batcher.window() <= config.asr_batch_max_wait_ms / 1000
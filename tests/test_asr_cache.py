@@ -0,0 +1,103 @@
+import asyncio
+import io
+import struct
+import wave
+
+import httpx
+
+from api import realtime, tracing
+from api.asr_cache import TranscriptionCache, asr_cache, cache_key, normalize_pcm
+
+def make_wav(pcm: bytes, sample_rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+def with_list_chunk(wav: bytes) -> bytes:
+    """在fmt之后插入LIST元数据块（部分录音软件会写入）"""
+    body = b"INFOISFT" + struct.pack("<I", 6) + b"tests\x00"
+    chunk = b"LIST" + struct.pack("<I", len(body)) + body
+    out = wav[:36] + chunk + wav[36:]
+    return out[:4] + struct.pack("<I", len(out) - 8) + out[8:]
+
+PCM = bytes(range(256)) * 8
+
+def test_key_ignores_header_metadata():
+    plain = make_wav(PCM)
+    tagged = with_list_chunk(plain)
+    assert plain != tagged
+    assert cache_key(plain, "SenseVoiceSmall") == cache_key(tagged, "SenseVoiceSmall")
+
+def test_key_tolerates_streaming_data_size():
+    plain = make_wav(PCM)
+    streamed = plain[:40] + struct.pack("<I", 0xFFFFFFFF) + plain[44:]
+    assert cache_key(plain, "m") == cache_key(streamed, "m")
+
+def test_key_depends_on_format_model_and_language():
+    base = cache_key(make_wav(PCM), "m")
+    assert cache_key(make_wav(PCM, 8000), "m") != base
+    assert cache_key(make_wav(PCM), "other") != base
+    assert cache_key(make_wav(PCM), "m", "en") != base
+
+def test_non_wav_is_hashed_as_is():
+    fmt, pcm = normalize_pcm(b"not a wav file")
+    assert fmt == b"" and bytes(pcm) == b"not a wav file"
+
+def test_empty_text_is_not_cached(tmp_path):
+    async def run():
+        cache = TranscriptionCache(8, str(tmp_path / "asr.db"))
+        await cache.put("k1", {"text": ""})
+        await cache.put("k2", {"text": "   "})
+        await cache.put("k3", {"text": "你好", "language": "zh"})
+        assert await cache.get("k1") is None
+        assert await cache.get("k2") is None
+        # 新实例只能从sqlite层读到
+        reloaded = TranscriptionCache(8, str(tmp_path / "asr.db"))
+        assert await reloaded.get("k1") is None
+        assert await reloaded.get("k3") == {"text": "你好", "language": "zh"}
+    asyncio.run(run())
+
+def test_realtime_caches_full_upstream_response():
+    audio = make_wav(b"\x01\x02" * 500)
+    upstream = {"text": " 你好世界 ", "language": "zh", "duration": 0.03}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=upstream)
+
+    async def run():
+        key = cache_key(audio, realtime.ASR_MODEL)
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            with tracing.span("test") as span:
+                text, error = await realtime._transcribe_upstream(client, audio, key, 1, span)
+        assert (text, error) == ("你好世界", None)
+        # REST接口命中同一条目时得到完整响应，而不是只有text的精简结果
+        assert await asr_cache.get(key) == upstream
+    asyncio.run(run())
+
+def test_same_audio_with_other_metadata_hits_cache_on_both_paths(monkeypatch):
+    """REST接口转录后，实时链路和REST接口再次收到同一段音频（文件头不同）都直接命中缓存"""
+    from api import transcription
+    pcm = b"\x07\x08" * 600
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"text": "缓存测试", "language": "zh"})
+
+    transport = httpx.MockTransport(handler)
+    original = httpx.AsyncClient
+    monkeypatch.setattr(transcription.httpx, "AsyncClient", lambda **kwargs: original(transport=transport, **kwargs))
+
+    async def run():
+        first = await transcription.transcribe_with_retry(make_wav(pcm), "a.wav", "audio/wav", model=realtime.ASR_MODEL, max_retries=1)
+        again = await transcription.transcribe_with_retry(with_list_chunk(make_wav(pcm)), "b.wav", "audio/wav", model=realtime.ASR_MODEL, max_retries=1)
+        async with original(transport=transport) as client:
+            live = await realtime.transcribe_audio_with_retry(client, with_list_chunk(make_wav(pcm)), 1)
+        assert first == again == {"text": "缓存测试", "language": "zh"}
+        assert live == ("缓存测试", None)
+        assert len(calls) == 1
+    asyncio.run(run())
@@ -0,0 +1,50 @@
+import json
+
+from api import codec
+from api.codec import SSEDeltaParser
+
+def event(content=None, **delta) -> bytes:
+    if content is not None:
+        delta["content"] = content
+    chunk = {"id": "x", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta}]}
+    return b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+def test_deltas_survive_arbitrary_chunk_boundaries():
+    stream = event(role="assistant") + event("你好") + event("，世界") + b"data: [DONE]\n\n"
+    for size in (1, 2, 3, 7, len(stream)):
+        parser = SSEDeltaParser()
+        deltas = []
+        for i in range(0, len(stream), size):
+            deltas.extend(parser.feed(stream[i:i + size]))
+        assert "".join(deltas) == "你好，世界"
+        assert parser.done and parser.errors == 0
+
+def test_escaped_content_falls_back_to_json():
+    parser = SSEDeltaParser()
+    text = 'say "hi"\n\\ 中'
+    assert parser.feed(event(text)) == [text]
+
+def test_ascii_escaped_unicode_is_decoded():
+    line = b'data: {"choices":[{"delta":{"content":"\\u4f60\\u597d"}}]}\r\n'
+    assert SSEDeltaParser().feed(line) == ["你好"]
+
+def test_skips_empty_null_and_non_data_lines():
+    parser = SSEDeltaParser()
+    null = b'data: {"choices":[{"delta":{"content":null}}]}\n'
+    stream = b": keep-alive\n" + event("") + null + b"event: ping\n" + event("a")
+    assert parser.feed(stream) == ["a"]
+
+def test_stops_at_done():
+    parser = SSEDeltaParser()
+    assert parser.feed(event("a") + b"data: [DONE]\n" + event("b")) == ["a"]
+    assert parser.feed(event("c")) == []
+
+def test_malformed_payload_is_counted_and_skipped():
+    parser = SSEDeltaParser()
+    stream = b'data: {"choices":[{"delta":{"content":"x\\"\n' + event("ok")
+    assert parser.feed(stream) == ["ok"]
+    assert parser.errors == 1
+
+def test_dumps_keeps_chinese_compact():
+    assert codec.dumps({"type": "text", "data": "你好"}) == '{"type":"text","data":"你好"}'
+    assert codec.loads(b'{"a":1}') == {"a": 1}
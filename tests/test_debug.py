@@ -0,0 +1,26 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import debug
+
+app = FastAPI()
+app.include_router(debug.router)
+client = TestClient(app)
+
+@pytest.mark.parametrize("enabled,token", [(False, "secret"), (True, "")])
+def test_hidden_unless_enabled_with_token(monkeypatch, enabled, token):
+    monkeypatch.setattr(debug.config, "debug_endpoints_enabled", enabled)
+    monkeypatch.setattr(debug.config, "debug_token", token)
+    assert client.get("/debug/loop-lag").status_code == 404
+    assert client.get("/debug/loop-lag", headers={"X-Debug-Token": ""}).status_code == 404
+
+def test_token_is_checked(monkeypatch):
+    monkeypatch.setattr(debug.config, "debug_endpoints_enabled", True)
+    monkeypatch.setattr(debug.config, "debug_token", "secret")
+    monkeypatch.setattr(debug, "loop_monitor", None)
+    assert client.get("/debug/loop-lag").status_code == 403
+    assert client.get("/debug/loop-lag", headers={"X-Debug-Token": "wrong"}).status_code == 403
+    # 令牌正确时进入接口本身（监控未启动返回404及说明）
+    response = client.get("/debug/loop-lag", headers={"X-Debug-Token": "secret"})
+    assert response.status_code == 404 and "监控未开启" in response.json()["detail"]
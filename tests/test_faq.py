@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from api import faq
+from api.faq import FAQEntry, FAQIndex, char_ngrams, load_entries
+
+ENTRIES = [
+    FAQEntry("营业时间是几点", "我们每天早上九点到晚上六点营业。", ["几点开门", "几点关门"]),
+    FAQEntry("怎么修改密码", "请在设置页面点击修改密码。", ["忘记密码怎么办"]),
+    FAQEntry("支持哪些支付方式", "支持微信、支付宝和银行卡。"),
+]
+
+@pytest.fixture
+def index(monkeypatch):
+    built = FAQIndex(ENTRIES)
+    monkeypatch.setattr(faq, "index", built)
+    monkeypatch.setattr(faq, "_stats", [0, 0])
+    return built
+
+def test_ngrams_ignore_punctuation_and_case():
+    assert char_ngrams("A，b!", 2) == ["a", "b", "ab"]
+
+def test_exact_and_punctuated_question_hits(index):
+    assert faq.lookup("营业时间是几点") is ENTRIES[0]
+    assert faq.lookup("营业时间是几点？") is ENTRIES[0]
+
+def test_alias_hits_its_entry(index):
+    assert faq.lookup("忘记密码怎么办") is ENTRIES[1]
+    assert faq.lookup("几点开门呢") is ENTRIES[0]
+
+def test_unrelated_query_misses(index):
+    assert faq.lookup("今天天气怎么样") is None
+
+def test_faq_inside_longer_question_misses(index):
+    # 长句中只有一部分是FAQ问法时交给LLM回答
+    assert faq.lookup("几点开门，另外你们的退货政策和运费是怎么计算的") is None
+    match = index.search("几点开门，另外你们的退货政策和运费是怎么计算的")
+    assert match.confidence == pytest.approx(1.0) and match.query_coverage < 0.5
+
+def test_lookup_without_index_returns_none(monkeypatch):
+    monkeypatch.setattr(faq, "index", None)
+    assert faq.lookup("营业时间是几点") is None
+
+def test_load_entries_accepts_json_and_jsonl(tmp_path):
+    items = [{"question": "Q1", "answer": "A1", "aliases": ["q1b", ""]}, {"question": "", "answer": "缺问题"}]
+    array = tmp_path / "faq.json"
+    array.write_text(json.dumps(items, ensure_ascii=False), encoding="utf-8")
+    lines = tmp_path / "faq.jsonl"
+    lines.write_text("\n".join(json.dumps(i, ensure_ascii=False) for i in items) + "\n", encoding="utf-8")
+    for path in (array, lines):
+        entries = load_entries(str(path))
+        assert [(e.question, e.answer, e.aliases) for e in entries] == [("Q1", "A1", ["q1b"])]
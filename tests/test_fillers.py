@@ -0,0 +1,83 @@
+import array
+import asyncio
+import io
+import wave
+
+import pytest
+
+from api import fillers
+from api.fillers import FillerClip, FillerGate, TTFAPredictor
+
+class FakeSession:
+    def __init__(self):
+        self.sent = []
+
+    async def send_bytes(self, data: bytes) -> bool:
+        self.sent.append(data)
+        return True
+
+    async def send_json(self, payload: dict) -> bool:
+        self.sent.append(payload)
+        return True
+
+def make_clip(seconds: float = 1.0, sample_rate: int = 16000) -> FillerClip:
+    pcm = array.array("h", [1000] * int(seconds * sample_rate)).tobytes()
+    return FillerClip("好的", pcm, sample_rate, 1, 2)
+
+def test_frames_are_sample_aligned_and_cover_clip():
+    clip = make_clip(0.25)
+    frames = clip.frames(100)
+    assert [len(f) for f in frames] == [3200, 3200, 1600]
+    assert b"".join(frames) == clip.pcm
+
+def test_each_frame_is_a_playable_wav():
+    clip = make_clip(0.1)
+    with wave.open(io.BytesIO(clip.to_wav(clip.pcm)), "rb") as wf:
+        assert (wf.getframerate(), wf.getnchannels(), wf.getnframes()) == (16000, 1, 1600)
+
+def test_fade_out_ends_silent():
+    clip = make_clip(0.1)
+    tail = array.array("h", clip.fade_out(clip.pcm, 20))
+    assert len(tail) == 320 and tail[0] > tail[-1] == 0
+
+def test_predictor_moves_toward_observations():
+    predictor = TTFAPredictor(initial=1.0, alpha=0.5)
+    predictor.observe(0.2)
+    assert predictor.predict() == pytest.approx(0.6)
+
+@pytest.fixture
+def one_clip(monkeypatch):
+    monkeypatch.setattr(fillers.config, "filler_enabled", True)
+    monkeypatch.setattr(fillers.config, "filler_threshold", 0.5)
+    monkeypatch.setattr(fillers.config, "filler_frame_ms", 100)
+    monkeypatch.setattr(fillers, "clips", [make_clip(1.0)])
+    monkeypatch.setattr(fillers, "predictor", TTFAPredictor(initial=1.0))
+
+def test_filler_is_trimmed_when_real_audio_arrives(one_clip):
+    async def run():
+        session = FakeSession()
+        gate = FillerGate(session)
+        assert gate.maybe_play()
+        await asyncio.sleep(0.05)
+        await gate.open()
+        return session.sent
+
+    sent = asyncio.run(run())
+    audio = [f for f in sent if isinstance(f, bytes)]
+    # 提前量为两帧，裁剪后补一段淡出，远少于完整的10帧
+    assert 2 <= len(audio) <= 4
+    assert all(f.startswith(b"RIFF") for f in audio)
+    assert sent[-1] == {"type": "filler_end", "trimmed": True}
+
+def test_no_filler_when_predicted_latency_is_low(one_clip, monkeypatch):
+    monkeypatch.setattr(fillers, "predictor", TTFAPredictor(initial=0.1))
+
+    async def run():
+        session = FakeSession()
+        gate = FillerGate(session)
+        assert not gate.maybe_play()
+        await gate.open()
+        await gate.close()
+        return session.sent
+
+    assert asyncio.run(run()) == []
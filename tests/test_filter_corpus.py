@@ -0,0 +1,75 @@
+import json
+import os
+import random
+import subprocess
+import sys
+
+import filter_corpus as cli
+from filter_corpus import filter_corpus, plan_chunks
+from match_keywords import keyword_pattern, partition_sentences
+
+SENTENCES = [
+    "十千伏线路的巡检周期一般为每月一次，",
+    "变压器油温过高时需要检查冷却系统。",
+    "据说老人们会去庙里拜佛祈福！",
+    "The load is about 80% of rated capacity.",
+    "愿上天保佑一切顺利？",
+    "配电室的温度需要保持在规定范围内\n",
+    "神经网络模型可以辅助识别绝缘子缺陷。",
+]
+
+def write_corpus(path, sentences: int, seed: int = 3) -> str:
+    rng = random.Random(seed)
+    text = "".join(rng.choice(SENTENCES) for _ in range(sentences))
+    path.write_text(text, encoding="utf-8")
+    return text
+
+def read_lines(path) -> list:
+    return path.read_text(encoding="utf-8").splitlines()
+
+def test_chunks_cover_file_and_end_on_sentence_boundaries(tmp_path):
+    corpus = tmp_path / "corpus.txt"
+    write_corpus(corpus, 200)
+    data = corpus.read_bytes()
+    chunks = list(plan_chunks(str(corpus), 100))
+    assert len(chunks) > 10
+    assert chunks[0][1] == 0 and chunks[-1][2] == len(data)
+    for (_, _, end), (_, start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+        # 切在句子结束符之后，不会切断多字节字符
+        assert data[:end].decode("utf-8")[-1] in "。？！.,\n"
+
+def test_parallel_output_matches_single_pass(tmp_path):
+    corpus = [tmp_path / "a.txt", tmp_path / "b.txt"]
+    texts = [write_corpus(corpus[0], 300, seed=1), write_corpus(corpus[1], 150, seed=2)]
+    kept, dropped = tmp_path / "kept.txt", tmp_path / "dropped.txt"
+    stats = filter_corpus([str(p) for p in corpus], str(kept), str(dropped), workers=2, chunk_size=256)
+
+    expected_kept, expected_dropped = [], []
+    for text in texts:
+        k, d = partition_sentences(text)
+        expected_kept += k
+        expected_dropped += [f"{keyword}\t{s}" for s, keyword in d]
+    # 多进程分块处理后仍按输入顺序输出，与整体处理结果一致
+    assert read_lines(kept) == expected_kept
+    assert read_lines(dropped) == expected_dropped
+    assert stats["bytes"] == sum(p.stat().st_size for p in corpus)
+    assert (stats["kept"], stats["dropped"]) == (len(expected_kept), len(expected_dropped))
+    assert sum(stats["keyword_hits"].values()) == len(expected_dropped)
+
+def test_cli_with_custom_keywords(tmp_path):
+    corpus = tmp_path / "corpus.txt"
+    text = write_corpus(corpus, 50)
+    keywords = tmp_path / "keywords.txt"
+    keywords.write_text("# 设备类\n变压器\n\n绝缘子\n", encoding="utf-8")
+    kept, dropped = tmp_path / "kept.txt", tmp_path / "dropped.txt"
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(cli.__file__), str(corpus), "--kept", str(kept), "--dropped", str(dropped),
+         "--keywords", str(keywords), "--workers", "2", "--quiet"],
+        capture_output=True, text=True, check=True
+    )
+    stats = json.loads(result.stdout)
+    _, expected = partition_sentences(text, keyword_pattern(["变压器", "绝缘子"]))
+    assert stats["dropped"] == len(expected) > 0
+    assert set(stats["keyword_hits"]) <= {"变压器", "绝缘子"}
+    assert read_lines(dropped) == [f"{keyword}\t{s}" for s, keyword in expected]
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import os
+
+import httpx
+
+from api import jobs, llm_jobs, tts_jobs
+
+def use_jobs_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs.config, "jobs_dir", str(tmp_path))
+    monkeypatch.setattr(jobs.config, "tts_job_retries", 1)
+
+def use_tts_upstream(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(tts_jobs, "get_http_client", lambda: client)
+    return client
+
+async def run_job(manager: jobs.JobManager, job: jobs.Job):
+    manager.start(job)
+    await asyncio.wait_for(manager._tasks[job.job_id], 5)
+
+async def create_tts_job(manager: jobs.JobManager, texts):
+    items = tts_jobs._normalize_items([{"text": t} for t in texts], "tts-1", None)
+    job = await manager.create(tts_jobs.JOB_KIND, len(items))
+    jobs.write_jsonl(job.path("input.jsonl"), items)
+    return job
+
+def test_job_with_every_item_failed_is_marked_failed(monkeypatch, tmp_path):
+    use_jobs_dir(monkeypatch, tmp_path)
+    client = use_tts_upstream(monkeypatch, lambda request: httpx.Response(503, content=b"down"))
+
+    async def run():
+        manager = jobs.JobManager()
+        manager.register(tts_jobs.JOB_KIND, tts_jobs.run_tts_job)
+        job = await create_tts_job(manager, ["一", "二"])
+        await run_job(manager, job)
+        await client.aclose()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == jobs.FAILED
+    assert (job.done, job.failed) == (0, 2)
+    assert job.error
+
+def test_job_with_some_items_failed_is_completed(monkeypatch, tmp_path):
+    use_jobs_dir(monkeypatch, tmp_path)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if json.loads(request.content)["input"] == "坏":
+            return httpx.Response(500)
+        return httpx.Response(200, content=b"RIFF-audio")
+    client = use_tts_upstream(monkeypatch, handler)
+
+    async def run():
+        manager = jobs.JobManager()
+        manager.register(tts_jobs.JOB_KIND, tts_jobs.run_tts_job)
+        job = await create_tts_job(manager, ["好", "坏"])
+        await run_job(manager, job)
+        await client.aclose()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == jobs.COMPLETED
+    assert (job.done, job.failed) == (1, 1)
+
+def test_resume_continues_from_checkpoint(monkeypatch, tmp_path):
+    use_jobs_dir(monkeypatch, tmp_path)
+    synthesized = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        synthesized.append(json.loads(request.content)["input"])
+        return httpx.Response(200, content=b"RIFF-audio")
+    client = use_tts_upstream(monkeypatch, handler)
+
+    async def prepare():
+        # 模拟服务在处理中途退出：第一条已写出，状态仍为 running
+        job = await create_tts_job(jobs.JobManager(), ["一", "二", "三"])
+        os.makedirs(job.path("audio"))
+        with open(job.path("audio", "00000.wav"), "wb") as f:
+            f.write(b"RIFF-audio")
+        job.status = jobs.RUNNING
+        await job.save()
+        return job.job_id
+
+    async def restart(job_id: str):
+        manager = jobs.JobManager()
+        manager.register(tts_jobs.JOB_KIND, tts_jobs.run_tts_job)
+        await manager.resume()
+        job = manager.get(job_id)
+        await asyncio.wait_for(manager._tasks[job_id], 5)
+        await client.aclose()
+        return job
+
+    job = asyncio.run(restart(asyncio.run(prepare())))
+    assert job.status == jobs.COMPLETED
+    assert (job.done, job.failed) == (3, 0)
+    # 已完成的条目不会重新合成
+    assert sorted(synthesized) == sorted(["二", "三"])
+    assert sorted(os.listdir(job.path("audio"))) == ["00000.wav", "00001.wav", "00002.wav"]
+
+def use_llm_upstream(monkeypatch, handler):
+    from api import llm
+    original = httpx.AsyncClient
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(llm.httpx, "AsyncClient", lambda **kwargs: original(transport=transport, **kwargs))
+
+async def create_chat_job(manager: jobs.JobManager, prompts, **params):
+    items = llm_jobs._normalize_items([{"prompt": p} for p in prompts], "gpt-4o-ca", None)
+    job = await manager.create(llm_jobs.JOB_KIND, len(items), {"rpm": 0, "tpm": 0, **params})
+    jobs.write_jsonl(job.path("input.jsonl"), items)
+    return job
+
+def chat_response(prompt: str) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": prompt}}], "usage": {"total_tokens": 1}})
+
+def test_identical_chat_items_are_not_coalesced(monkeypatch, tmp_path):
+    use_jobs_dir(monkeypatch, tmp_path)
+    monkeypatch.setattr(jobs.config, "singleflight_enabled", True)
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return chat_response("ok")
+    use_llm_upstream(monkeypatch, handler)
+
+    async def run():
+        manager = jobs.JobManager()
+        manager.register(llm_jobs.JOB_KIND, llm_jobs.run_chat_job)
+        job = await create_chat_job(manager, ["同一个问题"] * 3, concurrency=3)
+        await run_job(manager, job)
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == jobs.COMPLETED and job.done == 3
+    # 每个条目单独请求上游，各自计入用量和限速
+    assert len(calls) == 3
+
+def test_chat_resume_retries_failed_items(monkeypatch, tmp_path):
+    use_jobs_dir(monkeypatch, tmp_path)
+    monkeypatch.setattr(jobs.config, "llm_job_retries", 1)
+    requested = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        requested.append(prompt)
+        return chat_response(prompt)
+    use_llm_upstream(monkeypatch, handler)
+
+    async def run():
+        manager = jobs.JobManager()
+        manager.register(llm_jobs.JOB_KIND, llm_jobs.run_chat_job)
+        job = await create_chat_job(manager, ["一", "二", "三"])
+        # 上次执行：第一条成功，第二条失败，第三条写了一半时进程退出
+        with open(job.path("output.jsonl"), "w", encoding="utf-8") as f:
+            f.write(json.dumps({"index": 0, "custom_id": "0", "response": {}}) + "\n")
+            f.write(json.dumps({"index": 1, "custom_id": "1", "error": "LLM请求超时"}) + "\n")
+            f.write('{"index": 2, "cus')
+        await run_job(manager, job)
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == jobs.COMPLETED
+    assert (job.done, job.failed) == (3, 0)
+    assert sorted(requested) == ["三", "二"]
+    records = jobs.load_jsonl(job.path("output.jsonl"))
+    assert sorted(r["index"] for r in records) == [0, 1, 2]
+    assert not any("error" in r for r in records)
@@ -0,0 +1,70 @@
+import random
+
+from api.content_filter import SegmentGate
+from api.keywords import KeywordAutomaton, StreamMatcher, load_keywords
+
+def naive_hits(text, keywords):
+    return sorted((i + len(k), k) for k in keywords for i in range(len(text)) if text.startswith(k, i))
+
+def test_overlapping_and_nested_keywords():
+    automaton = KeywordAutomaton(["he", "she", "his", "hers"])
+    _, hits = automaton.scan("ushers")
+    assert sorted(hits) == [(4, "he"), (4, "she"), (6, "hers")]
+
+def test_scan_matches_naive_search():
+    rng = random.Random(7)
+    keywords = ["上天", "天神", "神", "灵魂", "魂灵", "天天"]
+    automaton = KeywordAutomaton(keywords)
+    for _ in range(200):
+        text = "".join(rng.choice("上天神灵魂你好") for _ in range(rng.randint(0, 30)))
+        assert sorted(automaton.scan(text)[1]) == naive_hits(text, keywords)
+
+def test_search_returns_first_occurrence():
+    automaton = KeywordAutomaton(["佛", "上天"])
+    assert automaton.search("愿上天保佑，佛") == "上天"
+    assert automaton.search("今天天气不错") is None
+    assert len(KeywordAutomaton(["a", "a", ""])) == 1
+
+def test_stream_matcher_hits_across_chunks():
+    matcher = StreamMatcher(KeywordAutomaton(["上天保佑"]))
+    assert matcher.feed("希望上") == []
+    assert matcher.feed("天保") == []
+    assert matcher.feed("佑你") == [(6, "上天保佑")]
+
+def test_segment_gate_blocks_only_overlapping_segments():
+    gate = SegmentGate(KeywordAutomaton(["上天"]))
+    text = "今天很好。愿上天保佑。明天见。"
+    for ch in text:
+        gate.feed(ch)
+    first = text.index("。") + 1
+    second = text.index("。", first) + 1
+    assert gate.check(0, first) is None
+    assert gate.check(first, second) == "上天"
+    assert gate.check(second, len(text)) is None
+
+def test_segment_gate_keyword_spanning_segment_boundary():
+    # 与实时链路相同：每个增量先 feed，再检查已切出且 settled 的分段
+    gate = SegmentGate(KeywordAutomaton(["上天保佑", "佛"]))
+    gate.feed("好的，上")
+    # 强制切分在 "上" 之后：末尾字符还可能与后续文本组成关键词，暂不检查
+    assert not gate.settled(4)
+    gate.feed("天")
+    assert not gate.settled(4)
+    gate.feed("保")
+    assert not gate.settled(4)
+    gate.feed("佑。")
+    assert gate.settled(4)
+    # 关键词跨越两个分段时，两个分段都被拦截
+    assert gate.check(0, 4) == "上天保佑"
+    assert gate.check(4, 8) == "上天保佑"
+
+def test_segment_gate_without_keywords_never_holds_back():
+    gate = SegmentGate(KeywordAutomaton([]))
+    gate.feed("你好")
+    assert gate.settled(2)
+    assert gate.check(0, 2) is None
+
+def test_load_keywords_skips_comments_and_blanks(tmp_path):
+    path = tmp_path / "kw.txt"
+    path.write_text("# 注释\n神\n\n  上天  \n", encoding="utf-8")
+    assert load_keywords(str(path)) == ["神", "上天"]
@@ -0,0 +1,67 @@
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import llm, tracing
+
+# 上游分块故意切在行中间和多字节字符中间，原样转发时客户端拿到的字节应完全一致
+UPSTREAM_BODY = (
+    'data: {"choices":[{"delta":{"content":"变压器"}}]}\n\n'
+    ': keep-alive\n\n'
+    'data: {"choices":[{"delta":{"content":"温度"}}]}\n\n'
+    'data: [DONE]\n\n'
+).encode("utf-8")
+UPSTREAM_CHUNKS = [UPSTREAM_BODY[:7], UPSTREAM_BODY[7:45], UPSTREAM_BODY[45:46], UPSTREAM_BODY[46:]]
+
+class ChunkStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: list):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def aclose(self):
+        self.closed = True
+
+@pytest.fixture
+def upstream(monkeypatch):
+    monkeypatch.setattr(tracing._writer, "submit", lambda record: None)
+    state = {"requests": [], "streams": [], "status": 200}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(json.loads(request.content))
+        if state["status"] != 200:
+            return httpx.Response(state["status"], json={"error": {"message": "bad request"}})
+        stream = ChunkStream(UPSTREAM_CHUNKS)
+        state["streams"].append(stream)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+
+    monkeypatch.setattr(llm, "get_http_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    app = FastAPI()
+    app.include_router(llm.router)
+    state["client"] = TestClient(app)
+    return state
+
+@pytest.mark.parametrize("path, body", [
+    ("/chat/completions", {"messages": [{"role": "user", "content": "你好"}], "stream": True}),
+    ("/completions", {"prompt": "你好", "stream": True}),
+])
+def test_stream_relays_upstream_bytes_unchanged(upstream, path, body):
+    response = upstream["client"].post(path, json=body)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.content == UPSTREAM_BODY
+    assert upstream["requests"][0]["stream"] is True
+    assert upstream["streams"][0].closed
+
+def test_upstream_error_before_first_byte_keeps_status(upstream):
+    upstream["status"] = 400
+    response = upstream["client"].post("/chat/completions", json={"messages": [{"role": "user", "content": "你好"}], "stream": True})
+    assert response.status_code == 400
+    # 请求本身的错误不重试
+    assert len(upstream["requests"]) == 1
@@ -0,0 +1,58 @@
+import json
+import logging
+import sys
+
+from api import logging_setup
+from api.logging_setup import JsonFormatter, RateLimitFilter, TextFormatter
+
+def record(level=logging.INFO, lineno=10, msg="消息 %s", args=(1,)) -> logging.LogRecord:
+    return logging.LogRecord("test", level, "/app/x.py", lineno, msg, args, None)
+
+def test_burst_then_suppressed_count_on_next_record(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(logging_setup.time, "monotonic", lambda: now[0])
+    limiter = RateLimitFilter(rate=1, burst=3)
+    assert [limiter.filter(record()) for _ in range(5)] == [True, True, True, False, False]
+    now[0] += 1.0
+    passed = record()
+    assert limiter.filter(passed)
+    assert passed.suppressed == 2
+    assert not limiter.filter(record())
+
+def test_call_sites_are_limited_separately():
+    limiter = RateLimitFilter(rate=0.001, burst=1)
+    assert limiter.filter(record(lineno=1))
+    assert not limiter.filter(record(lineno=1))
+    assert limiter.filter(record(lineno=2))
+
+def test_errors_and_zero_rate_are_never_limited():
+    limiter = RateLimitFilter(rate=0.001, burst=1)
+    assert all(limiter.filter(record(logging.ERROR)) for _ in range(10))
+    unlimited = RateLimitFilter(rate=0, burst=1)
+    assert all(unlimited.filter(record()) for _ in range(10))
+
+def test_formatters_include_suppressed_count():
+    rec = record()
+    rec.suppressed = 4
+    rec.trace_id = "abc"
+    entry = json.loads(JsonFormatter().format(rec))
+    assert entry["msg"] == "消息 1" and entry["suppressed"] == 4 and entry["trace_id"] == "abc"
+    assert TextFormatter().format(rec).endswith("消息 1 (已省略 4 条)")
+
+def test_queue_handler_interpolates_before_enqueue():
+    queued = []
+    handler = logging_setup._LoopQueueHandler(None)
+    handler.enqueue = queued.append
+    items = ["a"]
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        rec = logging.LogRecord("test", logging.ERROR, "/app/x.py", 10, "列表 %s", (items,), sys.exc_info())
+    handler.handle(rec)
+    # 入队后参数被修改，不影响已记录的消息
+    items.append("b")
+    (queued_record,) = queued
+    assert queued_record.msg == "列表 ['a']" and queued_record.args is None
+    entry = json.loads(JsonFormatter().format(queued_record))
+    assert entry["msg"] == "列表 ['a']"
+    assert "ValueError: boom" in entry["exc"]
@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _import_main(**env) -> dict:
+    """在独立进程中导入 api.main，返回启用的路由和已导入的模块"""
+    code = (
+        "import json, sys; import api.main as m; "
+        "print(json.dumps({'routers': m.enabled_routers, 'modules': sorted(k for k in sys.modules if k.startswith('api.'))}))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True,
+        env={**os.environ, "LOG_FILE": "", **env}
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_default_registers_only_production_routers():
+    loaded = _import_main()
+    assert loaded["routers"] == ["realtime", "tts", "tts_jobs", "transcription", "llm", "llm_jobs", "metrics"]
+    for module in ("api.debug", "api.mock_llm", "api.mock_audio"):
+        assert module not in loaded["modules"]
+
+def test_disabled_routers_are_not_imported():
+    loaded = _import_main(ENABLED_ROUTERS="tts")
+    assert loaded["routers"] == ["tts"]
+    for module in ("api.realtime", "api.fillers", "api.faq", "api.jobs", "api.asr_batcher", "api.debug"):
+        assert module not in loaded["modules"]
+
+def test_debug_endpoints_without_token_refuse_to_start():
+    result = subprocess.run(
+        [sys.executable, "-c", "import api.main"], cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "LOG_FILE": "", "ENABLED_ROUTERS": "debug", "DEBUG_ENDPOINTS_ENABLED": "true", "DEBUG_TOKEN": ""}
+    )
+    assert result.returncode != 0
+    assert "DEBUG_TOKEN" in result.stderr
+    assert _import_main(ENABLED_ROUTERS="debug", DEBUG_ENDPOINTS_ENABLED="true", DEBUG_TOKEN="t")["routers"] == ["debug"]
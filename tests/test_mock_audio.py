@@ -0,0 +1,74 @@
+import io
+import struct
+import wave
+
+import pytest
+from fastapi.testclient import TestClient
+
+from api import mock_audio
+from api.mock_audio import MOCK_TRANSCRIPTS, config
+from api.mock_server import app
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def fast_mock(monkeypatch):
+    for name in ("mock_asr_base_ms", "mock_asr_rtf", "mock_asr_batch_item_ms", "mock_tts_ttfb_ms", "mock_tts_rtf",
+                 "mock_asr_error_rate", "mock_tts_error_rate", "mock_abort_rate"):
+        monkeypatch.setattr(config, name, 0)
+
+def make_wav(seconds: float, fill: bytes = b"\x01\x00") -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(fill * int(16000 * seconds))
+    return buf.getvalue()
+
+def test_transcription_is_deterministic_and_reports_duration():
+    audio = make_wav(0.5)
+    results = [
+        client.post("/v1/audio/transcriptions", files={"file": ("a.wav", audio, "audio/wav")}).json()
+        for _ in range(2)
+    ]
+    assert results[0] == results[1]
+    assert results[0]["text"] in MOCK_TRANSCRIPTS
+    assert results[0]["duration"] == 0.5
+
+def test_batch_transcription_keeps_upload_order():
+    audios = [make_wav(0.1, bytes([i, 0])) for i in range(4)]
+    response = client.post(
+        "/v1/audio/transcriptions/batch",
+        files=[("files", (f"{i}.wav", a, "audio/wav")) for i, a in enumerate(audios)]
+    )
+    assert response.status_code == 200
+    texts = [r["text"] for r in response.json()["results"]]
+    assert texts == [mock_audio.mock_transcript(a) for a in audios]
+
+def test_speech_streams_wav_sized_by_text(monkeypatch):
+    monkeypatch.setattr(config, "mock_tts_char_ms", 100)
+    monkeypatch.setattr(config, "mock_tts_sample_rate", 16000)
+    response = client.post("/v1/audio/speech", json={"input": "你好世界"})
+    assert response.status_code == 200
+    body = response.content
+    # 四个字各100ms：文件头声明的数据长度与实际输出一致
+    data_size = struct.unpack("<I", body[40:44])[0]
+    assert data_size == len(body) - 44 == int(0.4 * 16000) * 2
+    with wave.open(io.BytesIO(body), "rb") as wf:
+        assert (wf.getnchannels(), wf.getframerate(), wf.getsampwidth()) == (1, 16000, 2)
+
+def test_speech_pcm_format_has_no_header(monkeypatch):
+    monkeypatch.setattr(config, "mock_tts_char_ms", 100)
+    monkeypatch.setattr(config, "mock_tts_sample_rate", 16000)
+    response = client.post("/v1/audio/speech", json={"input": "你好", "response_format": "pcm"})
+    assert not response.content.startswith(b"RIFF")
+    assert len(response.content) == int(0.2 * 16000) * 2
+
+def test_injected_errors_use_configured_status(monkeypatch):
+    monkeypatch.setattr(config, "mock_tts_error_rate", 1.0)
+    monkeypatch.setattr(config, "mock_asr_error_rate", 1.0)
+    monkeypatch.setattr(config, "mock_error_status", 503)
+    assert client.post("/v1/audio/speech", json={"input": "你好"}).status_code == 503
+    audio = make_wav(0.1)
+    assert client.post("/v1/audio/transcriptions", files={"file": ("a.wav", audio, "audio/wav")}).status_code == 503
@@ -0,0 +1,41 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import mock_llm
+from api.mock_llm import LatencyDistribution
+
+app = FastAPI()
+app.include_router(mock_llm.router)
+client = TestClient(app)
+
+@pytest.mark.parametrize("spec", ["gamma:300", "fixed:abc", "normal:30:x", "fixed:-5", "uniform:300:100:1", "lognormal:nan:0.5"])
+def test_invalid_distribution_is_rejected(spec):
+    with pytest.raises(ValueError):
+        LatencyDistribution(spec)
+
+def test_distribution_samples_are_non_negative():
+    dist = LatencyDistribution("normal:1:50")
+    assert all(dist.sample() >= 0 for _ in range(100))
+    assert LatencyDistribution("fixed:250").sample() == 0.25
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_bad_spec_returns_400_before_streaming(stream):
+    body = {
+        "messages": [{"role": "user", "content": "你好"}],
+        "stream": stream,
+        "mock": {"itl": "normal:30:oops", "error_rate": 0, "timeout_rate": 0},
+    }
+    response = client.post("/mock/chat/completions", json=body)
+    assert response.status_code == 400
+    assert "oops" in response.json()["error"]["message"]
+
+def test_valid_spec_streams_to_done():
+    body = {
+        "messages": [{"role": "user", "content": "你好"}],
+        "stream": True,
+        "mock": {"ttft": "fixed:0", "itl": "fixed:0", "error_rate": 0, "timeout_rate": 0, "abort_rate": 0},
+    }
+    response = client.post("/mock/chat/completions", json=body)
+    assert response.status_code == 200
+    assert response.text.endswith("data: [DONE]\n\n")
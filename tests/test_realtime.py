@@ -0,0 +1,173 @@
+import asyncio
+import json
+import struct
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import content_filter, faq, realtime, tracing
+from api.keywords import KeywordAutomaton
+from api.sessions import registry
+
+def wav_header(sample_rate: int = 24000) -> bytes:
+    """流式WAV文件头（数据长度未知）"""
+    fmt = struct.pack("<HHIIHH", 1, 1, sample_rate, sample_rate * 2, 2, 16)
+    return b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE" + b"fmt " + struct.pack("<I", 16) + fmt + b"data" + struct.pack("<I", 0xFFFFFFFF)
+
+def sse(text: str) -> bytes:
+    return b"data: " + json.dumps({"choices": [{"delta": {"content": text}}]}, ensure_ascii=False).encode("utf-8") + b"\n\n"
+
+class SlowStream(httpx.AsyncByteStream):
+    """先返回 head，之后每隔 interval 秒返回一块 tail，直到被关闭"""
+
+    def __init__(self, head: list, tail: bytes, interval: float):
+        self.head = head
+        self.tail = tail
+        self.interval = interval
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.head:
+            yield chunk
+        while True:
+            await asyncio.sleep(self.interval)
+            yield self.tail
+
+    async def aclose(self):
+        self.closed = True
+
+class FakeUpstreams:
+    """LLM和TTS上游：LLM先输出一句话后持续缓慢输出，TTS持续输出音频"""
+
+    def __init__(self, llm_head: list, llm_tail: bytes = b": keep-alive\n\n", llm_interval: float = 0.05):
+        self.llm_head = llm_head
+        self.llm_tail = llm_tail
+        self.llm_interval = llm_interval
+        self.llm = []
+        self.llm_requests = []
+        self.tts = []
+        self.asr = 0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        url = str(request.url)
+        if url == realtime.config.llm_url:
+            self.llm_requests.append(json.loads(request.content))
+            stream = SlowStream(self.llm_head, self.llm_tail, self.llm_interval)
+            self.llm.append(stream)
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=stream)
+        if url == realtime.config.tts_url:
+            stream = SlowStream([wav_header()], b"\x01\x00" * 2400, 0.01)
+            self.tts.append(stream)
+            return httpx.Response(200, headers={"content-type": "audio/wav"}, stream=stream)
+        self.asr += 1
+        return httpx.Response(200, json={"text": "不应调用"})
+
+@pytest.fixture
+def quiet(monkeypatch):
+    """不写span日志、不命中FAQ"""
+    monkeypatch.setattr(tracing._writer, "submit", lambda record: None)
+    monkeypatch.setattr(faq, "index", None)
+
+def make_client(monkeypatch, upstreams: FakeUpstreams) -> TestClient:
+    monkeypatch.setattr(realtime, "get_http_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(upstreams.handler)))
+    app = FastAPI()
+    app.include_router(realtime.router)
+    return TestClient(app)
+
+def receive_until(ws, predicate, limit: int = 500):
+    """接收帧直到满足条件，返回期间收到的所有帧"""
+    frames = []
+    for _ in range(limit):
+        message = ws.receive()
+        frame = json.loads(message["text"]) if message.get("text") is not None else message.get("bytes")
+        frames.append(frame)
+        if predicate(frame):
+            return frames
+    raise AssertionError("未收到预期的帧")
+
+def test_interrupt_cancels_turn_and_closes_upstreams(monkeypatch, quiet):
+    upstreams = FakeUpstreams([sse("你好，这是被打断的回答。")])
+    client = make_client(monkeypatch, upstreams)
+    with client.websocket_connect("/ws/realtime") as ws:
+        session_id = receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "session")[-1]["session_id"]
+        ws.send_json({"type": "text", "text": "讲个故事"})
+        receive_until(ws, lambda f: isinstance(f, bytes))
+        ws.send_json({"type": "interrupt"})
+        frames = receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "stop_playback")
+        assert frames[-1]["reason"] == "interrupt"
+        # stop_playback 之后不再有被打断回答的音频
+        ws.send_json({"type": "ping", "timestamp": 7})
+        assert ws.receive_json() == {"type": "ping", "timestamp": 7}
+
+        session = registry.get(session_id)
+        assert session.turn_task.cancelled()
+        assert upstreams.llm and all(s.closed for s in upstreams.llm)
+        assert upstreams.tts and all(s.closed for s in upstreams.tts)
+        # 重连时也不会重放被打断回答的音频
+        assert not any(isinstance(message, bytes) for _, message in session.frames)
+    registry.remove(session)
+
+def test_slow_trickle_is_cut_off_at_turn_deadline(monkeypatch, quiet):
+    monkeypatch.setattr(realtime.config, "turn_deadline_s", 0.5)
+    # LLM每50ms输出一个字，单次读取从不超时；TTS持续输出音频
+    upstreams = FakeUpstreams([sse("你好，这是第一句话。")], llm_tail=sse("慢"), llm_interval=0.05)
+    client = make_client(monkeypatch, upstreams)
+    with client.websocket_connect("/ws/realtime") as ws:
+        session_id = receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "session")[-1]["session_id"]
+        started = time.monotonic()
+        ws.send_json({"type": "text", "text": "讲个很长的故事"})
+        frames = receive_until(ws, lambda f: isinstance(f, dict) and f.get("error") == "LLM处理超时", limit=5000)
+        assert time.monotonic() - started < 2
+        assert any(isinstance(f, bytes) for f in frames)
+        ws.send_json({"type": "ping", "timestamp": 1})
+        receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "ping", limit=5000)
+
+        session = registry.get(session_id)
+        assert session.turn_task.done()
+        assert upstreams.llm and all(s.closed for s in upstreams.llm)
+        assert upstreams.tts and all(s.closed for s in upstreams.tts)
+    registry.remove(session)
+
+def test_keyword_split_by_forced_cut_blocks_both_segments(monkeypatch, quiet):
+    monkeypatch.setattr(realtime.config, "max_segment_len", 5)
+    monkeypatch.setattr(content_filter.config, "content_filter_enabled", True)
+    monkeypatch.setattr(content_filter, "current_automaton", lambda: KeywordAutomaton(["上天"]))
+    # 第一段在 "上" 之后被强制切分，关键词的后半部分下一个增量才到达
+    upstreams = FakeUpstreams([sse("一二三四上"), sse("天五六七八。"), sse("好的再见。"), b"data: [DONE]\n\n"])
+    client = make_client(monkeypatch, upstreams)
+    with client.websocket_connect("/ws/realtime") as ws:
+        session_id = receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "session")[-1]["session_id"]
+        ws.send_json({"type": "text", "text": "数数"})
+        frames = receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "llm")
+        assert frames[-1]["text"] == "好的再见。"
+        ws.send_json({"type": "interrupt"})
+        receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "stop_playback")
+    session = registry.get(session_id)
+    assert [m for _, m in session.frames if isinstance(m, str) and '"llm"' in m and "上" in m] == []
+    registry.remove(session)
+
+def test_text_turn_skips_asr(monkeypatch, quiet):
+    monkeypatch.setattr(realtime.config, "text_input_max_chars", 20)
+    upstreams = FakeUpstreams([sse("好的，马上为您查询。"), b"data: [DONE]\n\n"])
+    client = make_client(monkeypatch, upstreams)
+    with client.websocket_connect("/ws/realtime") as ws:
+        session_id = receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "session")[-1]["session_id"]
+        ws.send_json({"type": "text", "text": "  "})
+        assert receive_until(ws, lambda f: isinstance(f, dict) and "error" in f)[-1]["code"] == "empty_text"
+        ws.send_json({"type": "text", "text": "长" * 21})
+        assert receive_until(ws, lambda f: isinstance(f, dict) and "error" in f)[-1]["code"] == "text_too_long"
+
+        ws.send_json({"type": "text", "text": "明天的会议安排"})
+        frames = receive_until(ws, lambda f: isinstance(f, bytes))
+        llm_frames = [f for f in frames if isinstance(f, dict) and f.get("type") == "llm"]
+        assert [f["text"] for f in llm_frames] == ["好的，马上为您查询。"]
+        # 文本输入不经过转录，也不回送转录结果
+        assert not any(isinstance(f, dict) and f.get("type") == "transcription" for f in frames)
+        assert upstreams.asr == 0
+        assert upstreams.llm_requests[0]["messages"][-1] == {"role": "user", "content": "明天的会议安排"}
+        ws.send_json({"type": "interrupt"})
+        receive_until(ws, lambda f: isinstance(f, dict) and f.get("type") == "stop_playback")
+    registry.remove(registry.get(session_id))
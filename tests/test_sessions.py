@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+from starlette.websockets import WebSocketState
+
+from api.sessions import RealtimeSession, parse_seq
+
+class FakeWebSocket:
+    def __init__(self):
+        self.client_state = WebSocketState.CONNECTED
+        self.sent = []
+
+    async def send_text(self, message: str):
+        self.sent.append(json.loads(message))
+
+    async def send_bytes(self, data: bytes):
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.client_state = WebSocketState.DISCONNECTED
+
+def test_parse_seq_accepts_non_negative_ints_only():
+    assert parse_seq(0) == 0
+    assert parse_seq(42) == 42
+    for bad in (None, -1, "3", 1.5, True, [], {}):
+        assert parse_seq(bad) is None
+
+def test_ack_releases_replay_buffer():
+    async def run():
+        session = RealtimeSession("s1")
+        for i in range(3):
+            await session.send_json({"type": "llm", "text": str(i)})
+        await session.send_bytes(b"\x00" * 10)
+        assert [seq for seq, _ in session.frames] == [1, 2, 3, 4]
+        used = session.budget.used
+        session.ack(2)
+        assert [seq for seq, _ in session.frames] == [3, 4]
+        assert session.budget.used < used
+        # 较旧的确认不会回退
+        session.ack(1)
+        assert session.acked_seq == 2
+        session.close()
+    asyncio.run(run())
+
+def test_budget_charges_encoded_size_of_text_frames():
+    async def run():
+        session = RealtimeSession("s-utf8")
+        await session.send_json({"type": "llm", "text": "你好" * 100})
+        (_, message), = session.frames
+        # 中文按UTF-8编码后一字三字节计入预算
+        assert session.budget.used == len(message.encode("utf-8")) > len(message)
+        session.ack(1)
+        assert session.budget.used == 0
+        session.close()
+    asyncio.run(run())
+
+def test_reattach_replays_frames_after_last_seq():
+    async def run():
+        session = RealtimeSession("s2")
+        # 断开期间生成的帧只进入重放缓冲区
+        for i in range(4):
+            await session.send_json({"type": "llm", "text": str(i)})
+        ws = FakeWebSocket()
+        replayed = await session.attach(ws, last_seq=2)
+        assert replayed == 2
+        await asyncio.sleep(0.01)
+        hello, *frames = ws.sent
+        assert hello["type"] == "session" and hello["resumed"] and hello["last_seq"] == 4
+        assert [f["seq"] for f in frames] == [3, 4]
+        assert session.acked_seq == 2
+        session.close()
+    asyncio.run(run())
+
+def test_ack_beyond_last_seq_does_not_drop_future_frames():
+    async def run():
+        session = RealtimeSession("s3")
+        await session.send_json({"type": "llm", "text": "a"})
+        session.ack(100)
+        assert session.acked_seq == 1
+        await session.send_json({"type": "llm", "text": "b"})
+        session.ack(1)
+        assert [seq for seq, _ in session.frames] == [2]
+        session.close()
+    asyncio.run(run())
+
+def test_reattach_with_gap_replays_what_is_left(monkeypatch):
+    from api import sessions
+    monkeypatch.setattr(sessions.config, "session_replay_frames", 3)
+
+    async def run():
+        session = RealtimeSession("s4")
+        for i in range(6):
+            await session.send_json({"type": "llm", "text": str(i)})
+        # 只保留了最后3帧，客户端从1开始恢复时补发剩余的帧
+        ws = FakeWebSocket()
+        assert await session.attach(ws, last_seq=1) == 3
+        await asyncio.sleep(0.01)
+        assert [f["seq"] for f in ws.sent[1:]] == [4, 5, 6]
+        session.close()
+    asyncio.run(run())
+
+def test_new_connection_replaces_old_one():
+    async def run():
+        session = RealtimeSession("s5")
+        old, new = FakeWebSocket(), FakeWebSocket()
+        await session.attach(old)
+        await session.attach(new, last_seq=0)
+        assert old.client_state == WebSocketState.DISCONNECTED
+        await session.send_json({"type": "llm", "text": "x"})
+        await asyncio.sleep(0.01)
+        assert [f["type"] for f in new.sent] == ["session", "llm"]
+        assert not any(f.get("type") == "llm" for f in old.sent)
+        session.close()
+    asyncio.run(run())
+
+def test_websocket_reconnect_resumes_after_last_seq():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import realtime
+    from api.sessions import registry
+
+    app = FastAPI()
+    app.include_router(realtime.router)
+    client = TestClient(app)
+
+    with client.websocket_connect("/ws/realtime") as ws:
+        hello = ws.receive_json()
+        assert hello["type"] == "session" and not hello["resumed"]
+        session_id = hello["session_id"]
+        # 无效的ack只被忽略，连接保持
+        ws.send_json({"type": "ack", "seq": "x"})
+        ws.send_json({"type": "ping", "timestamp": 1})
+        assert ws.receive_json() == {"type": "ping", "timestamp": 1}
+
+    # 断开期间回答仍在生成，帧只进入重放缓冲区
+    session = registry.get(session_id)
+    for i in range(3):
+        asyncio.run(session.send_json({"type": "llm", "text": str(i)}))
+    with client.websocket_connect(f"/ws/realtime?session_id={session_id}&last_seq=1") as ws:
+        hello = ws.receive_json()
+        assert hello["resumed"] and hello["session_id"] == session_id
+        assert [ws.receive_json()["seq"] for _ in range(2)] == [2, 3]
+    registry.remove(session)
+
+def test_interrupt_purges_unsent_audio_of_the_turn():
+    async def run():
+        session = RealtimeSession("s6")
+        ws = FakeWebSocket()
+        gate = asyncio.Event()
+        plain_send = ws.send_bytes
+
+        async def blocking_send(data: bytes):
+            await gate.wait()
+            await plain_send(data)
+
+        ws.send_bytes = blocking_send
+        await session.attach(ws)
+        await session.send_bytes(b"old")  # 上一轮的音频，不受打断影响
+
+        async def turn():
+            await session.send_json({"type": "llm", "text": "回答"})
+            for i in range(3):
+                await session.send_bytes(bytes([i]) * 4)
+            await asyncio.sleep(10)
+
+        session.start_turn(turn())
+        await asyncio.sleep(0.01)
+        assert await session.interrupt()
+        gate.set()
+        await asyncio.sleep(0.01)
+        # 只有打断前已开始写入的一帧（上一轮的音频）会发出
+        assert [f for f in ws.sent if isinstance(f, bytes)] == [b"old"]
+        assert [f["type"] for f in ws.sent if isinstance(f, dict)] == ["session", "llm"]
+        assert [m for _, m in session.frames if isinstance(m, bytes)] == [b"old"]
+        session.close()
+    asyncio.run(run())
@@ -0,0 +1,173 @@
+import asyncio
+import io
+import wave
+
+import httpx
+
+from api import realtime, transcription
+from api.singleflight import SingleFlight, StreamFlight, config
+
+def make_wav(pcm: bytes) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+def test_concurrent_calls_share_one_upstream_call():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"text": "ok"}
+
+    async def run():
+        flight = SingleFlight("test")
+        results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(5)))
+        assert results == [{"text": "ok"}] * 5
+        assert len(calls) == 1
+        # 调用结束后相同key重新发起上游调用
+        await flight.do("k", upstream)
+        assert len(calls) == 2
+    asyncio.run(run())
+
+def test_cancelled_waiter_does_not_cancel_others():
+    async def run():
+        flight = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            return "done"
+
+        first = asyncio.create_task(flight.do("k", upstream))
+        second = asyncio.create_task(flight.do("k", upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == "done"
+        assert first.cancelled()
+    asyncio.run(run())
+
+def test_upstream_cancelled_when_all_waiters_leave():
+    async def run():
+        flight = SingleFlight("test")
+        cancelled = asyncio.Event()
+
+        async def upstream():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flight.do("k", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for w in waiters:
+            w.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        assert "k" not in flight._calls
+    asyncio.run(run())
+
+def test_stream_late_joiner_gets_replay():
+    async def run():
+        flight = StreamFlight("test")
+        step = asyncio.Event()
+        opened = []
+
+        async def upstream():
+            opened.append(1)
+            yield b"a"
+            await step.wait()
+            yield b"b"
+
+        async def collect(started: asyncio.Event = None):
+            out = []
+            async for chunk in flight.stream("k", upstream):
+                out.append(chunk)
+                if started is not None:
+                    started.set()
+            return out
+
+        first_chunk = asyncio.Event()
+        first = asyncio.create_task(collect(first_chunk))
+        await first_chunk.wait()
+        late = asyncio.create_task(collect())
+        await asyncio.sleep(0)
+        step.set()
+        assert await first == [b"a", b"b"]
+        assert await late == [b"a", b"b"]
+        assert len(opened) == 1
+    asyncio.run(run())
+
+def test_disabled_stream_closes_upstream_on_early_exit(monkeypatch):
+    monkeypatch.setattr(config, "singleflight_enabled", False)
+
+    async def run():
+        closed = []
+
+        async def upstream():
+            try:
+                for chunk in (b"a", b"b", b"c"):
+                    yield chunk
+            finally:
+                closed.append(1)
+
+        stream = StreamFlight("test").stream("k", upstream)
+        assert await stream.__anext__() == b"a"
+        await stream.aclose()
+        assert closed == [1]
+    asyncio.run(run())
+
+def test_realtime_and_rest_do_not_share_results(monkeypatch):
+    """同一段音频同时经实时链路和REST接口转录时，各自拿到自己的返回类型"""
+    monkeypatch.setattr(config, "singleflight_enabled", True)
+    audio = make_wav(b"\x05\x06" * 700)
+    requests = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"text": "测试", "language": "zh"})
+
+    transport = httpx.MockTransport(handler)
+    original = httpx.AsyncClient
+    monkeypatch.setattr(transcription.httpx, "AsyncClient", lambda **kwargs: original(transport=transport, **kwargs))
+
+    async def run():
+        async with original(transport=transport) as client:
+            realtime_result, rest_result = await asyncio.gather(
+                realtime.transcribe_audio_with_retry(client, audio, 1),
+                transcription.transcribe_with_retry(audio, "a.wav", "audio/wav", max_retries=1),
+            )
+        assert realtime_result == ("测试", None)
+        assert rest_result == {"text": "测试", "language": "zh"}
+        assert len(requests) == 2
+    asyncio.run(run())
+
+def test_identical_tts_requests_share_one_upstream_call(monkeypatch):
+    from api import tts
+    monkeypatch.setattr(config, "singleflight_enabled", True)
+    bodies = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        bodies.append(request.content)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, content=b"RIFF-audio")
+
+    transport = httpx.MockTransport(handler)
+    original = httpx.AsyncClient
+    monkeypatch.setattr(tts.httpx, "AsyncClient", lambda **kwargs: original(transport=transport, **kwargs))
+
+    async def run():
+        same = [tts.TTSRequest(input="你好") for _ in range(3)]
+        other = tts.TTSRequest(input="你好", speed=1.5)
+        return await asyncio.gather(*(tts.tts_with_retry(r, 1) for r in [*same, other]))
+
+    assert asyncio.run(run()) == [b"RIFF-audio"] * 4
+    # 相同参数合并为一次上游调用，语速不同的请求单独调用
+    assert len(bodies) == 2
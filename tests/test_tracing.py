@@ -0,0 +1,50 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from api import tracing
+from api.main import trace_requests
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+    app.middleware("http")(trace_requests)
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                yield b"x" * 10
+        return StreamingResponse(body())
+
+    @app.get("/plain")
+    async def plain():
+        return {"ok": True}
+
+    return app
+
+def test_root_span_covers_streamed_body(monkeypatch):
+    spans = []
+    monkeypatch.setattr(tracing.config, "trace_enabled", True)
+    monkeypatch.setattr(tracing._writer, "submit", spans.append)
+    response = TestClient(make_app()).get("/stream")
+    assert response.content == b"x" * 30
+    (root,) = spans
+    assert root["traceId"] == response.headers["X-Trace-Id"]
+    duration_ms = (int(root["endTimeUnixNano"]) - int(root["startTimeUnixNano"])) / 1e6
+    headers_ms = (int(root["events"][0]["timeUnixNano"]) - int(root["startTimeUnixNano"])) / 1e6
+    # 响应头在第一块数据之前发出，根span持续到最后一块发送完毕
+    assert root["events"][0]["name"] == "response_headers"
+    assert headers_ms < 50
+    assert duration_ms >= 140
+    attributes = {a["key"]: a["value"] for a in root["attributes"]}
+    assert attributes["http.response_body_bytes"] == {"intValue": "30"}
+
+def test_plain_response_is_recorded_once(monkeypatch):
+    spans = []
+    monkeypatch.setattr(tracing.config, "trace_enabled", True)
+    monkeypatch.setattr(tracing._writer, "submit", spans.append)
+    assert TestClient(make_app()).get("/plain").json() == {"ok": True}
+    assert len(spans) == 1 and spans[0]["status"]["code"] == tracing.STATUS_OK
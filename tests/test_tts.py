@@ -0,0 +1,15 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from api import deadline, tts
+
+def test_stream_returns_504_when_deadline_is_spent():
+    async def run():
+        with deadline.scope(0):
+            await tts.tts_speech_stream(tts.TTSRequest(input="你好"))
+
+    with pytest.raises(HTTPException) as info:
+        asyncio.run(run())
+    assert info.value.status_code == 504
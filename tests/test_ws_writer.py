@@ -0,0 +1,61 @@
+import io
+import struct
+import wave
+
+import pytest
+
+from api.ws_writer import FrameCoalescer, pcm_wav_header, wav_layout
+
+PCM = bytes(range(256)) * 40  # 10240字节
+
+def stream_header(sample_rate: int = 16000) -> bytes:
+    """流式TTS的WAV文件头：长度字段未知（0xFFFFFFFF）"""
+    header = bytearray(pcm_wav_header(1, sample_rate, 2, 0))
+    struct.pack_into("<I", header, 4, 0xFFFFFFFF)
+    struct.pack_into("<I", header, 40, 0xFFFFFFFF)
+    return bytes(header)
+
+def decode(frame: bytes):
+    with wave.open(io.BytesIO(frame), "rb") as wf:
+        return wf.getframerate(), wf.getnchannels(), wf.readframes(wf.getnframes())
+
+def run(coalescer: FrameCoalescer, chunks) -> list:
+    frames = []
+    for chunk in chunks:
+        frames.extend(coalescer.feed(chunk))
+    rest = coalescer.flush()
+    return frames + ([rest] if rest else [])
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 4096])
+def test_every_frame_is_a_standalone_wav(chunk_size):
+    data = stream_header() + PCM
+    frames = run(FrameCoalescer(100, 48000), [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)])
+    # 16kHz/16bit 每100ms 3200字节
+    assert len(frames) == 4
+    decoded = [decode(f) for f in frames]
+    assert all(rate == 16000 and channels == 1 for rate, channels, _ in decoded)
+    assert [len(pcm) for _, _, pcm in decoded] == [3200, 3200, 3200, 640]
+    assert b"".join(pcm for _, _, pcm in decoded) == PCM
+
+def test_raw_pcm_uses_fallback_format():
+    frames = run(FrameCoalescer(100, 48000), [PCM])
+    rate, channels, pcm = decode(frames[0])
+    assert (rate, channels, len(pcm)) == (24000, 1, 4800)
+    assert b"".join(decode(f)[2] for f in frames) == PCM
+
+def test_extra_chunks_before_data_are_skipped():
+    header = stream_header()
+    listed = header[:36] + b"LIST" + struct.pack("<I", 4) + b"INFO" + header[36:]
+    frames = run(FrameCoalescer(100, 48000), [listed, PCM[:3200]])
+    assert [decode(f)[2] for f in frames] == [PCM[:3200]]
+
+def test_zero_frame_ms_passes_chunks_through():
+    chunks = [stream_header(), PCM[:10], PCM[10:20]]
+    assert run(FrameCoalescer(0, 48000), chunks) == chunks
+
+def test_wav_layout_waits_for_complete_header():
+    header = stream_header()
+    assert wav_layout(header[:3]) is None
+    assert wav_layout(header[:30]) is None
+    assert wav_layout(header) == (1, 16000, 2, 44)
+    assert wav_layout(b"ID3\x00 not a wav") == (0, 0, 0, 0)